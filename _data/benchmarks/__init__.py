@@ -0,0 +1,64 @@
+"""
+Benchmarks for the performance-sensitive parts of the spider and pipelines.
+
+Run them from the project directory, e.g. ``python -m benchmarks.mysql_pipelines --help``
+"""
+import random
+import typing
+
+from ebay_motors.items import EbayListingItem
+
+_MAKES = {
+    'Ford': ['Expedition', 'F-150', 'Mustang', 'Explorer'],
+    'Jeep': ['Wrangler', 'Grand Cherokee', 'Cherokee'],
+    'Chevrolet': ['Silverado 1500', 'Tahoe', 'Camaro'],
+    'Toyota': ['Tacoma', 'Camry', '4Runner'],
+}
+_BODY_TYPES = ['Sport Utility', 'Crew Cab Pickup', 'Sedan', 'Coupe', 'Convertible', 'Minivan', 'Not Specified']
+_DRIVE_TYPES = ['4WD', 'AWD', 'Front Wheel Drive', 'rear wheel', '2WD', '4x4', None]
+_MILEAGES = ['45000', '45,000 miles', '120', '12345678', '0', 'Not Specified', None, '98765.4']
+_TITLES = ['Clean', 'Rebuilt, Rebuildable & Reconstructed', 'Salvage', None]
+_DESCRIPTIONS = [
+    'Clean title, one owner, dealer maintained. Call our eBay Hotline to get approved today!',
+    'Rebuilt title. Runs and drives great. ★ Financing available ★',
+    None,
+]
+
+
+def synthetic_listings(count: int, seed: int = 0) -> typing.List[EbayListingItem]:
+    """Build `count` raw listings shaped like the output of `EbaySpider.parse_details()`."""
+    rand = random.Random(seed)
+    listings = []
+    for i in range(count):
+        make = rand.choice(list(_MAKES))
+        listings.append(EbayListingItem({
+            'source_id': str(300000000000 + i),
+            'name': f'{make} listing {i}',
+            'url': f'https://cgi.ebay.com/ebaymotors/{300000000000 + i}',
+            'price': f'{rand.randint(1000, 90000)}.0',
+            'city': 'Kernersville',
+            'state': 'NC',
+            'country': 'US',
+            'date_listed': '2019-11-05T13:45:25.314Z',
+            'favorited': str(rand.randint(0, 40)),
+            'bin_price': rand.choice([None, f'{rand.randint(1000, 90000)}.0']),
+            'page_views': str(rand.randint(0, 5000)),
+            'seller_type': rand.choice(['Dealer', 'Private Seller', 'Private Seller1951 chevy']),
+            'details': rand.choice(_DESCRIPTIONS),
+            'year': str(rand.randint(1960, 2020)),
+            'make': make,
+            'model': rand.choice(_MAKES[make]),
+            'submodel': rand.choice([None, 'Sport']),
+            'mileage': rand.choice(_MILEAGES),
+            'transmission': rand.choice(['automatic', 'Manual', None]),
+            'num_cylinders': rand.choice(['4', '6', '8', 'V8', None]),
+            'drive_type': rand.choice(_DRIVE_TYPES),
+            'body_type': rand.choice(_BODY_TYPES),
+            'fuel_type': rand.choice(['Gasoline', 'Diesel', 'Electric', None]),
+            'title_type': rand.choice(_TITLES),
+            'vin': f'1C4HJXDN4LW{i:06d}',
+            'trim': rand.choice([None, 'Unlimited Sport']),
+            'color': rand.choice(['Black', 'White', 'Not Specified']),
+            'num_doors': rand.choice(['2', '4', None]),
+        }))
+    return listings
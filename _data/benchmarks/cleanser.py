@@ -0,0 +1,58 @@
+"""
+Compare per-item and batch cleansing of listings.
+
+Both modes run over copies of the same synthetic listings and the results
+are checked to be identical before the throughput is reported::
+
+    python -m benchmarks.cleanser --items=10000
+"""
+import argparse
+import time
+import types
+
+from scrapy.settings import Settings
+
+from benchmarks import synthetic_listings
+from ebay_motors.pipelines import EbayListingCleanserPipeline
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--items', type=int, default=10000, help='Number of listings (default: 10000)')
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help='Listings per batch, e.g. 20 for one detail response (default: 10000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Best of this many runs (default: 3)')
+    return parser.parse_args()
+
+
+def main(args):
+    spider = types.SimpleNamespace(settings=Settings({'EBAY_CLEANSER_MODE': 'item'}))
+    cleanser = EbayListingCleanserPipeline()
+    listings = synthetic_listings(args.items)
+
+    per_item, batched = [], []
+    item_time = batch_time = float('inf')
+    for _ in range(args.repeat):
+        items = [listing.copy() for listing in listings]
+        start = time.perf_counter()
+        per_item = [cleanser.process_item(item, spider) for item in items]
+        item_time = min(item_time, time.perf_counter() - start)
+
+        items = [listing.copy() for listing in listings]
+        start = time.perf_counter()
+        batched = []
+        for i in range(0, len(items), args.batch_size):
+            batched.extend(cleanser.process_batch(items[i:i + args.batch_size], spider))
+        batch_time = min(batch_time, time.perf_counter() - start)
+
+    mismatches = [(a, b) for a, b in zip(per_item, batched) if dict(a) != dict(b)]
+    if mismatches:
+        raise SystemExit(f'{len(mismatches)} batch results differ from per-item results, e.g.\n'
+                         f'{dict(mismatches[0][0])}\n{dict(mismatches[0][1])}')
+    print(f'per-item: {len(listings) / item_time:10.1f} items/s ({item_time:.3f}s)\n'
+          f'batch:    {len(listings) / batch_time:10.1f} items/s ({batch_time:.3f}s)\n'
+          f'All {len(listings)} results identical.')
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,71 @@
+"""
+Compare the XML and JSON detail response modes.
+
+Runs `EbaySpider.parse_details()` over the XML and JSON detail fixtures with
+the search fixture summaries, checks that both encodings produce the same
+`EbayListingItem`s (raw and cleansed), and reports the parsing throughput::
+
+    python -m benchmarks.details_decoding --fixture=test1
+"""
+import argparse
+import json
+import pathlib
+import time
+
+from scrapy.http import TextResponse, XmlResponse
+from scrapy.settings import Settings
+
+import tests
+from ebay_motors.pipelines import EbayListingCleanserPipeline
+from ebay_motors.spiders.ebay import EbaySpider
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--fixture', default='test1', help='Name of the search/details fixtures (default: test1)')
+    parser.add_argument('--repeat', type=int, default=500, help='Number of responses to parse (default: 500)')
+    return parser.parse_args()
+
+
+def parse(encoding: str, body: bytes, summaries: list, repeat: int = 1) -> list:
+    spider = EbaySpider()
+    spider.settings = Settings({'EBAY_DETAILS_RESPONSE_ENCODING': encoding})
+    response_cls = XmlResponse if encoding == 'XML' else TextResponse
+    items = []
+    for _ in range(repeat):
+        response = response_cls('https://open.api.ebay.com/shopping', body=body, encoding='utf-8')
+        items = list(spider.parse_details(response, items=summaries))
+    return items
+
+
+def main(args):
+    fixtures = pathlib.Path(tests.__file__).parent
+    summaries = tests.load_test_data('search', args.fixture)['findItemsAdvancedResponse'][0]['searchResult'][0]['item']
+    bodies = {
+        'XML': (fixtures / 'details' / f'{args.fixture}.xml').read_bytes(),
+        'JSON': (fixtures / 'details' / f'{args.fixture}.json').read_bytes(),
+    }
+
+    results = {encoding: parse(encoding, body, summaries) for encoding, body in bodies.items()}
+    if not results['XML']:
+        raise SystemExit('No items were parsed from the XML fixture.')
+    if [dict(i) for i in results['XML']] != [dict(i) for i in results['JSON']]:
+        raise SystemExit('Raw items differ between the XML and JSON detail responses:\n'
+                         + json.dumps([[dict(i) for i in r] for r in results.values()], indent=2))
+    cleanser = EbayListingCleanserPipeline()
+    spider = EbaySpider()
+    spider.settings = Settings()
+    cleansed = {encoding: [dict(cleanser.process_item(i, spider)) for i in items] for encoding, items in results.items()}
+    if cleansed['XML'] != cleansed['JSON']:
+        raise SystemExit('Cleansed items differ between the XML and JSON detail responses.')
+    print(f'{len(results["XML"])} items identical for both encodings.')
+
+    for encoding, body in bodies.items():
+        start = time.perf_counter()
+        parse(encoding, body, summaries, repeat=args.repeat)
+        elapsed = time.perf_counter() - start
+        print(f'{encoding:4}: {args.repeat / elapsed:8.1f} responses/s ({len(body)} bytes each)')
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,81 @@
+"""
+Compare the adbapi (thread pool) and asyncio MySQL pipelines.
+
+Both pipelines write the same synthetic listings into a scratch copy of
+``MYSQL_EBAY_TABLE``: once into an empty table (inserts) and once more over
+the same rows (updates).  Requires a reachable MySQL server, e.g.::
+
+    python -m benchmarks.mysql_pipelines --configfile=config.json --items=5000
+"""
+import argparse
+import json
+import logging
+import pathlib
+import time
+import types
+
+from scrapy.utils.reactor import install_reactor
+install_reactor('twisted.internet.asyncioreactor.AsyncioSelectorReactor')
+
+from scrapy.utils.project import get_project_settings  # noqa: E402
+from twisted.internet import defer, task  # noqa: E402
+
+from benchmarks import synthetic_listings  # noqa: E402
+from ebay_motors import pipelines  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--configfile', type=lambda x: pathlib.Path(x).absolute(), required=True,
+                        help='Path to config file with the MySQL connection settings')
+    parser.add_argument('--items', type=int, default=2000, help='Number of listings to write (default: 2000)')
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help='Items in flight at once, like CONCURRENT_ITEMS (default: 100)')
+    parser.add_argument('--table', default='cars_benchmark',
+                        help='Scratch table, created like MYSQL_EBAY_TABLE (default: cars_benchmark)')
+    return parser.parse_args()
+
+
+@defer.inlineCallbacks
+def run_pass(pipeline, items, spider, concurrency):
+    """Push `items` through `pipeline` and return the elapsed seconds."""
+    sem = defer.DeferredSemaphore(concurrency)
+    start = time.perf_counter()
+    yield defer.DeferredList([sem.run(pipeline.process_item, item.copy(), spider) for item in items])
+    return time.perf_counter() - start
+
+
+@defer.inlineCallbacks
+def main(reactor, args):
+    settings = get_project_settings().copy()
+    settings.setdict(json.load(open(args.configfile)), priority='cmdline')
+    source_table = settings['MYSQL_EBAY_TABLE']
+    settings.set('MYSQL_EBAY_TABLE', args.table, priority='cmdline')
+    spider = types.SimpleNamespace(settings=settings, processed=0, errors=0, logger=logging.getLogger('benchmark'))
+
+    cleanser = pipelines.EbayListingCleanserPipeline()
+    items = [cleanser.process_item(item, spider) for item in synthetic_listings(args.items)]
+
+    # A plain adbapi pool for setup so neither pipeline is warmed up by it
+    admin = pipelines.EbayMySQLExportPipeline.from_settings(settings).backend.dbpool
+    yield admin.runOperation(f'CREATE TABLE IF NOT EXISTS {args.table} LIKE {source_table}')
+
+    for cls in (pipelines.EbayMySQLExportPipeline, pipelines.EbayAsyncMySQLExportPipeline):
+        yield admin.runOperation(f'TRUNCATE TABLE {args.table}')
+        pipeline = cls.from_settings(settings)
+        yield pipeline.open_spider(spider)
+        inserts = yield run_pass(pipeline, items, spider, args.concurrency)
+        updates = yield run_pass(pipeline, items, spider, args.concurrency)
+        yield pipeline.close_spider(spider)
+        print(f'{cls.__name__}:\n'
+              f'  insert: {len(items) / inserts:8.1f} items/s ({inserts:.2f}s)\n'
+              f'  update: {len(items) / updates:8.1f} items/s ({updates:.2f}s)')
+
+    yield admin.runOperation(f'DROP TABLE {args.table}')
+    admin.close()
+    print(f'Errors: {spider.errors}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    task.react(main, [parse_args()])
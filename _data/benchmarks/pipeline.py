@@ -0,0 +1,90 @@
+"""
+Run the whole item pipeline against a local SQLite (WAL) database.
+
+Synthetic listings are cleansed and stored with `EbayMySQLExportPipeline` on
+the `storage.SQLiteBackend`: once into an empty database (inserts) and then
+again with some prices dropped (updates).  The price drop dates are checked
+against the rows whose price went down, and the throughput is reported::
+
+    python -m benchmarks.pipeline --items=5000
+"""
+import argparse
+import logging
+import pathlib
+import sqlite3
+import tempfile
+import time
+import types
+
+from scrapy.utils.project import get_project_settings
+from twisted.internet import defer, task
+
+from benchmarks import synthetic_listings
+from ebay_motors import pipelines
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--items', type=int, default=5000, help='Number of listings to write (default: 5000)')
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help='Items in flight at once, like CONCURRENT_ITEMS (default: 100)')
+    parser.add_argument('--database', type=lambda x: pathlib.Path(x).absolute(),
+                        help='SQLite file to write (default: a temporary file)')
+    parser.add_argument('--description-table', default='car_descriptions',
+                        help='MYSQL_DESCRIPTION_TABLE, empty to store descriptions inline (default: car_descriptions)')
+    return parser.parse_args()
+
+
+@defer.inlineCallbacks
+def run_pass(cleanser, pipeline, listings, spider, concurrency):
+    """Push copies of `listings` through both pipelines and return the elapsed seconds."""
+    sem = defer.DeferredSemaphore(concurrency)
+    start = time.perf_counter()
+    items = [cleanser.process_item(listing.copy(), spider) for listing in listings]
+    yield defer.DeferredList([sem.run(pipeline.process_item, item, spider) for item in items])
+    return time.perf_counter() - start
+
+
+@defer.inlineCallbacks
+def main(reactor, args):
+    database = args.database or pathlib.Path(tempfile.mkdtemp()) / 'ebay.sqlite3'
+    settings = get_project_settings().copy()
+    settings.set('STORAGE_BACKEND', 'ebay_motors.storage.SQLiteBackend', priority='cmdline')
+    settings.set('SQLITE_PATH', str(database), priority='cmdline')
+    settings.set('MYSQL_DESCRIPTION_TABLE', args.description_table, priority='cmdline')
+    spider = types.SimpleNamespace(settings=settings, processed=0, errors=0, logger=logging.getLogger('benchmark'))
+
+    cleanser = pipelines.EbayListingCleanserPipeline()
+    pipeline = pipelines.EbayMySQLExportPipeline.from_settings(settings)
+    listings = synthetic_listings(args.items)
+    yield pipeline.open_spider(spider)
+    inserts = yield run_pass(cleanser, pipeline, listings, spider, args.concurrency)
+
+    # Drop the stored price of every third listing
+    with sqlite3.connect(str(database)) as conn:
+        stored = dict(conn.execute(f'SELECT source_id, price FROM {settings["MYSQL_EBAY_TABLE"]}'))
+    dropped = set()
+    for i, listing in enumerate(listings):
+        if i % 3 == 0:
+            listing['price'] = str(stored[int(listing['source_id'])] - 100)
+            listing['bin_price'] = None
+            dropped.add(int(listing['source_id']))
+    updates = yield run_pass(cleanser, pipeline, listings, spider, args.concurrency)
+    yield pipeline.close_spider(spider)
+
+    with sqlite3.connect(str(database)) as conn:
+        reduced = {row[0] for row in conn.execute(
+            f'SELECT source_id FROM {settings["MYSQL_EBAY_TABLE"]} WHERE date_price_reduced IS NOT NULL')}
+        rows = conn.execute(f'SELECT COUNT(*) FROM {settings["MYSQL_EBAY_TABLE"]}').fetchone()[0]
+    if rows != len(listings) or reduced != dropped:
+        raise SystemExit(f'Expected {len(listings)} rows with {len(dropped)} price drops, '
+                         f'found {rows} rows with {len(reduced)}.')
+    print(f'insert: {len(listings) / inserts:8.1f} items/s ({inserts:.2f}s)\n'
+          f'update: {len(listings) / updates:8.1f} items/s ({updates:.2f}s)\n'
+          f'{rows} rows, {len(reduced)} price drops as expected, errors: {spider.errors}\n'
+          f'Database: {database}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    task.react(main, [parse_args()])
@@ -0,0 +1,95 @@
+"""
+Measure the transport profile against a local test server.
+
+The server answers every request with the XML detail fixture over HTTP/1.1
+keep-alive, gzip-compressed when the request accepts it.  A crawl with the
+project settings fetches it repeatedly and the ``transport/*`` stats are
+reported::
+
+    python -m benchmarks.transport --requests=200
+"""
+import argparse
+import gzip
+import http.server
+import pathlib
+import threading
+
+import scrapy
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+
+import tests
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep connections alive
+    body = b''
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        FixtureHandler.connections += 1
+
+    def do_GET(self):
+        body = self.body
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureSpider(scrapy.Spider):
+    name = 'transport_benchmark'
+
+    def __init__(self, url, count, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.url = url
+        self.count = count
+
+    def start_requests(self):
+        for i in range(self.count):
+            yield scrapy.Request(f'{self.url}?page={i}', callback=self.parse)
+
+    def parse(self, response):
+        pass
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='Number of requests (default: 200)')
+    parser.add_argument('--no-compression', action='store_true', help='Disable COMPRESSION_ENABLED for comparison')
+    return parser.parse_args()
+
+
+def main(args):
+    FixtureHandler.body = (pathlib.Path(tests.__file__).parent / 'details' / 'test1.xml').read_bytes()
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    settings = get_project_settings().copy()
+    settings.set('ITEM_PIPELINES', {})
+    settings.set('LOG_LEVEL', 'WARNING')
+    settings.set('COMPRESSION_ENABLED', not args.no_compression)
+    # Keep the fixture crawls out of the run ledger and its baselines
+    settings.set('RUN_LEDGER_PATH', '')
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(FixtureSpider)
+    process.crawl(crawler, url=f'http://127.0.0.1:{server.server_port}/shopping', count=args.requests)
+    process.start()
+    server.shutdown()
+
+    stats = crawler.stats.get_stats()
+    for key in sorted(k for k in stats if k.startswith('transport/')):
+        print(f'{key}: {stats[key]}')
+    print(f'server connections accepted: {FixtureHandler.connections}')
+
+
+if __name__ == '__main__':
+    main(parse_args())
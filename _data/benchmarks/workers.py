@@ -0,0 +1,72 @@
+"""
+Measure how detail processing scales across worker processes.
+
+Checks that `workers.parse_and_cleanse()` produces the same listings as
+`EbaySpider.parse_details()` followed by `EbayListingCleanserPipeline`, then
+processes the detail fixture with 1, 2, 4... worker processes and reports the
+throughput and speedup over one process::
+
+    python -m benchmarks.workers --fixture=test1 --encoding=XML --responses=2000
+"""
+import argparse
+import concurrent.futures
+import os
+import pathlib
+import time
+
+from scrapy.http import TextResponse, XmlResponse
+from scrapy.settings import Settings
+
+import tests
+from ebay_motors import workers
+from ebay_motors.pipelines import EbayListingCleanserPipeline
+from ebay_motors.requests import EbayRequest
+from ebay_motors.spiders.ebay import EbaySpider
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--fixture', default='test1', help='Name of the search/details fixtures (default: test1)')
+    parser.add_argument('--encoding', default='XML', choices=['XML', 'JSON'], help='Detail response encoding')
+    parser.add_argument('--responses', type=int, default=2000, help='Responses per measurement (default: 2000)')
+    parser.add_argument('--processes', type=int, nargs='+',
+                        help='Pool sizes to measure (default: powers of 2 up to the CPU count)')
+    return parser.parse_args()
+
+
+def main(args):
+    summaries = tests.load_test_data('search', args.fixture)['findItemsAdvancedResponse'][0]['searchResult'][0]['item']
+    suffix = 'json' if args.encoding == 'JSON' else 'xml'
+    body = (pathlib.Path(tests.__file__).parent / 'details' / f'{args.fixture}.{suffix}').read_bytes()
+    config = {'encoding': args.encoding, 'mock': False, 'include_description': True,
+              'current_run_date': EbayRequest.current_run_date}
+
+    spider = EbaySpider()
+    spider.settings = Settings({'EBAY_DETAILS_RESPONSE_ENCODING': args.encoding})
+    response_cls = XmlResponse if args.encoding == 'XML' else TextResponse
+    response = response_cls('https://open.api.ebay.com/shopping', body=body, encoding='utf-8')
+    cleanser = EbayListingCleanserPipeline()
+    expected = [dict(cleanser.process_item(i, spider)) for i in spider.parse_details(response, items=summaries)]
+    result = workers.parse_and_cleanse(body, 'utf-8', summaries, config)
+    if result.listings != expected:
+        raise SystemExit('Worker listings differ from the in-process listings.')
+    print(f'{len(expected)} listings identical to the in-process path.')
+
+    sizes = args.processes or [2 ** i for i in range(os.cpu_count().bit_length()) if 2 ** i <= os.cpu_count()]
+    baseline = None
+    for size in sizes:
+        with concurrent.futures.ProcessPoolExecutor(size, mp_context=workers.mp_context()) as executor:
+            # Start the processes and import the project in them before timing
+            list(executor.map(workers.parse_and_cleanse, *zip(*[(body, 'utf-8', summaries, config)] * size)))
+            start = time.perf_counter()
+            futures = [executor.submit(workers.parse_and_cleanse, body, 'utf-8', summaries, config)
+                       for _ in range(args.responses)]
+            concurrent.futures.wait(futures)
+            elapsed = time.perf_counter() - start
+        rate = args.responses / elapsed
+        baseline = baseline or rate
+        print(f'{size:3} processes: {rate:9.1f} responses/s  speedup {rate / baseline:5.2f}x')
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,376 @@
+"""
+An archive of the raw search and detail responses, for reprocessing without the API.
+
+`ResponseArchive` is an extension that appends the body of each search and
+detail response, compressed, to segment files in ``ARCHIVE_DIR``.  Each run
+writes its own segments, ``<run>-<n>.seg``, and starts a new one every
+``ARCHIVE_SEGMENT_BYTES``.  A segment is a sequence of records, each:
+
+- ``RECORD``: the magic, the CRC-32 of the rest of the record and the lengths of
+  its two parts,
+- the metadata, zlib-compressed JSON: the kind of response, the run, the search
+  window's ``current_run_date``, the listing itemIds and, for detail responses,
+  what the spider parsed them with, including the search summaries,
+- the body, zlib-compressed on its own.
+
+Records are only ever appended, so a segment is readable up to the last
+complete record even if its run died while writing it.  The SQLite database
+``index.sqlite3`` in the archive maps each run and itemId to the offsets of its
+records.  Each record is indexed in a transaction of its own once it is written,
+so the index is only locked for a moment and runs archiving at the same time,
+e.g. the regular and fast lane runs, take turns.  A record that still couldn't
+be indexed is counted in ``archive/unindexed_records``, and
+`unindexed_records()` finds it.
+
+``run.py reprocess`` finds the latest detail record of each listing in the
+index (`latest_records()`) and hands the segments to worker processes, which
+rebuild and cleanse those listings with the current parsing and cleansing rules
+(`reprocess_segment()`).  Each listing is stored once, from its latest
+response, with the export pipeline.  It reports its throughput, so it doubles
+as a replay benchmark of the parsing and storage stages.
+"""
+import collections
+import json
+import logging
+import os
+import re
+import sqlite3
+import struct
+import time
+import types
+import typing
+import zlib
+
+import arrow
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import defer
+
+from ebay_motors.requests import EbayRequest
+
+RECORD = struct.Struct('<4sIII')
+MAGIC = b'EBAR'
+SEGMENT_SUFFIX = '.seg'
+INDEX_NAME = 'index.sqlite3'
+
+# Request callback name => kind of response
+KINDS = {
+    'parse_results': 'search',
+    'parse_details': 'details',
+    'parse_details_in_worker': 'details',
+}
+
+_ITEM_ID = re.compile(rb'"itemId"\s*:\s*\[\s*"(\d+)"')
+
+
+class Record(typing.NamedTuple):
+    offset: int
+    meta: dict
+    body: bytes
+
+
+# Seconds to wait for another run writing to the index, on the reactor thread
+INDEX_LOCK_TIMEOUT = 1.0
+
+
+def connect(directory, timeout: float = 5.0) -> sqlite3.Connection:
+    conn = sqlite3.connect(os.path.join(str(directory), INDEX_NAME), timeout=timeout)
+    # Readers don't block the runs writing to the index, which still write one at a time
+    conn.execute('PRAGMA journal_mode=WAL')
+    # Enough in WAL mode for the index not to be corrupted, and a commit per record stays cheap
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, run TEXT, segment TEXT, '
+                 'offset INTEGER, kind TEXT)')
+    conn.execute('CREATE TABLE IF NOT EXISTS items (item_id INTEGER, record INTEGER)')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_items ON items (item_id)')
+    return conn
+
+
+def encode(meta: dict, body: bytes, level: int = 6) -> bytes:
+    meta, body = zlib.compress(json.dumps(meta).encode(), level), zlib.compress(body, level)
+    return RECORD.pack(MAGIC, zlib.crc32(body, zlib.crc32(meta)), len(meta), len(body)) + meta + body
+
+
+def record_offsets(path) -> typing.List[int]:
+    """The offsets of the complete records in the segment at `path`, without reading them."""
+    offsets = []
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        offset = 0
+        while offset + RECORD.size <= size:
+            f.seek(offset)
+            magic, crc, meta_length, body_length = RECORD.unpack(f.read(RECORD.size))
+            end = offset + RECORD.size + meta_length + body_length
+            if magic != MAGIC or end > size:
+                break
+            offsets.append(offset)
+            offset = end
+    return offsets
+
+
+def read_segment(path, offsets: typing.Iterable[int] = None) -> typing.Iterator[Record]:
+    """The records of the segment at `path`, or only those at `offsets`.
+
+    Reading stops at the first incomplete or corrupt record.
+    """
+    logger = logging.getLogger(__name__)
+    positions = sorted(offsets) if offsets is not None else None
+    with open(path, 'rb') as f:
+        while positions is None or positions:
+            offset = positions.pop(0) if positions is not None else f.tell()
+            f.seek(offset)
+            header = f.read(RECORD.size)
+            if not header and positions is None:
+                # The end of the segment
+                return
+            if len(header) < RECORD.size:
+                logger.warning(f'Incomplete record at {offset} of {path}')
+                return
+            magic, crc, meta_length, body_length = RECORD.unpack(header)
+            meta, body = f.read(meta_length), f.read(body_length)
+            if magic != MAGIC or len(body) < body_length or zlib.crc32(body, zlib.crc32(meta)) != crc:
+                logger.warning(f'Corrupt or incomplete record at {offset} of {path}')
+                return
+            yield Record(offset, json.loads(zlib.decompress(meta)), zlib.decompress(body))
+
+
+def segments(directory, runs: typing.Collection[str] = None) -> typing.List[str]:
+    """The segment files in the archive, oldest first, of the `runs` or of all of them."""
+    names = sorted(name for name in os.listdir(str(directory)) if name.endswith(SEGMENT_SUFFIX))
+    return [os.path.join(str(directory), name) for name in names
+            if runs is None or segment_run(name) in runs]
+
+
+def segment_run(path) -> str:
+    return os.path.basename(str(path)).rsplit('-', 1)[0]
+
+
+def latest_records(directory, item_ids: typing.Collection[int] = None,
+                   runs: typing.Collection[str] = None) -> typing.Dict[str, typing.Dict[int, typing.List[str]]]:
+    """The latest detail record of each listing, or of the listings `item_ids`, in the `runs` or all of them.
+
+    Returns the itemIds to take from each record, by offset, by segment, oldest segment first.
+    """
+    conditions, params = ["r.kind = 'details'"], []
+    if item_ids is not None:
+        conditions.append(f'i.item_id IN ({", ".join("?" * len(item_ids))})')
+        params.extend(int(item_id) for item_id in item_ids)
+    if runs is not None:
+        conditions.append(f'r.run IN ({", ".join("?" * len(runs))})')
+        params.extend(runs)
+    conn = connect(directory)
+    try:
+        # Records are numbered in the order they were written
+        rows = conn.execute(f'''
+            SELECT r.segment, r.offset, latest.item_id
+            FROM (SELECT i.item_id AS item_id, MAX(i.record) AS record
+                  FROM items i JOIN records r ON r.id = i.record
+                  WHERE {" AND ".join(conditions)}
+                  GROUP BY i.item_id) latest
+            JOIN records r ON r.id = latest.record
+            ORDER BY r.segment, r.offset
+        ''', params).fetchall()
+    finally:
+        conn.close()
+    found = {}
+    for segment, offset, item_id in rows:
+        found.setdefault(os.path.join(str(directory), segment), {}).setdefault(offset, []).append(str(item_id))
+    return found
+
+
+def unindexed_records(directory, runs: typing.Collection[str] = None) -> typing.Dict[str, typing.List[int]]:
+    """The offsets of the records missing from the index by segment, e.g. those a run failed to index."""
+    conn = connect(directory)
+    try:
+        indexed = collections.defaultdict(set)
+        for segment, offset in conn.execute('SELECT segment, offset FROM records'):
+            indexed[segment].add(offset)
+    finally:
+        conn.close()
+    missing = {}
+    for path in segments(directory, runs):
+        offsets = [offset for offset in record_offsets(path) if offset not in indexed[os.path.basename(path)]]
+        if offsets:
+            missing[path] = offsets
+    return missing
+
+
+class ResponseArchive(object):
+    """Append the search and detail responses of the run to segment files in ``ARCHIVE_DIR``."""
+
+    def __init__(self, directory, stats, segment_bytes: int = 16 * 1024 * 1024, level: int = 6, spider: str = ''):
+        self.directory = str(directory)
+        self.stats = stats
+        self.segment_bytes = segment_bytes
+        self.level = level
+        # With the spider's name, as the regular and fast lane runs start together from cron
+        self.run = arrow.utcnow().format('YYYYMMDDTHHmmss') + (f'-{spider}' if spider else '')
+        self.segment = -1
+        self.file = None
+        self.index = None
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        directory = crawler.settings.get('ARCHIVE_DIR')
+        if not directory:
+            raise NotConfigured('ARCHIVE_DIR is not set')
+        ext = cls(directory, crawler.stats,
+                  crawler.settings.getint('ARCHIVE_SEGMENT_BYTES', 16 * 1024 * 1024),
+                  crawler.settings.getint('ARCHIVE_COMPRESSION_LEVEL', 6),
+                  crawler.spidercls.name)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        os.makedirs(self.directory, exist_ok=True)
+        self.index = connect(self.directory, INDEX_LOCK_TIMEOUT)
+
+    def _next_segment(self):
+        if self.file:
+            self.file.close()
+        self.segment += 1
+        self.file = open(os.path.join(self.directory, f'{self.run}-{self.segment:05d}{SEGMENT_SUFFIX}'), 'ab')
+
+    def response_received(self, response, request, spider):
+        kind = KINDS.get(getattr(request.callback, '__name__', None))
+        if kind is None or response.status != 200:
+            return
+        meta = {
+            'kind': kind,
+            'run': self.run,
+            'run_date': EbayRequest.current_run_date,
+            'url': response.url,
+            'charset': getattr(response, 'encoding', 'utf-8'),
+            'mock': bool(spider.settings.get('EBAY_MOCK_SEARCH', False)),
+        }
+        if kind == 'details':
+            summaries = request.cb_kwargs['items']
+            meta.update(encoding=spider.settings.get('EBAY_DETAILS_RESPONSE_ENCODING', 'XML'),
+                        include_description=request.cb_kwargs.get('include_description', True),
+                        item_ids=[summary['itemId'][0] for summary in summaries],
+                        summaries=summaries)
+        else:
+            meta.update(profile=request.cb_kwargs['profile'].name,
+                        item_ids=[item_id.decode() for item_id in _ITEM_ID.findall(response.body)])
+        self.write(meta, response.body)
+
+    def write(self, meta: dict, body: bytes):
+        record = encode(meta, body, self.level)
+        if self.file is None or self.file.tell() + len(record) > self.segment_bytes and self.file.tell():
+            self._next_segment()
+        offset = self.file.tell()
+        self.file.write(record)
+        # The record must be on disk before the index points at it
+        self.file.flush()
+        self.stats.inc_value('archive/records')
+        self.stats.inc_value('archive/bytes', len(body))
+        self.stats.inc_value('archive/compressed_bytes', len(record))
+        try:
+            # A transaction per record, committed or rolled back straight away, so the index isn't held locked
+            with self.index:
+                cur = self.index.execute('INSERT INTO records (run, segment, offset, kind) VALUES (?, ?, ?, ?)',
+                                         (self.run, os.path.basename(self.file.name), offset, meta['kind']))
+                self.index.executemany('INSERT INTO items (item_id, record) VALUES (?, ?)',
+                                       [(int(item_id), cur.lastrowid) for item_id in meta['item_ids']])
+        except sqlite3.Error as e:
+            self.stats.inc_value('archive/unindexed_records')
+            self.logger.error(f'Failed to index the record at {offset} of {self.file.name}: {e}')
+
+    def spider_closed(self, spider):
+        if self.file:
+            self.file.close()
+        if self.index:
+            self.index.close()
+        if self.segment >= 0:
+            self.logger.info(f'Archived {self.stats.get_value("archive/records", 0)} responses of run {self.run} '
+                             f'in {self.segment + 1} segment(s) in {self.directory}')
+
+
+class SegmentResult(typing.NamedTuple):
+    segment: str
+    records: int
+    # Raw bytes of the detail responses
+    bytes: int
+    listings: typing.List[dict]
+    errors: typing.List[str]
+    seconds: float
+
+
+def reprocess_segment(path: str, records: typing.Optional[typing.Dict[int, typing.Collection[str]]] = None
+                      ) -> SegmentResult:
+    """Rebuild and cleanse the listings of the detail records in the segment at `path`.
+
+    Runs in a worker process.  Only the listings of each record given by `records`,
+    {offset: itemIds}, if given.  Each record is parsed as the spider parsed it,
+    with the ``current_run_date`` of its run.
+    """
+    # Imported here as it loads the pipelines, which must not happen before the reactor is installed
+    from ebay_motors import workers
+
+    start = time.perf_counter()
+    count, size, listings, errors = 0, 0, [], []
+    for record in read_segment(path, None if records is None else list(records)):
+        meta = record.meta
+        if meta['kind'] != 'details':
+            continue
+        count += 1
+        size += len(record.body)
+        summaries = meta['summaries']
+        if records is not None:
+            summaries = [summary for summary in summaries if summary['itemId'][0] in records[record.offset]]
+        config = {'encoding': meta['encoding'], 'mock': meta['mock'],
+                  'include_description': meta['include_description'], 'current_run_date': meta['run_date']}
+        result = workers.parse_and_cleanse(record.body, meta['charset'], summaries, config)
+        if result.ack in ['Failure', 'PartialFailure']:
+            errors.append(f'{path}@{record.offset}: {result.error}')
+        listings.extend(result.listings)
+    return SegmentResult(path, count, size, listings, errors, time.perf_counter() - start)
+
+
+@defer.inlineCallbacks
+def reprocess(settings, tasks: typing.List[typing.Tuple[str, typing.Optional[typing.Dict[int, typing.List[str]]]]],
+              processes: int = 0, store: bool = True):
+    """Reprocess the (segment, records) `tasks` in worker processes and store the listings.
+
+    The tasks come from `latest_records()`, so each listing is stored once, from
+    its latest response.  A lower price than the stored one isn't taken for a
+    price drop, as the stored row may be newer than the response.
+    Returns the totals of the run.
+    """
+    from ebay_motors import pipelines
+    from ebay_motors import workers
+    from ebay_motors.items import EbayListingItem
+
+    spider = types.SimpleNamespace(settings=settings, processed=0, errors=0, logger=logging.getLogger('reprocess'))
+    pipeline = pipelines.EbayMySQLExportPipeline.from_settings(settings) if store else None
+    if pipeline:
+        pipeline.dates_price_drops = False
+        yield pipeline.open_spider(spider)
+    pool = workers.WorkerPool(processes)
+    semaphore = defer.DeferredSemaphore(settings.getint('CONCURRENT_ITEMS', 100))
+    totals = collections.Counter(segments=len(tasks), processes=pool.processes)
+    start = time.perf_counter()
+    try:
+        results = [pool.submit(reprocess_segment, path, records) for path, records in tasks]
+        for d in results:
+            result = yield d
+            totals.update(records=result.records, bytes=result.bytes, listings=len(result.listings),
+                          parse_seconds=result.seconds)
+            for error in result.errors:
+                spider.logger.error(f'Error(s) in archived details {error}')
+            totals['errors'] += len(result.errors)
+            if pipeline:
+                store_start = time.perf_counter()
+                yield defer.DeferredList([semaphore.run(pipeline.process_item, EbayListingItem(listing), spider)
+                                          for listing in result.listings])
+                totals['store_seconds'] += time.perf_counter() - store_start
+    finally:
+        pool.shutdown()
+        if pipeline:
+            pipeline.close_spider(spider)
+    totals['errors'] += spider.errors
+    totals['seconds'] = time.perf_counter() - start
+    return totals
@@ -0,0 +1,129 @@
+"""
+The daily budget of eBay API calls, shared by the runs of the day.
+
+eBay limits the calls each application makes to the Finding API (searches) and
+the Shopping API (``GetMultipleItems`` details) per day, and the limits reset at
+midnight Pacific time.  `ApiBudget` keeps the calls spent on each endpoint that
+day in a JSON file at ``EBAY_BUDGET_PATH``, so each run knows what the runs
+before it spent.
+
+With ``EBAY_BUDGET_PACING`` a run may only spend the share of the daily limit
+for the part of the day that has passed by the next scheduled run
+(``EBAY_BUDGET_RUN_INTERVAL`` minutes), less the calls already spent, so the
+runs of the late evening get their share too.  Calls a run doesn't spend are
+left to the runs after it.
+"""
+import collections
+import json
+import logging
+import os
+import typing
+
+import arrow
+
+from ebay_motors import runlock
+
+# Where eBay's day begins and ends
+DAY_TIMEZONE = 'US/Pacific'
+# Seconds to wait for another run saving the budget file
+SAVE_LOCK_TIMEOUT = 10
+
+
+class ApiBudget(object):
+    """The calls each endpoint has left today, and the calls this run spends and expects to spend."""
+
+    def __init__(self, path, limits: typing.Dict[str, int], pacing: bool = True, interval: float = 15):
+        self.path = path
+        self.limits = limits
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.now = arrow.utcnow()
+        self.day = self.now.to(DAY_TIMEZONE).format('YYYY-MM-DD')
+        # Calls spent today by the runs before this one
+        self.spent_before = collections.Counter(self._load().get(self.day, {}))
+        self.spent = collections.Counter()
+        self.predicted = collections.Counter()
+        self.allowances = {endpoint: self._allowance(limit, self.spent_before[endpoint], pacing, interval)
+                           for endpoint, limit in limits.items() if limit}
+
+    @classmethod
+    def from_settings(cls, settings) -> typing.Optional['ApiBudget']:
+        if not settings.get('EBAY_BUDGET_PATH'):
+            return None
+        return cls(settings['EBAY_BUDGET_PATH'],
+                   settings.getdict('EBAY_DAILY_CALL_LIMITS'),
+                   settings.getbool('EBAY_BUDGET_PACING', True),
+                   settings.getfloat('EBAY_BUDGET_RUN_INTERVAL', 15))
+
+    def _load(self) -> dict:
+        """{day: {endpoint: calls}} from the budget file."""
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f'Starting a new API budget, failed to load {self.path}: {e}')
+            return {}
+
+    def _allowance(self, limit: int, spent: int, pacing: bool, interval: float) -> int:
+        if pacing:
+            start = self.now.to(DAY_TIMEZONE).floor('day')
+            elapsed = (self.now - start).total_seconds() + interval * 60
+            limit = int(limit * min(1.0, elapsed / 86400))
+        return max(0, limit - spent)
+
+    def remaining(self, endpoint: str) -> typing.Optional[int]:
+        """Calls this run has left on `endpoint`, None if it is unlimited."""
+        if endpoint not in self.allowances:
+            return None
+        return self.allowances[endpoint] - self.spent[endpoint]
+
+    def can_spend(self, endpoint: str, calls: int = 1) -> bool:
+        remaining = self.remaining(endpoint)
+        return remaining is None or remaining >= calls
+
+    def spend(self, endpoint: str, calls: int = 1):
+        self.spent[endpoint] += calls
+
+    def predict(self, endpoint: str, calls: int):
+        """Add `calls` to what this run is expected to spend on `endpoint`."""
+        self.predicted[endpoint] += calls
+
+    def tight(self, endpoint: str) -> bool:
+        """Whether this run is expected to spend more calls than it has on `endpoint`."""
+        return endpoint in self.allowances and self.predicted[endpoint] > self.allowances[endpoint]
+
+    def save(self):
+        """Add the calls of this run to today's, as recorded by now.
+
+        The file is read again first, under a lock, so the calls of runs that
+        overlapped this one, such as the fast lane's, aren't lost.
+        """
+        lock = runlock.RunLock(f'{self.path}.lock')
+        lock.acquire(SAVE_LOCK_TIMEOUT)
+        try:
+            days = self._load()
+            # Earlier days are no use
+            spent = collections.Counter(days.get(self.day, {}))
+            spent.update(self.spent)
+            tmp = f'{self.path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({self.day: dict(spent)}, f)
+            os.replace(tmp, self.path)
+        finally:
+            lock.release()
+
+    def record(self, stats):
+        """Set the ``budget/<endpoint>/*`` stats."""
+        for endpoint in set(self.limits) | set(self.spent):
+            stats.set_value(f'budget/{endpoint}/spent', self.spent[endpoint])
+            stats.set_value(f'budget/{endpoint}/spent_today', self.spent_before[endpoint] + self.spent[endpoint])
+            if endpoint in self.allowances:
+                stats.set_value(f'budget/{endpoint}/allowance', self.allowances[endpoint])
+                stats.set_value(f'budget/{endpoint}/predicted', self.predicted[endpoint])
+
+    def summary(self) -> str:
+        return ', '.join(f'{endpoint} {self.spent[endpoint]}'
+                         + (f' of {self.allowances[endpoint]} (predicted {self.predicted[endpoint]})'
+                            if endpoint in self.allowances else '')
+                         for endpoint in sorted(set(self.limits) | set(self.spent)))
@@ -6,10 +6,11 @@ import scrapy.loader
 
 
 class EbayListingItem(scrapy.Item):
-    id = scrapy.Field(serializer=int, exclude_insert=True, exclude_update=True)
+    id = scrapy.Field(serializer=int, exclude_insert=True, exclude_update=True,
+                      primary_key=True, sql_type='BIGINT UNSIGNED NOT NULL AUTO_INCREMENT')
     name = scrapy.Field()
-    source = scrapy.Field(exclude_update=True)
-    source_id = scrapy.Field(serializer=int, exclude_update=True)
+    source = scrapy.Field(exclude_update=True, sql_type='VARCHAR(32) NOT NULL')
+    source_id = scrapy.Field(serializer=int, exclude_update=True, sql_type='BIGINT NOT NULL')
     price = scrapy.Field(serializer=int)
     bin_price = scrapy.Field(serializer=int, exclude_insert=True, exclude_update=True)
     year = scrapy.Field(serializer=int)
@@ -29,13 +30,16 @@ class EbayListingItem(scrapy.Item):
     city = scrapy.Field()
     state = scrapy.Field()
     country = scrapy.Field()
-    url = scrapy.Field()
-    date_listed = scrapy.Field()
-    date_found = scrapy.Field(exclude_update=True)
-    date_refreshed = scrapy.Field(exclude_insert=True)
+    url = scrapy.Field(sql_type='VARCHAR(1024)')
+    date_listed = scrapy.Field(sql_type='DATETIME')
+    date_found = scrapy.Field(exclude_update=True, sql_type='DATETIME')
+    date_refreshed = scrapy.Field(exclude_insert=True, sql_type='DATETIME')
     num_doors = scrapy.Field(serializer=int)
-    date_price_reduced = scrapy.Field(exclude_insert=True)
+    date_price_reduced = scrapy.Field(exclude_insert=True, sql_type='DATETIME')
     seller_type = scrapy.Field()
-    details = scrapy.Field()
+    details = scrapy.Field(sql_type='MEDIUMTEXT')
+    details_hash = scrapy.Field(sql_type='CHAR(40)')
     page_views = scrapy.Field(serializer=int)
     favorited = scrapy.Field(serializer=int)
+    # Why the export pipeline failed to store the listing, if it did
+    write_error = scrapy.Field(exclude_insert=True, exclude_update=True)
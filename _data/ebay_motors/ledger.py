@@ -0,0 +1,222 @@
+"""
+A ledger with a row per run, and a report of performance regressions across runs.
+
+`RunLedger` is an extension that times the stages of the crawl from the request
+callbacks and, when the spider closes, records the run in the ``runs`` table of
+a local SQLite database at ``RUN_LEDGER_PATH``.  `report()` compares recent runs
+with the median of the runs before them (``run.py report``).
+"""
+import arrow
+import logging
+import sqlite3
+import statistics
+import sys
+import time
+import typing
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where only the memusage stats are used
+    resource = None
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from ebay_motors.requests import EbayRequest
+
+# Request callback name => stage
+STAGES = {
+    'parse_auth_and_search': 'auth',
+    'parse_results': 'search',
+    'parse_details': 'details',
+    'parse_details_in_worker': 'details',
+}
+
+COLUMNS = [
+    ('id', 'INTEGER PRIMARY KEY'),
+    ('spider', 'TEXT'),
+    ('started', 'REAL'),
+    ('finished', 'REAL'),
+    ('reason', 'TEXT'),
+    ('window_start', 'TEXT'),
+    ('window_end', 'TEXT'),
+    ('pages', 'INTEGER'),
+    ('detail_calls', 'INTEGER'),
+    ('items', 'INTEGER'),
+    ('inserted', 'INTEGER'),
+    ('updated', 'INTEGER'),
+    ('unchanged', 'INTEGER'),
+    ('errors', 'INTEGER'),
+    ('total_seconds', 'REAL'),
+    ('auth_seconds', 'REAL'),
+    ('search_seconds', 'REAL'),
+    ('details_seconds', 'REAL'),
+    ('items_seconds', 'REAL'),
+    ('first_row_seconds', 'REAL'),
+    ('peak_memory', 'INTEGER'),
+]
+
+# Report metric => (description, True if higher is better)
+METRICS = {
+    'items_per_second': ('items/s overall', True),
+    'pages_per_second': ('search pages/s', True),
+    'details_per_second': ('detail calls/s', True),
+    'first_row_seconds': ('seconds to first stored row', False),
+    'peak_memory': ('peak memory', False),
+}
+
+
+def connect(path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    conn.execute(f'CREATE TABLE IF NOT EXISTS runs ({", ".join(f"{n} {t}" for n, t in COLUMNS)})')
+    return conn
+
+
+class RunLedger(object):
+    """Record each run in the ledger at ``RUN_LEDGER_PATH``."""
+
+    def __init__(self, path, stats):
+        self.path = path
+        self.stats = stats
+        self.started = time.time()
+        # stage => [first request scheduled, last response received]
+        self.stages = {}
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('RUN_LEDGER_PATH')
+        if not path:
+            raise NotConfigured('RUN_LEDGER_PATH is not set')
+        ext = cls(path, crawler.stats)
+        crawler.signals.connect(ext.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def _mark(self, stage: str):
+        now = time.time()
+        self.stages.setdefault(stage, [now, now])[1] = now
+
+    def _stage(self, request) -> typing.Optional[str]:
+        return STAGES.get(getattr(request.callback, '__name__', None))
+
+    def request_scheduled(self, request, spider):
+        stage = self._stage(request)
+        if stage:
+            self.stats.inc_value(f'ledger/requests/{stage}')
+            if stage not in self.stages:
+                self._mark(stage)
+
+    def response_received(self, response, request, spider):
+        stage = self._stage(request)
+        if stage:
+            self._mark(stage)
+
+    def item_scraped(self, item, response, spider):
+        self._mark('items')
+
+    def spider_closed(self, spider, reason):
+        run = self.run(spider, reason)
+        try:
+            conn = connect(self.path)
+            try:
+                with conn:
+                    conn.execute(f'INSERT INTO runs ({", ".join(run)}) VALUES ({", ".join(["?"] * len(run))})',
+                                 tuple(run.values()))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            self.logger.error(f'Failed to record the run in {self.path}: {e}')
+        else:
+            self.logger.info(f'Recorded the run in {self.path}')
+
+    def run(self, spider, reason) -> dict:
+        """The ledger row for the run."""
+        stats = self.stats
+        prior_run_dates = [p.prior_run_date for p in getattr(spider, 'profiles', []) if p.prior_run_date]
+        peak_memory = stats.get_value('memusage/max')
+        if peak_memory is None and resource is not None:
+            # ru_maxrss is in kilobytes on Linux
+            peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        finished = time.time()
+        run = {
+            'spider': spider.name,
+            'started': self.started,
+            'finished': finished,
+            'reason': reason,
+            'window_start': min(prior_run_dates) if prior_run_dates else EbayRequest.prior_run_date,
+            'window_end': EbayRequest.current_run_date,
+            'pages': stats.get_value('ledger/requests/search', 0),
+            'detail_calls': stats.get_value('ledger/requests/details', 0),
+            'items': stats.get_value('item_scraped_count', 0),
+            'inserted': stats.get_value('db/inserted', 0),
+            'updated': stats.get_value('db/updated', 0),
+            'unchanged': stats.get_value('db/unchanged', 0),
+            'errors': getattr(spider, 'errors', 0),
+            'total_seconds': finished - self.started,
+            'first_row_seconds': stats.get_value('db/first_row_seconds'),
+            'peak_memory': peak_memory,
+        }
+        for stage in list(STAGES.values()) + ['items']:
+            start, end = self.stages.get(stage, (None, None))
+            run[f'{stage}_seconds'] = end - start if start is not None else None
+        return run
+
+
+def _metrics(run) -> dict:
+    def rate(count, seconds):
+        return count / seconds if count and seconds else None
+    return {
+        'items_per_second': rate(run['items'], run['total_seconds']),
+        'pages_per_second': rate(run['pages'], run['search_seconds']),
+        'details_per_second': rate(run['detail_calls'], run['details_seconds']),
+        'first_row_seconds': run['first_row_seconds'],
+        'peak_memory': run['peak_memory'],
+    }
+
+
+def report(path, spider: str = 'ebay', recent: int = 1, baseline: int = 10,
+           threshold: float = 0.25) -> typing.Tuple[str, int]:
+    """Compare the `recent` runs with the median of the `baseline` finished runs before them.
+
+    Returns the report text and the number of regressions, metrics worse than the
+    baseline by more than the `threshold` fraction.
+    """
+    conn = connect(path)
+    try:
+        runs = conn.execute('SELECT * FROM runs WHERE spider = ? ORDER BY started DESC LIMIT ?',
+                            (spider, recent + baseline * 2)).fetchall()
+    finally:
+        conn.close()
+    latest, earlier = runs[:recent], [r for r in runs[recent:] if r['reason'] == 'finished'][:baseline]
+    if not latest:
+        return f'No runs of {spider} in {path}', 0
+    base = {}
+    for metric in METRICS:
+        values = [m for m in (_metrics(r)[metric] for r in earlier) if m is not None]
+        base[metric] = statistics.median(values) if values else None
+
+    lines = [f'{len(latest)} recent run(s) of {spider} against a baseline of {len(earlier)}:']
+    regressions = 0
+    for run in reversed(latest):
+        lines.append(f'\n{arrow.get(run["started"]).to("local").format("YYYY-MM-DD HH:mm")} '
+                     f'({run["reason"]}, window {run["window_start"]} - {run["window_end"]}): '
+                     f'{run["pages"]} pages, {run["detail_calls"]} detail calls, {run["items"]} items, '
+                     f'{run["inserted"]} inserted, {run["updated"]} updated, {run["unchanged"]} unchanged, '
+                     f'{run["errors"]} errors')
+        for metric, value in _metrics(run).items():
+            description, higher_is_better = METRICS[metric]
+            if value is None:
+                continue
+            line = f'  {description:28} {value:14.2f}'
+            if base[metric]:
+                change = (value - base[metric]) / base[metric]
+                line += f'  baseline {base[metric]:14.2f} ({change:+.0%})'
+                if (-change if higher_is_better else change) > threshold:
+                    regressions += 1
+                    line += '  REGRESSION'
+            lines.append(line)
+    return '\n'.join(lines), regressions
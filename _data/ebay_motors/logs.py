@@ -0,0 +1,97 @@
+"""
+Logging off the reactor thread.
+
+`start_queue_logging()` moves the handlers on the root logger behind a
+`QueueHandler`, so logging calls only put the record on a queue and a
+`QueueListener` thread formats and writes it.  Records below WARNING are
+rate limited per call site by `SamplingFilter` before they are queued, and
+the dropped records are counted, in the log and the ``log_sampling/dropped``
+stat.  The `QueueHandler` takes the lowest level of the handlers it replaces,
+so records none of them would write are neither queued nor counted.
+"""
+import collections
+import logging
+import logging.handlers
+import queue
+import threading
+import typing
+
+# Arguments that can't change between the logging call and the writer thread formatting the record
+_IMMUTABLE = (str, bytes, int, float, bool, type(None))
+
+
+class SamplingFilter(logging.Filter):
+    """Pass at most `limit` records below WARNING per call site in each `period` seconds."""
+
+    def __init__(self, limit: int, period: float):
+        super().__init__()
+        self.limit = limit
+        self.period = period
+        # (pathname, lineno) => [window start, records passed]
+        self.windows = {}
+        self.dropped = collections.Counter()
+        self.lock = threading.Lock()
+
+    def filter(self, record) -> bool:
+        if record.levelno >= logging.WARNING or self.limit <= 0:
+            return True
+        site = (record.pathname, record.lineno)
+        with self.lock:
+            window = self.windows.get(site)
+            if window is None or record.created - window[0] >= self.period:
+                self.windows[site] = [record.created, 1]
+                return True
+            if window[1] < self.limit:
+                window[1] += 1
+                return True
+            self.dropped[site] += 1
+            return False
+
+    def spider_closed(self, spider):
+        """Count the dropped records in the stats of the crawl."""
+        spider.crawler.stats.set_value('log_sampling/dropped', sum(self.dropped.values()))
+        spider.crawler.stats.set_value('log_sampling/call_sites', len(self.dropped))
+
+    def summary(self, top: int = 5) -> str:
+        sites = ', '.join(f'{path}:{line} ({n})' for (path, line), n in self.dropped.most_common(top))
+        return (f'Sampling dropped {sum(self.dropped.values())} log lines '
+                f'from {len(self.dropped)} call sites: {sites}')
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Queue records as they are, leaving the formatting to the listener thread.
+
+    Records with mutable arguments are formatted before they are queued, so they
+    show the values as they were when logged.
+    """
+
+    def prepare(self, record):
+        # A single dict argument is the args mapping itself, which is mutable
+        if (isinstance(record.args, dict) or not isinstance(record.msg, _IMMUTABLE)
+                or not all(isinstance(arg, _IMMUTABLE) for arg in record.args or ())):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def start_queue_logging(rate_limit: int = 0, rate_period: float = 10.0,
+                        keep: typing.Tuple[type, ...] = ()) -> typing.Tuple[logging.handlers.QueueListener,
+                                                                            SamplingFilter]:
+    """Move the root logger's handlers, except those of the `keep` types, to a listener thread.
+
+    Returns the started listener, to `stop()` once logging is done, and the sampling filter.
+    """
+    root = logging.getLogger()
+    handlers = [h for h in root.handlers if not isinstance(h, keep)]
+    for handler in handlers:
+        root.removeHandler(handler)
+    records = queue.Queue()
+    sampler = SamplingFilter(rate_limit, rate_period)
+    queue_handler = LazyQueueHandler(records)
+    if handlers:
+        queue_handler.setLevel(min(handler.level for handler in handlers))
+    queue_handler.addFilter(sampler)
+    root.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener, sampler
@@ -6,6 +6,10 @@
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from ebay_motors import pipelines
+from ebay_motors.items import EbayListingItem
 
 
 class EbayMotorsSpiderMiddleware(object):
@@ -101,3 +105,33 @@ class EbayMotorsDownloaderMiddleware(object):
 
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
+
+
+class EbayListingBatchCleanserMiddleware(object):
+    """Cleanse all of the listings from one detail response together.
+
+    Enabled with ``EBAY_CLEANSER_MODE = 'batch'``, in which case
+    `EbayListingCleanserPipeline.process_item()` passes items straight through.
+    Without numpy the middleware stays disabled and the pipeline cleanses each
+    item instead.
+    """
+
+    def __init__(self):
+        self.cleanser = pipelines.EbayListingCleanserPipeline()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if crawler.settings.get('EBAY_CLEANSER_MODE', 'item') != 'batch':
+            raise NotConfigured
+        if pipelines.np is None:
+            raise NotConfigured('The numpy package is required for batch cleansing, cleansing each item instead.')
+        return cls()
+
+    def process_spider_output(self, response, result, spider):
+        batch = []
+        for i in result:
+            if isinstance(i, EbayListingItem):
+                batch.append(i)
+            else:
+                yield i
+        yield from self.cleanser.process_batch(batch, spider)
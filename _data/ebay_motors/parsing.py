@@ -0,0 +1,158 @@
+"""
+Extract listing fields from the ``GetMultipleItems`` detail responses.
+
+The XML and JSON response encodings are both reduced to the same plain
+dict of raw field values per ItemID, so the spider builds identical
+`EbayListingItem`s from either one.
+"""
+import typing
+
+import parsel
+
+from ebay_motors import utils
+from ebay_motors.items import EbayListingItem
+
+# EbayListingItem field => ItemSpecifics name
+ITEM_SPECIFICS = {
+    'seller_type': 'For Sale By',
+    'year': 'Year',
+    'make': 'Make',
+    'model': 'Model',
+    'submodel': 'Sub Model',
+    'mileage': 'Mileage',
+    'transmission': 'Transmission',
+    'num_cylinders': 'Number of Cylinders',
+    'drive_type': 'Drive Type',
+    'body_type': 'Body Type',
+    'fuel_type': 'Fuel Type',
+    'title_type': 'Vehicle Title',
+    'vin': 'VIN',
+    'trim': 'Trim',
+    'color': 'Exterior Color',
+    'num_doors': 'Number of Doors',
+}
+
+
+class DetailResponse(typing.NamedTuple):
+    ack: typing.Optional[str]
+    error: typing.Optional[str]
+    details: typing.Dict[str, dict]
+
+
+def xml_details(selector: parsel.Selector) -> DetailResponse:
+    """Extract the detail fields from an XML ``GetMultipleItemsResponse``."""
+    selector.remove_namespaces()
+    details = {}
+    for detail in selector.xpath('/GetMultipleItemsResponse/Item'):
+        fields = {
+            'bin_price': detail.xpath('ConvertedBuyItNowPrice/text()').get(),
+            'page_views': detail.xpath('HitCount/text()').get(),
+            'details': detail.xpath('Description/text()').get(),
+        }
+        for name, specific in ITEM_SPECIFICS.items():
+            fields[name] = detail.xpath(f'ItemSpecifics/NameValueList[Name="{specific}"]/Value/text()').get()
+        details.setdefault(detail.xpath('ItemID/text()').get(), fields)
+    return DetailResponse(
+        ack=selector.xpath('/GetMultipleItemsResponse/Ack/text()').get(),
+        error=selector.xpath('/GetMultipleItemsResponse/Errors/ShortMessage/text()').get(),
+        details=details,
+    )
+
+
+def json_details(resp: dict) -> DetailResponse:
+    """Extract the detail fields from a decoded JSON ``GetMultipleItems`` response."""
+    details = {}
+    for detail in resp.get('Item', []):
+        specifics = {}
+        for pair in detail.get('ItemSpecifics', {}).get('NameValueList', []):
+            specifics.setdefault(pair.get('Name'), (pair.get('Value') or [None])[0])
+        fields = {
+            'bin_price': _text(detail.get('ConvertedBuyItNowPrice')),
+            'page_views': _text(detail.get('HitCount')),
+            'details': _text(detail.get('Description')),
+        }
+        for name, specific in ITEM_SPECIFICS.items():
+            fields[name] = _text(specifics.get(specific))
+        details.setdefault(_text(detail.get('ItemID')), fields)
+    return DetailResponse(
+        ack=resp.get('Ack'),
+        error=_text((resp.get('Errors') or [{}])[0].get('ShortMessage')),
+        details=details,
+    )
+
+
+def details_response(body: bytes, encoding: str = 'XML', mock: bool = False,
+                     charset: str = 'utf-8') -> DetailResponse:
+    """Extract the detail fields from a raw ``GetMultipleItems`` response `body`.
+
+    `mock` bodies are the canned responses wrapped by the echo service in testing.
+    """
+    if encoding == 'JSON':
+        resp = utils.loads(body)
+        return json_details(resp['data'] if mock else resp)
+    text = utils.loads(body)['data'] if mock else body.decode(charset)
+    return xml_details(parsel.Selector(text=text, type='xml'))
+
+
+def _text(value) -> typing.Optional[str]:
+    """Render a JSON value the way it appears as text in the XML encoding."""
+    if isinstance(value, dict):
+        value = value.get('Value')
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def summary_prices(summary: dict) -> typing.Set[int]:
+    """The prices a listing may be stored with, going by its search result `summary`.
+
+    The stored price is the BuyItNow price if there is one, otherwise the current price.
+    """
+    listing_info = summary.get('listingInfo', [{}])[0]
+    prices = set()
+    for price in (summary.get('sellingStatus', [{}])[0].get('currentPrice', [{}])[0].get('__value__'),
+                  listing_info.get('convertedBuyItNowPrice', [{}])[0].get('__value__'),
+                  listing_info.get('buyItNowPrice', [{}])[0].get('__value__')):
+        try:
+            prices.add(int(float(price)))
+        except (TypeError, ValueError):
+            pass
+    return prices
+
+
+def listing(summary: dict, detail: dict) -> EbayListingItem:
+    """Build the listing from its search result `summary` and its `detail` fields."""
+    return EbayListingItem({
+        'source_id': summary.get('itemId', [None])[0],
+        'name': summary.get('title', [None])[0],
+        'url': 'https://' + summary.get('viewItemURL', [None])[0],
+        'price': summary.get('sellingStatus', [{}])[0].get('currentPrice', [{}])[0].get('__value__'),
+        'city': summary['location'][0].rsplit(',', maxsplit=2)[0] if ',' in summary.get('location', [''])[0] else None,
+        'state': summary['location'][0].rsplit(',', maxsplit=2)[1] if ',' in summary.get('location', [''])[0] else None,
+        'country': summary.get('country', [None])[0],
+        'date_listed': summary.get('listingInfo', [{}])[0].get('startTime')[0],
+        'favorited': summary.get('listingInfo', [{}])[0].get('watchCount', [None])[0],
+        **detail,
+    })
+
+
+def listings(summaries: typing.List[dict], details: typing.Dict[str, dict],
+             include_description: bool = True) -> typing.Tuple[typing.List[EbayListingItem], typing.List[str]]:
+    """Build the listings for the search `summaries` from their `details`.
+
+    Returns the listings and the ItemIDs missing from the details.
+    """
+    items, missing = [], []
+    for summary in summaries:
+        detail = details.get(summary['itemId'][0])
+        if detail is None:
+            missing.append(summary['itemId'][0])
+            continue
+        item = listing(summary, detail)
+        if not include_description:
+            # Not fetched, so leave whatever is stored alone
+            del item['details']
+        items.append(item)
+    return items, missing
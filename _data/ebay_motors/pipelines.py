@@ -1,14 +1,33 @@
 # -*- coding: utf-8 -*-
 import arrow
+import asyncio
 import datetime
+import hashlib
 import logging
-import MySQLdb._exceptions
 import re
 import typing
-from scrapy.exceptions import DropItem
-from twisted.enterprise import adbapi
-
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.utils.misc import load_object
+from twisted.internet import defer
+try:
+    import numpy as np
+except ImportError:
+    # Only needed for EbayListingCleanserPipeline.process_batch()
+    np = None
+try:
+    import aiomysql
+    import pymysql.constants.CLIENT
+    import pymysql.err
+except ImportError:
+    # Only needed for the AsyncMySQLExportPipeline
+    aiomysql = None
+
+from ebay_motors import schema
+from ebay_motors import utils
+from ebay_motors.items import EbayListingItem
 from ebay_motors.requests import EbayRequest
+from ebay_motors.storage import MySQLBackend
+from ebay_motors.writers import Backpressure, LaneWriteScheduler
 
 _DATE_FORMAT = 'YYYY-MM-DD HH:mm:ss'
 
@@ -39,16 +58,14 @@ class EbayListingCleanserPipeline(object):
 
     def process_item(self, item, spider):
         """Clean input values and map raw API values to internal DB values."""
-        self.logger.debug(f'Processing item {item.get("source_id")}')
+        mode = spider.settings.get('EBAY_CLEANSER_MODE', 'item')
+        if mode == 'process' or (mode == 'batch' and np is not None):
+            # Already cleansed along with the rest of its batch before reaching the pipelines
+            return item
 
-        item['source'] = 'ebay'
-        item['date_found'] = arrow.get(EbayRequest.current_run_date).format(_DATE_FORMAT)
-        item['date_refreshed'] = arrow.get(EbayRequest.current_run_date).format(_DATE_FORMAT)
-        item['url'] = f'https://ebay.com/itm/{item.get("source_id")}'
+        self.logger.debug('Processing item %s', item.get('source_id'))
 
-        # clean out the 'not specified's
-        for name in [k for k, v in item.items() if v and v.lower() in ['not specified', '--', 'unspecified']]:
-            del item[name]
+        self._prepare(item)
 
         # enforce numeric fields
         numeric_fields = [name for name in item if item.fields[name].get('serializer') is int]
@@ -56,15 +73,62 @@ class EbayListingCleanserPipeline(object):
             if item.get(name):
                 item[name] = self._ensure_numeric(item[name])
 
-        if item.get('details'):
-            item['details'] = self._ascii_only(item['details'])
+        self._normalize_mileage(item)
 
-        if item.get('name'):
-            item['name'] = self._ascii_only(item['name'])
+        self._map_values(item)
 
-        if item.get('transmission'):
-            item['transmission'] = item['transmission'].title()
+        if item.get('bin_price'):
+            # Override current price with BuyItNow price if there is one
+            item['price'] = item.get('bin_price')
+
+        return item
 
+    def process_batch(self, items: list, spider) -> list:
+        """Clean a batch of items, applying the numeric rules column-wise with NumPy.
+
+        The results are identical to calling `process_item()` on each item.
+        """
+        self.logger.debug('Processing batch of %d items', len(items))
+        if not items:
+            return items
+
+        run_date = arrow.get(EbayRequest.current_run_date).format(_DATE_FORMAT)
+        for item in items:
+            self._prepare(item, run_date)
+
+        # enforce numeric fields
+        numeric_fields = [name for name, meta in items[0].fields.items() if meta.get('serializer') is int]
+        for name in numeric_fields:
+            rows = [i for i, item in enumerate(items) if item.get(name)]
+            for i, value in zip(rows, self._ensure_numeric_column([items[i][name] for i in rows])):
+                items[i][name] = value
+
+        self._normalize_mileage_column(items)
+
+        for item in items:
+            self._map_values(item)
+
+        # Override current price with BuyItNow price if there is one
+        bin_prices = np.array([item.get('bin_price') for item in items], dtype=object)
+        for i in np.flatnonzero(bin_prices.astype(bool)):
+            items[i]['price'] = bin_prices[i]
+
+        return items
+
+    def _prepare(self, item, run_date: str = None):
+        """Set the fixed values and drop the placeholder values."""
+        run_date = run_date or arrow.get(EbayRequest.current_run_date).format(_DATE_FORMAT)
+        item['source'] = 'ebay'
+        item['date_found'] = run_date
+        item['date_refreshed'] = run_date
+        item['url'] = f'https://ebay.com/itm/{item.get("source_id")}'
+
+        # clean out the 'not specified's
+        for name in [k for k, v in item.items() if v and v.lower() in ['not specified', '--', 'unspecified']]:
+            del item[name]
+
+    def _normalize_mileage(self, item):
+        """Scale mileage given in thousands or with extra digits."""
         if item.get('mileage'):
             try:
                 if item['mileage'] < 300 and (item.get('year', 9999) or 9999) < arrow.utcnow().year - 1:
@@ -75,6 +139,17 @@ class EbayListingCleanserPipeline(object):
             except:
                 pass
 
+    def _map_values(self, item):
+        """Clean the text fields and map raw API values to internal DB values."""
+        if item.get('details'):
+            item['details'] = self._ascii_only(item['details'])
+
+        if item.get('name'):
+            item['name'] = self._ascii_only(item['name'])
+
+        if item.get('transmission'):
+            item['transmission'] = item['transmission'].title()
+
         if item.get('body_type'):
             body_type = item['body_type'].lower()
             if re.search(r'sports?[\s/]*utility|cross|suv', body_type):
@@ -132,7 +207,7 @@ class EbayListingCleanserPipeline(object):
                        for x in ["salvage", "branded", "buyback", "lemon", "rebuilt", "reconstructed", "rebuildable"]):
                     title_type = 'Salvage'
                     if title_type != item['title_type']:
-                        self.logger.debug(f'Changed {item["title_type"]} to Salvage')
+                        self.logger.debug('Changed %s to Salvage', item['title_type'])
                     item['title_type'] = title_type
 
         if item.get('fuel_type'):
@@ -155,11 +230,6 @@ class EbayListingCleanserPipeline(object):
             except:
                 self.logger.warning(f'Could not parse `date_listed` value of {item.get("date_listed")}')
 
-        if item.get('bin_price'):
-            # Override current price with BuyItNow price if there is one
-            item['price'] = item.get('bin_price')
-
-        return item
 
     def _map_field(self, mapping: dict, value):
         """Lookup the input `value` in the given `mapping`.
@@ -185,18 +255,69 @@ class EbayListingCleanserPipeline(object):
         # If it isn't numeric and doesn't contain numbers to extract, return None
         return None
 
+    def _ensure_numeric_column(self, values: list) -> list:
+        """Vectorized `_ensure_numeric()` over a column of values."""
+        try:
+            floats = np.array(values, dtype=np.float64)
+        except (ValueError, TypeError):
+            floats = None
+        if floats is None or not np.all(np.abs(floats) < 2 ** 63):
+            # Something needs the regex extraction (or isn't finite), fall back to the scalar rules
+            return [self._ensure_numeric(value) for value in values]
+        return np.trunc(floats).astype(np.int64).tolist()
+
+    def _normalize_mileage_column(self, items: list):
+        """Vectorized `_normalize_mileage()` over a batch of items."""
+        def fits(value):
+            # int64 arrays hold these exactly, and so do the float64 ones for the division
+            return type(value) is int and abs(value) < 2 ** 53
+
+        rows = []
+        for i, item in enumerate(items):
+            if item.get('mileage'):
+                if fits(item['mileage']) and fits(item.get('year', 9999) or 9999):
+                    rows.append(i)
+                else:
+                    self._normalize_mileage(item)
+        if not rows:
+            return
+        mileage = np.array([items[i]['mileage'] for i in rows], dtype=np.int64)
+        year = np.array([items[i].get('year', 9999) or 9999 for i in rows], dtype=np.int64)
+
+        scale_up = (mileage < 300) & (year < arrow.utcnow().year - 1)
+        for i, value in zip(np.flatnonzero(scale_up), (mileage[scale_up] * 1000).tolist()):
+            items[rows[i]]['mileage'] = value
+
+        # Divide by 10 until it is in range, one step at a time to keep the same float rounding
+        scale_down = np.flatnonzero(~scale_up & (mileage > 1000000))
+        scaled = mileage[scale_down].astype(np.float64)
+        over = scaled > 1000000
+        while over.any():
+            scaled[over] /= 10
+            over = scaled > 1000000
+        for i, value in zip(scale_down, scaled.tolist()):
+            items[rows[i]]['mileage'] = value
+
 
 class MySQLExportPipeline(object):
     """A pipeline to store the item in a MySQL database.
-    This implementation uses Twisted's asynchronous database API.
+    This implementation uses Twisted's asynchronous database API through a
+    `storage.StorageBackend`, MySQL by default (``STORAGE_BACKEND``).
 
     Adapted from: https://github.com/rmax/dirbot-mysql
     """
 
     key_field = 'id'
-
-    def __init__(self, dbpool, *args, **kwargs):
-        self.dbpool = dbpool
+    # Fields of the table's unique index, which the upsert and lookups are keyed on
+    unique_fields = ('id',)
+    # Item class of the stored rows, for backends that create their tables
+    item_class = None
+
+    def __init__(self, backend, *args, **kwargs):
+        self.backend = backend
+        self.dbpool = backend.dbpool
+        self.scheduler = None
+        self.backpressure = None
         self.logger = logging.getLogger(self.__class__.__name__)
         super().__init__(*args, **kwargs)
 
@@ -208,23 +329,89 @@ class MySQLExportPipeline(object):
             log.info(f'MySQL export is disabled.  Feeds are going to {settings["FEED_URI"]}')
             return None
 
-        dbargs = dict(
-            host=settings['MYSQL_HOST'],
-            db=settings['MYSQL_DBNAME'],
-            user=settings['MYSQL_USER'],
-            passwd=settings['MYSQL_PASSWD'],
-            port=settings['MYSQL_PORT'],
-            charset='utf8',
-            use_unicode=True,
-        )
-        dbpool = adbapi.ConnectionPool('MySQLdb', **dbargs)
-        return cls(dbpool)
+        backend = load_object(settings.get('STORAGE_BACKEND', 'ebay_motors.storage.MySQLBackend'))
+        return cls(backend.from_settings(settings))
+
+    def open_spider(self, spider):
+        if spider.settings.getint('MYSQL_WRITE_LANES', 0) > 0:
+            self.scheduler = LaneWriteScheduler(
+                lambda items: self._write_batch(items, spider),
+                self._is_deadlock,
+                lanes=spider.settings.getint('MYSQL_WRITE_LANES'),
+                batch_size=spider.settings.getint('MYSQL_WRITE_BATCH_SIZE', 50),
+                retries=spider.settings.getint('MYSQL_DEADLOCK_RETRIES', 5),
+                backoff=spider.settings.getfloat('MYSQL_DEADLOCK_BACKOFF', 0.1),
+                max_backoff=spider.settings.getfloat('MYSQL_DEADLOCK_MAX_BACKOFF', 5.0),
+            )
+        high_water = spider.settings.getint('MYSQL_BACKPRESSURE_HIGH_WATER', 0)
+        if high_water > 0 and getattr(spider, 'crawler', None) is not None:
+            self.backpressure = Backpressure(
+                spider.crawler.engine,
+                spider.crawler.stats,
+                high_water,
+                spider.settings.getint('MYSQL_BACKPRESSURE_LOW_WATER', high_water // 2),
+                queued=lambda: self.scheduler.pending if self.scheduler else 0,
+            )
+        d = defer.maybeDeferred(self.backend.create_tables, self._tables(spider))
+        if spider.settings.getbool('MYSQL_CHECK_INDEXES', True):
+            d.addCallback(lambda _: self.backend.missing_indexes(self._indexes(spider)))
+            d.addCallback(self._check_indexes)
+        return d
+
+    def close_spider(self, spider):
+        if self.backpressure:
+            self.backpressure.close()
+        if self.scheduler and self.scheduler.deadlocks:
+            self.logger.info(f'Retried {self.scheduler.deadlocks} deadlocked write batches.')
+        self.backend.close()
+
+    def _tables(self, spider) -> typing.Dict[str, typing.Tuple[list, list]]:
+        """The tables written, {name: (columns, unique columns)}, for backends that create them."""
+        if self.item_class is None:
+            return {}
+        return {spider.settings['MYSQL_EBAY_TABLE']: (self._column_fields(spider), list(self.unique_fields))}
+
+    def _column_fields(self, spider) -> list:
+        """The item fields stored in columns of ``MYSQL_EBAY_TABLE``."""
+        return [name for name, field in self.item_class.fields.items()
+                if not (field.get('exclude_insert', False) and field.get('exclude_update', False))]
+
+    def _indexes(self, spider) -> typing.Dict[str, typing.List[schema.Index]]:
+        """The indexes the upsert and the lookups rely on, {table: indexes}."""
+        indexes = [schema.Index(f'ux_{"_".join(self.unique_fields)}', tuple(self.unique_fields), unique=True)]
+        if self._lookup_fields(spider):
+            # Answers the batch lookups without reading the rows
+            indexes.append(schema.Index('ix_lookup', tuple(self.unique_fields) + tuple(self._lookup_fields(spider))))
+        return {spider.settings['MYSQL_EBAY_TABLE']: indexes}
+
+    def _check_indexes(self, missing: typing.Optional[typing.Dict[str, typing.List[schema.Index]]]):
+        """Refuse to write to tables without their unique index, and warn about the other missing indexes."""
+        for table, indexes in (missing or {}).items():
+            for index in indexes:
+                message = (f'Table {table} has no {"unique " if index.unique else ""}index on '
+                           f'({", ".join(index.columns)}), run `python run.py schema` to add it')
+                if index.unique:
+                    # The upsert would insert a duplicate row for every listing seen again
+                    raise schema.SchemaError(message)
+                self.logger.warning(message)
 
     def process_item(self, item, spider, retrying=False):
         spider.processed += 1
-        # run db query in the thread pool
-        d = self.dbpool.runInteraction(self._do_upsert, item, spider)
+        # A retry is still the same item waiting on the database
+        counted = self.backpressure is not None and not retrying
+        if counted:
+            self.backpressure.started()
+        if self.scheduler:
+            # Writes are batched per lane and deadlocks are retried with backoff by the scheduler
+            d = self.scheduler.submit(item.get(self.key_field), item)
+            retrying = True
+        else:
+            # run db query in the thread pool
+            d = self._write_batch([item], spider)
+        d.addCallback(self._record_stored, spider)
         d.addErrback(self._handle_error, item, spider, retrying=retrying)
+        if counted:
+            d.addBoth(self.backpressure.finished)
         # at the end return the item in case of success or failure
         d.addBoth(lambda _: item)
         # return the deferred instead the item. This makes the engine to
@@ -232,53 +419,96 @@ class MySQLExportPipeline(object):
         # operation (deferred) has finished.
         return d
 
-    def _pre_process(self, cur, item, spider):
+    def _record_stored(self, result, spider):
+        """Count the stored row and note how long into the crawl the first one was stored."""
+        crawler = getattr(spider, 'crawler', None)
+        if crawler is None:
+            return result
+        crawler.stats.inc_value('db/rows_stored')
+        start_time = crawler.stats.get_value('start_time')
+        if start_time and crawler.stats.get_value('db/first_row_seconds') is None:
+            # Older Scrapy versions record a naive UTC start time
+            now = datetime.datetime.now(start_time.tzinfo) if start_time.tzinfo else datetime.datetime.utcnow()
+            elapsed = now - start_time
+            crawler.stats.set_value('db/first_row_seconds', round(elapsed.total_seconds(), 3))
+        return result
+
+    def _write_batch(self, items, spider):
+        """Upsert `items` in a single transaction in the thread pool."""
+        d = self.backend.flush(self._do_upsert_batch, items, spider)
+        d.addCallback(self._count_outcomes, spider)
+        return d
+
+    def _count_outcomes(self, outcomes, spider):
+        """Count the rows inserted, updated and unchanged by a write batch in the stats."""
+        crawler = getattr(spider, 'crawler', None)
+        if crawler is not None:
+            for outcome in outcomes:
+                crawler.stats.inc_value(f'db/{outcome}')
+        return outcomes
+
+    def _do_upsert_batch(self, cur, items, spider):
+        # One lookup for the stored values of the whole batch
+        stored = {}
+        if self._lookup_fields(spider):
+            stored = self.backend.lookup(cur, spider.settings['MYSQL_EBAY_TABLE'], self.unique_fields,
+                                         self._lookup_fields(spider), [self._unique_key(i) for i in items])
+        rows = [stored.get(self.backend.key(self._unique_key(item))) for item in items]
+        self._pre_process_batch(cur, items, spider, rows)
+        return [self._do_upsert(cur, item, spider, row) for item, row in zip(items, rows)]
+
+    def _lookup_fields(self, spider) -> list:
+        """Stored fields that `_pre_process()` needs, looked up in bulk for each batch."""
+        return []
+
+    def _unique_key(self, item) -> tuple:
+        return tuple(item.get(name) for name in self.unique_fields)
+
+    def _pre_process_batch(self, cur, items, spider, stored):
+        """Perform any writes the whole batch needs before its items are stored, e.g. to other tables.
+        `stored` has the `_lookup_fields()` of the stored row of each item, or None.
+        This is intended to be overridden as needed.
+        """
+        pass
+
+    def _pre_process(self, cur, item, spider, stored=None):
         """Perform any additional changes on item prior to storing it.
+        `stored` has the `_lookup_fields()` of the stored row, if there is one.
         This is intended to be overridden as needed.
         """
         pass
 
-    def _do_upsert(self, cur, item, spider):
-        """Perform an insert or update."""
-
-        self._pre_process(cur, item, spider)
-
-        # Adapt this [insert...on duplicate key update] approach from the following
-        # https://chartio.com/resources/tutorials/how-to-insert-if-row-does-not-exist-upsert-in-mysql/
-        # http://www.mysqltutorial.org/mysql-insert-or-update-on-duplicate-key-update/
-        # https://pynative.com/python-mysql-execute-parameterized-query-using-prepared-statement/
-        # In order to take advantage of this approach, there needs to be not only a composite
-        # index on (source, source_id) but also a unique index on the same combination.
-
-        # Loop through field specs to generate the parameterized query
-        sets = ', '.join([f'@{name} = %s' for name in item])
-        params = tuple(item.values())
-        insert_fields = ', '.join([name for name in item if not item.fields[name].get('exclude_insert', False)])
-        insert_values = ', '.join([f'@{name}' for name in item if not item.fields[name].get('exclude_insert', False)])
-        updates = ', '.join([f'{name} = @{name}'
-                             for name in item if not item.fields[name].get('exclude_update', False)])
-        table = spider.settings['MYSQL_EBAY_TABLE']
-        query = f'''
-            SET {sets};
-            INSERT INTO {table}
-                ({insert_fields})
-            VALUES
-                ({insert_values})
-            ON DUPLICATE KEY UPDATE
-                {updates};
-        '''
-
-        cur.execute(query, params)
-        # If rows affected == 1, it was a new insert
-        # If rows affected == 2, it was an update
-        # If rows affected == 0, nothing was changed
-        self.logger.debug(f'Stored item {item.get("source_id")} to database')
+    def _do_upsert(self, cur, item, spider, stored=None) -> str:
+        """Perform an insert or update.  Returns 'inserted', 'updated' or 'unchanged'."""
+
+        self._pre_process(cur, item, spider, stored)
+
+        outcome = self.backend.execute_upsert(cur, *self._upsert_query(item, spider))
+        self.logger.debug('Stored item %s to database', item.get('source_id'))
+        return outcome or self._outcome(stored)
+
+    def _outcome(self, stored) -> str:
+        """Tell an insert from an update by the lookup, for backends whose result doesn't."""
+        return 'inserted' if stored is None else 'updated'
+
+    def _upsert_query(self, item, spider) -> typing.Tuple[str, tuple]:
+        """Build the parameterized insert/update query for `item`."""
+        return self.backend.upsert_query(spider.settings['MYSQL_EBAY_TABLE'], item,
+                                         self._stored_fields(item, spider), self.unique_fields)
+
+    def _stored_fields(self, item, spider) -> list:
+        """Names of the fields of `item` to write to the table."""
+        return list(item)
+
+    def _is_deadlock(self, failure) -> bool:
+        """Check whether the failure is a deadlock that can be retried."""
+        return self.backend.is_deadlock(failure)
 
     def _handle_error(self, failure, item, spider, retrying):
         """Handle occurred on db interaction."""
         try:
             # Check for deadlock
-            if failure.type is MySQLdb._exceptions.OperationalError and failure.value.args[0] == 1213:
+            if self._is_deadlock(failure):
                 if not retrying:
                     spider.logger.debug('Got a database deadlock...retrying transaction.')
                     return self.process_item(item, spider, retrying=True)
@@ -288,6 +518,9 @@ class MySQLExportPipeline(object):
             spider.logger.warning(f'Failure in database retry logic: {e}')
         spider.errors += 1
         self.logger.error(f'Error writing to the database: {failure}')
+        if 'write_error' in item.fields:
+            # The item still goes on, so the later pipelines can tell it wasn't stored
+            item['write_error'] = failure.getErrorMessage()
 
 
 class EbayMySQLExportPipeline(MySQLExportPipeline):
@@ -296,24 +529,237 @@ class EbayMySQLExportPipeline(MySQLExportPipeline):
     """
 
     key_field = 'source_id'
-
-    def _pre_process(self, cur, item, spider):
-        # Tap the table to see if the row is already there to get the `price`
-        table = spider.settings['MYSQL_EBAY_TABLE']
-        cur.execute(f'''
-            SELECT price, date_price_reduced 
-            FROM {table}
-            WHERE source = %s and source_id = %s;
-        ''', (item.get('source'), item.get('source_id')))
-        rv = cur.fetchone()
+    unique_fields = ('source', 'source_id')
+    item_class = EbayListingItem
+    # Whether a price below the stored one is dated as a price drop, rather than keeping the stored date
+    dates_price_drops = True
+
+    def _pre_process_batch(self, cur, items, spider, stored):
+        for description in self._description_rows(items, spider, stored):
+            self.backend.insert_ignore(cur, spider.settings['MYSQL_DESCRIPTION_TABLE'], description)
+
+    def _pre_process(self, cur, item, spider, stored=None):
+        # `stored` has the `price` of the row if it is already there
+        self._apply_existing(item, stored)
+
+    def _lookup_fields(self, spider) -> list:
+        """The stored values `_apply_existing()` and `_description_row()` need."""
+        if spider.settings.get('MYSQL_DESCRIPTION_TABLE'):
+            return ['price', 'date_price_reduced', 'title_type', 'details_hash']
+        return ['price', 'date_price_reduced', 'title_type']
+
+    def _column_fields(self, spider) -> list:
+        fields = super()._column_fields(spider)
+        if not spider.settings.get('MYSQL_DESCRIPTION_TABLE'):
+            # Only rows referencing a description in the side table have a hash
+            fields.remove('details_hash')
+        return fields
+
+    def _tables(self, spider):
+        tables = super()._tables(spider)
+        if spider.settings.get('MYSQL_DESCRIPTION_TABLE'):
+            tables[spider.settings['MYSQL_DESCRIPTION_TABLE']] = (['hash', 'body'], ['hash'])
+        return tables
+
+    def _apply_existing(self, item, rv):
+        """Carry values over from the stored row `rv`, if there is one."""
         if rv:
             old_price = rv[0]
             # If the price has decreased, set the item['date_price_reduced'] to current UTC datetime
-            if item.get('price') and float(item.get('price')) < old_price:
-                self.logger.debug('Price drop for ebay id {} from {} to {}. Setting date_price_reduced to {}'.format(item.get('source_id'), old_price, item.get('price'), datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")))
+            if self.dates_price_drops and item.get('price') and float(item.get('price')) < old_price:
                 item["date_price_reduced"] = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+                self.logger.debug('Price drop for ebay id %s from %s to %s. Setting date_price_reduced to %s',
+                                  item.get('source_id'), old_price, item.get('price'), item['date_price_reduced'])
             else:
                 item['date_price_reduced'] = rv[1]
+            if 'details' not in item and rv[2] == 'Salvage' and item.get('title_type'):
+                # Possibly found in the description, which a refresh without it can't contradict
+                item['title_type'] = rv[2]
+
+    def _description_row(self, item, spider, rv) -> typing.Optional[dict]:
+        """Build the row to store the description in ``MYSQL_DESCRIPTION_TABLE``.
+
+        Descriptions are keyed by a hash of their content and compressed, so shared
+        boilerplate is stored once.  Returns None when there is nothing new to store.
+        """
+        table = spider.settings.get('MYSQL_DESCRIPTION_TABLE')
+        if not table or not item.get('details'):
+            return None
+        details = item['details'].encode()
+        item['details_hash'] = hashlib.sha1(details).hexdigest()
+        if rv and rv[3] == item['details_hash']:
+            # Unchanged since the listing was last stored
+            return None
+        return {'hash': item['details_hash'],
+                'body': utils.compress(details, spider.settings.getint('MYSQL_DESCRIPTION_COMPRESSION_LEVEL', 6))}
+
+    def _description_rows(self, items, spider, stored) -> typing.List[dict]:
+        """The new `_description_row()` of each description in a batch, once per hash, in hash order.
+
+        Every transaction takes the locks on the side table's key in the same
+        order, so concurrent batches sharing descriptions don't deadlock.
+        """
+        rows = {}
+        for item, rv in zip(items, stored):
+            row = self._description_row(item, spider, rv)
+            if row:
+                rows[row['hash']] = row
+        return [rows[key] for key in sorted(rows)]
+
+    def _stored_fields(self, item, spider) -> list:
+        if spider.settings.get('MYSQL_DESCRIPTION_TABLE'):
+            # The description lives in the side table, referenced by `details_hash`
+            return [name for name in item if name != 'details']
+        return list(item)
+
+
+class AsyncMySQLExportPipeline(MySQLExportPipeline):
+    """A pipeline to store the item in a MySQL database.
+    This implementation runs on the asyncio reactor with the `aiomysql` driver,
+    so no item has to hop to a thread pool thread.
+
+    Requires ``TWISTED_REACTOR = 'twisted.internet.asyncioreactor.AsyncioSelectorReactor'``.
+    The `_pre_process()` and `_do_upsert()` extension points are coroutines here.
+    """
+
+    def __init__(self, dbargs, *args, **kwargs):
+        self.dbargs = dbargs
+        self.health_check = dbargs.pop('health_check', True)
+        # Only builds the queries; the aiomysql pool is opened with the spider
+        super().__init__(MySQLBackend(None), *args, **kwargs)
+
+    @classmethod
+    def from_settings(cls, settings):
+        # Only process items if requested to do so
+        if not settings.get('MYSQL_ENABLED', False):
+            log = logging.getLogger(cls.__name__)
+            log.info(f'MySQL export is disabled.  Feeds are going to {settings["FEED_URI"]}')
+            return None
+        if aiomysql is None:
+            raise NotConfigured('The aiomysql package is required for the async MySQL pipeline.')
+
+        dbargs = dict(
+            host=settings['MYSQL_HOST'],
+            db=settings['MYSQL_DBNAME'],
+            user=settings['MYSQL_USER'],
+            password=settings['MYSQL_PASSWD'],
+            port=settings['MYSQL_PORT'],
+            charset='utf8',
+            use_unicode=True,
+            # The upsert query is sent as multiple statements
+            client_flag=pymysql.constants.CLIENT.MULTI_STATEMENTS,
+            minsize=settings.getint('MYSQL_POOL_MINSIZE', 1),
+            maxsize=settings.getint('MYSQL_POOL_MAXSIZE', 10),
+            pool_recycle=settings.getint('MYSQL_POOL_RECYCLE', -1),
+            health_check=settings.getbool('MYSQL_POOL_HEALTH_CHECK', True),
+        )
+        return cls(dbargs)
+
+    def open_spider(self, spider):
+        super().open_spider(spider)
+        return defer.Deferred.fromFuture(asyncio.ensure_future(self._open_pool(spider)))
+
+    def close_spider(self, spider):
+        super().close_spider(spider)
+        return defer.Deferred.fromFuture(asyncio.ensure_future(self._close_pool()))
+
+    async def _open_pool(self, spider):
+        self.dbpool = await aiomysql.create_pool(**self.dbargs)
+        if spider.settings.getbool('MYSQL_CHECK_INDEXES', True):
+            self._check_indexes(await self._missing_indexes(self._indexes(spider)))
+
+    async def _missing_indexes(self, indexes) -> dict:
+        """Find which of the `indexes` the tables lack, like `MySQLBackend.missing_indexes()`."""
+        missing = {}
+        async with self.dbpool.acquire() as conn:
+            async with conn.cursor() as cur:
+                for table, required in indexes.items():
+                    await cur.execute(*schema.indexes_query(table))
+                    missing[table] = schema.missing_indexes(required, schema.existing_indexes(await cur.fetchall()))
+        return missing
+
+    async def _close_pool(self):
+        self.dbpool.close()
+        await self.dbpool.wait_closed()
+
+    def _write_batch(self, items, spider):
+        """Upsert `items` in a single transaction on the event loop."""
+        d = defer.Deferred.fromFuture(asyncio.ensure_future(self._run_interaction(items, spider)))
+        d.addCallback(self._count_outcomes, spider)
+        return d
+
+    async def _run_interaction(self, items, spider):
+        """Run `_do_upsert()` for `items` in a transaction, like `adbapi.ConnectionPool.runInteraction()`."""
+        async with self.dbpool.acquire() as conn:
+            if self.health_check:
+                await conn.ping(reconnect=True)
+            try:
+                async with conn.cursor() as cur:
+                    stored = await self._lookup(cur, items, spider)
+                    rows = [stored.get(self.backend.key(self._unique_key(item))) for item in items]
+                    await self._pre_process_batch(cur, items, spider, rows)
+                    outcomes = [await self._do_upsert(cur, item, spider, row) for item, row in zip(items, rows)]
+                await conn.commit()
+                return outcomes
+            except Exception:
+                await conn.rollback()
+                raise
+
+    async def _lookup(self, cur, items, spider) -> dict:
+        """Look up the `_lookup_fields()` of the stored rows of `items`, like `StorageBackend.lookup()`."""
+        stored = {}
+        fields = self._lookup_fields(spider)
+        if not fields:
+            return stored
+        keys = list({self._unique_key(item) for item in items})
+        for batch in utils.batches(keys, self.backend.lookup_batch_size):
+            await cur.execute(*self.backend.lookup_query(
+                spider.settings['MYSQL_EBAY_TABLE'], self.unique_fields, fields, batch))
+            stored.update(self.backend.stored_rows(await cur.fetchall(), self.unique_fields))
+        return stored
+
+    async def _pre_process_batch(self, cur, items, spider, stored):
+        """Perform any writes the whole batch needs before its items are stored.
+        This is intended to be overridden as needed.
+        """
+        pass
+
+    async def _pre_process(self, cur, item, spider, stored=None):
+        """Perform any additional changes on item prior to storing it.
+        This is intended to be overridden as needed.
+        """
+        pass
+
+    async def _do_upsert(self, cur, item, spider, stored=None) -> str:
+        """Perform an insert or update.  Returns 'inserted', 'updated' or 'unchanged'."""
+
+        await self._pre_process(cur, item, spider, stored)
+
+        query, params = self._upsert_query(item, spider)
+        await cur.execute(query, params)
+        # The affected rows are those of the INSERT, after the SET statement
+        while await cur.nextset():
+            pass
+        self.logger.debug('Stored item %s to database', item.get('source_id'))
+        return self.backend.OUTCOMES.get(cur.rowcount) or self._outcome(stored)
+
+    def _is_deadlock(self, failure) -> bool:
+        """Check whether the failure is a MySQL deadlock (error 1213)."""
+        return failure.type is pymysql.err.OperationalError and failure.value.args[0] == 1213
+
+
+class EbayAsyncMySQLExportPipeline(AsyncMySQLExportPipeline, EbayMySQLExportPipeline):
+    """
+    Asyncio pipeline for MySQL storage with overrides for EBay-specific logic.
+    """
+
+    async def _pre_process_batch(self, cur, items, spider, stored):
+        for description in self._description_rows(items, spider, stored):
+            await cur.execute(*self.backend.insert_ignore_query(spider.settings['MYSQL_DESCRIPTION_TABLE'], description))
+
+    async def _pre_process(self, cur, item, spider, stored=None):
+        # `stored` has the `price` of the row if it is already there
+        self._apply_existing(item, stored)
 
 
 class ItemEaterPipeline(object):
@@ -0,0 +1,99 @@
+"""
+Named search profiles, each a set of search filters with its own run timestamp.
+
+``EBAY_SEARCH_PROFILES`` lists them as dicts, e.g.::
+
+    EBAY_SEARCH_PROFILES = [
+        {'name': 'trucks',
+         'item_filters': [{'name': 'ModTimeFrom', 'value': '{prior_run_date}'}],
+         'aspect_filters': [{'aspectName': 'Body Type', 'aspectValueName': 'Pickup Truck'}]},
+        {'name': 'west', 'timestamp_path': '/var/lib/ebay/lastrun-west.txt',
+         'item_filters': [...]},
+    ]
+
+A profile may also set its ``sort_order`` (default ``EndTimeSoonest``).
+Missing ``item_filters``/``aspect_filters`` default to ``EBAY_SEARCH_ITEM_FILTERS``/
+``EBAY_SEARCH_ASPECT_FILTERS``, and a missing ``timestamp_path`` to ``lastrun-<name>.txt``
+next to ``EBAY_SEARCH_TIMESTAMP_PATH``.  With no profiles configured there is a single
+``default`` profile with the filters and timestamp file from the settings, as before.
+"""
+import os
+import pathlib
+import typing
+
+# The filter ending a search window at its current run date, by the filter starting it at the prior run date.
+# ModTimeFrom has no counterpart, so a ModTimeFrom search always runs up to the time it is made.
+WINDOW_END_FILTERS = {'StartTimeFrom': 'StartTimeTo', 'EndTimeFrom': 'EndTimeTo'}
+
+
+class SearchProfile(object):
+    """A named search, with the prior run date read from its own timestamp file."""
+
+    def __init__(self, name: str, item_filters: list = None, aspect_filters: list = None,
+                 timestamp_path: typing.Union[str, os.PathLike] = None, sort_order: str = 'EndTimeSoonest'):
+        self.name = name
+        self.item_filters = item_filters or []
+        self.aspect_filters = aspect_filters or []
+        self.timestamp_path = timestamp_path
+        self.sort_order = sort_order
+        self.prior_run_date = None
+        # End of the search window, None for this run's EbayRequest.current_run_date
+        self.current_run_date = None
+        # Search errors, which keep this profile's timestamp from being updated
+        self.errors = 0
+        # Pages or listings left for a later run without a resume queue, which also keep the timestamp
+        self.deferred = 0
+
+    def __repr__(self):
+        return f'<SearchProfile {self.name}>'
+
+    def window(self, prior_run_date: str, current_run_date: str) -> 'SearchProfile':
+        """A copy of this profile searching from `prior_run_date` to `current_run_date`, without a timestamp file."""
+        profile = SearchProfile(self.name, self.item_filters, self.aspect_filters, sort_order=self.sort_order)
+        profile.prior_run_date = prior_run_date
+        profile.current_run_date = current_run_date
+        return profile
+
+    def bounded(self) -> bool:
+        """Whether the search of an earlier window can end where the window ended, so its pages stay put."""
+        starts = [f.get('name') for f in self.item_filters if '{prior_run_date}' in str(f.get('value', ''))]
+        return bool(starts) and all(name in WINDOW_END_FILTERS for name in starts)
+
+    def load_prior_run_date(self, default: str) -> str:
+        """Read the prior run date from the timestamp file, or use `default` if there is none."""
+        self.prior_run_date = default
+        if self.timestamp_path and os.path.isfile(self.timestamp_path):
+            self.prior_run_date = open(self.timestamp_path).read()
+        return self.prior_run_date
+
+    def save_run_date(self, run_date: str):
+        """Record `run_date` as the prior run date for the next run."""
+        if self.timestamp_path:
+            open(self.timestamp_path, 'w').write(run_date)
+
+
+def search_profiles(settings) -> typing.List[SearchProfile]:
+    """Build the search profiles from ``EBAY_SEARCH_PROFILES``, or the default profile."""
+    item_filters = settings.getlist('EBAY_SEARCH_ITEM_FILTERS')
+    aspect_filters = settings.getlist('EBAY_SEARCH_ASPECT_FILTERS')
+    timestamp_path = settings.get('EBAY_SEARCH_TIMESTAMP_PATH')
+    configured = settings.getlist('EBAY_SEARCH_PROFILES')
+    if not configured:
+        return [SearchProfile('default', item_filters, aspect_filters, timestamp_path)]
+
+    profiles = []
+    for config in configured:
+        name = config['name']
+        path = config.get('timestamp_path')
+        if not path and timestamp_path:
+            path = pathlib.Path(timestamp_path).with_name(f'{pathlib.Path(timestamp_path).stem}-{name}.txt')
+        profiles.append(SearchProfile(
+            name,
+            config.get('item_filters', item_filters),
+            config.get('aspect_filters', aspect_filters),
+            path,
+            config.get('sort_order', 'EndTimeSoonest'),
+        ))
+    if len({p.name for p in profiles}) != len(profiles):
+        raise ValueError('EBAY_SEARCH_PROFILES names must be unique')
+    return profiles
@@ -1,5 +1,6 @@
 import arrow
 import base64
+import copy
 import scrapy
 import urllib.parse
 try:
@@ -10,6 +11,7 @@ except ImportError:
 
 import tests
 from ebay_motors import utils
+from ebay_motors.profiles import SearchProfile, WINDOW_END_FILTERS
 
 
 class EbayRequest(JsonRequest):
@@ -59,7 +61,12 @@ class EbayRequest(JsonRequest):
         )
 
     @classmethod
-    def search(cls, settings, page: int = 1, *args, **kwargs) -> scrapy.Request:
+    def search(cls, settings, page: int = 1, profile: SearchProfile = None, *args, **kwargs) -> scrapy.Request:
+        """Search with the filters of `profile`, or those in the settings.
+
+        The filters are formatted on a copy, so the same templates are used for every
+        page and profile.
+        """
         # Check if we are `faking` the call to ebay with a canned response for testing
         if settings.get('EBAY_MOCK_SEARCH', False):
             return cls(
@@ -87,25 +94,37 @@ class EbayRequest(JsonRequest):
                 "paginationInput": {
                     "entriesPerPage": settings.get('EBAY_SEARCH_PAGESIZE', '100'),
                     "pageNumber": str(page),
-                    "sortOrder": "EndTimeSoonest",
                 }
             }
         }
-        if settings.get('EBAY_SEARCH_ITEM_FILTERS'):
+        if profile is None:
+            profile = SearchProfile('default',
+                                    settings.getlist('EBAY_SEARCH_ITEM_FILTERS'),
+                                    settings.getlist('EBAY_SEARCH_ASPECT_FILTERS'))
+        body['findItemsAdvancedRequest']['paginationInput']['sortOrder'] = profile.sort_order
+        if profile.item_filters:
             filters = []
             body['findItemsAdvancedRequest']['itemFilter'] = filters
-            for f in settings.get('EBAY_SEARCH_ITEM_FILTERS'):
+            names = {f.get('name') for f in profile.item_filters}
+            for f in copy.deepcopy(profile.item_filters):
+                window_end = None
+                if (f.get('name') in WINDOW_END_FILTERS and WINDOW_END_FILTERS[f['name']] not in names
+                        and profile.current_run_date and '{prior_run_date}' in str(f.get('value', ''))):
+                    # An earlier window ends where it ended then, so its result pages don't move
+                    window_end = {'name': WINDOW_END_FILTERS[f['name']], 'value': profile.current_run_date}
                 if isinstance(f.get('value'), str):
                     f['value'] = f.get('value').format(
-                        prior_run_date=cls.prior_run_date,
-                        current_run_date=cls.current_run_date,
+                        prior_run_date=profile.prior_run_date or cls.prior_run_date,
+                        current_run_date=profile.current_run_date or cls.current_run_date,
                         tomorrow=utils.ebay_date_format(arrow.utcnow().shift(days=1).floor('day')),
                         # Add other values here to make them available for replacement in
                         # item filters in settings
                     )
                 filters.append(f)
-        if settings.get('EBAY_SEARCH_ASPECT_FILTERS'):
-            body['findItemsAdvancedRequest']['aspectFilter'] = settings.get('EBAY_SEARCH_ASPECT_FILTERS')
+                if window_end:
+                    filters.append(window_end)
+        if profile.aspect_filters:
+            body['findItemsAdvancedRequest']['aspectFilter'] = copy.deepcopy(profile.aspect_filters)
 
         return cls(
             settings['EBAY_SEARCH_URL'],
@@ -115,8 +134,22 @@ class EbayRequest(JsonRequest):
         )
 
     @classmethod
-    def details(cls, settings, items, *args, ** kwargs) -> scrapy.Request:
+    def details(cls, settings, items, include_description: bool = None, *args, ** kwargs) -> scrapy.Request:
+        """Get the details of the search result `items`, and their descriptions if `include_description`.
+
+        `include_description` defaults to ``EBAY_DETAILS_INCLUDE_DESCRIPTION``.
+        """
+        if include_description is None:
+            include_description = settings.getbool('EBAY_DETAILS_INCLUDE_DESCRIPTION', True)
+        encoding = settings.get('EBAY_DETAILS_RESPONSE_ENCODING', 'XML')
         # Check if we are `faking` the call to ebay with a canned response for testing
+        if settings.get('EBAY_MOCK_SEARCH', False) and encoding == 'JSON':
+            return cls(
+                'https://postman-echo.com/post',
+                headers={},
+                data=tests.load_test_data('details', settings['EBAY_MOCK_SEARCH'], encoding),
+                *args, **kwargs,
+            )
         if settings.get('EBAY_MOCK_SEARCH', False):
             return cls(
                 'https://postman-echo.com/post',
@@ -128,12 +161,12 @@ class EbayRequest(JsonRequest):
 
         params = dict(
             callname='GetMultipleItems',
-            responseencoding='XML',
+            responseencoding=encoding,
             appid=settings['EBAY_CLIENT_ID'],
             siteid='100',  # ebay motors
             version='967',
             ItemID=','.join([i['itemId'][0] for i in items]),
-            IncludeSelector='TextDescription, ItemSpecifics',
+            IncludeSelector='TextDescription, ItemSpecifics' if include_description else 'ItemSpecifics',
         )
         return cls(
             settings['EBAY_DETAILS_URL'] + '?' + urllib.parse.urlencode(params),
@@ -0,0 +1,75 @@
+"""
+The resume queue: the work a run left unfinished, which the next run does first.
+
+A run that runs out of time (``EBAY_TIME_BUDGET``) or API calls (see
+`budget.py`) stops issuing requests and lets those in flight finish.  The
+search pages it didn't request and the listings it didn't fetch details for are
+then saved to the JSON file at ``EBAY_RESUME_QUEUE_PATH``.  Each page keeps the
+search window it belongs to, so its profile's timestamp can move on as usual.
+The next run searches the page with the same filters, ended at the window's
+current run date (``StartTimeTo`` for ``StartTimeFrom``, see
+`profiles.WINDOW_END_FILTERS`) so the pages haven't moved.  A ``ModTimeFrom``
+search can't be ended, so the next run extends its own search of the profile
+back to the start of the earlier window instead.
+
+The queue is only replaced when a run that loaded it closes, so the work of a
+run that dies before then is done again by the next run, which the upserts
+make harmless.
+"""
+import json
+import logging
+import os
+import typing
+
+
+class QueuedPage(typing.NamedTuple):
+    profile: str
+    page: int
+    # The search window of the run that left the page
+    prior_run_date: str
+    current_run_date: str
+
+
+# Key of each kind of detail batch in the file, by whether it includes the descriptions
+DETAIL_KINDS = {True: 'description', False: 'specifics'}
+
+
+class ResumeQueue(object):
+    """The resume queue file at `path`."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @classmethod
+    def from_settings(cls, settings) -> typing.Optional['ResumeQueue']:
+        if not settings.get('EBAY_RESUME_QUEUE_PATH'):
+            return None
+        return cls(settings['EBAY_RESUME_QUEUE_PATH'])
+
+    def load(self) -> typing.Tuple[typing.List[QueuedPage], typing.Dict[bool, list]]:
+        """The queued search pages, and the search results waiting for details by whether to include descriptions."""
+        try:
+            with open(self.path) as f:
+                queue = json.load(f)
+        except FileNotFoundError:
+            queue = {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f'Ignoring the resume queue, failed to load {self.path}: {e}')
+            queue = {}
+        pages = [QueuedPage(**page) for page in queue.get('pages', [])]
+        details = {include: queue.get('details', {}).get(kind, []) for include, kind in DETAIL_KINDS.items()}
+        return pages, details
+
+    def save(self, pages: typing.Iterable[QueuedPage], details: typing.Dict[bool, list]):
+        """Replace the queue with the `pages` and `details` left by this run, or remove it if there are none."""
+        pages = [page._asdict() for page in pages]
+        if not pages and not any(details.values()):
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'pages': pages,
+                       'details': {kind: details.get(include, []) for include, kind in DETAIL_KINDS.items()}}, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,76 @@
+"""
+An exclusive lock held for the whole of a run, so runs started by cron never overlap.
+
+Overlapping runs would upsert the same rows (and deadlock on them), spend API
+calls on the same listings, and race on the timestamp files.  `RunLock` takes a
+non-blocking lock on the file at ``RUN_LOCK_PATH``; the operating system
+releases it when the process exits, however it exits, so a crashed run never
+leaves a stale lock behind.  The file holds the pid of the run holding it.
+
+The same lock guards the short read-modify-write of files the regular and fast
+lane runs share, such as the API budget, with a `timeout` to wait for it.  The
+other files they share need no lock: the fast lane only appends to the
+snapshot's journal, and the response archive and run ledger are SQLite
+databases written in short transactions.
+"""
+import os
+import time
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LockedError(Exception):
+    """Another run holds the lock."""
+
+
+class RunLock(object):
+    """The run lock at `path`.  Use it as a context manager or `acquire()` and `release()` it."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.fd = None
+
+    def holder(self) -> str:
+        """The pid written by the run holding the lock, if any."""
+        try:
+            with open(self.path) as f:
+                return f.read().strip()
+        except OSError:
+            return ''
+
+    def acquire(self, timeout: float = 0):
+        """Take the lock, or raise `LockedError` if another run still holds it after `timeout` seconds."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise LockedError(f'{self.path} is locked by pid {self.holder() or "?"}')
+                time.sleep(0.05)
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self.fd = fd
+
+    def release(self):
+        # The file stays, removing it could let two runs each lock a different file at the same path
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,179 @@
+"""
+The MySQL schema of the listings table, derived from the item fields.
+
+Column types come from the field metadata: an explicit ``sql_type``, otherwise
+the ``serializer`` (``INT`` for ints), otherwise ``VARCHAR(255)``.  Fields that
+are neither inserted nor updated aren't columns, except the ``primary_key``.
+
+The export pipelines rely on two indexes of the listings table:
+
+- the unique index on the key fields, (source, source_id), which the
+  ``INSERT ... ON DUPLICATE KEY UPDATE`` upsert matches rows on, and
+- a covering index on the key fields followed by the looked up fields, so the
+  batch lookups of the stored price (and description hash) are answered from
+  the index alone.
+
+`migration()` builds the statements that create the tables or add the missing
+columns and indexes (``run.py schema``), and `missing_indexes()` tells which
+indexes a table lacks, so the pipelines can check them before the crawl begins.
+The ``details_hash`` column and the side table only exist with
+``MYSQL_DESCRIPTION_TABLE`` set, the listing's ``details`` column is then left
+NULL.  `description_backfill()` moves the descriptions stored before it was
+set to the side table.
+
+The table isn't partitioned by ``date_found``: MySQL requires every unique key
+to include the partitioning columns, and a unique key that includes
+``date_found`` no longer stops a listing found again on a later day from being
+inserted twice.
+"""
+import typing
+
+# Column types of the field serializers
+SERIALIZER_TYPES = {
+    int: 'INT',
+}
+
+DEFAULT_TYPE = 'VARCHAR(255)'
+
+# The side table of MYSQL_DESCRIPTION_TABLE, keyed by the SHA-1 of the description
+DESCRIPTION_COLUMNS = [('hash', 'CHAR(40) NOT NULL'), ('body', 'MEDIUMBLOB NOT NULL')]
+
+
+class SchemaError(Exception):
+    """A table lacks an index the pipelines can't work correctly without."""
+
+
+class Index(typing.NamedTuple):
+    name: str
+    columns: typing.Tuple[str, ...]
+    unique: bool = False
+
+
+class Table(typing.NamedTuple):
+    columns: typing.List[typing.Tuple[str, str]]
+    primary_key: typing.Tuple[str, ...]
+    indexes: typing.List[Index]
+
+
+def column_type(field) -> str:
+    if 'sql_type' in field:
+        return field['sql_type']
+    return SERIALIZER_TYPES.get(field.get('serializer'), DEFAULT_TYPE)
+
+
+def item_columns(item_class) -> typing.List[typing.Tuple[str, str]]:
+    """The (name, type) of the columns storing the fields of `item_class`, primary key first."""
+    fields = sorted(item_class.fields.items(), key=lambda f: not f[1].get('primary_key'))
+    return [(name, column_type(field)) for name, field in fields
+            if field.get('primary_key') or not (field.get('exclude_insert') and field.get('exclude_update'))]
+
+
+def definitions(pipeline, spider) -> typing.Dict[str, Table]:
+    """The tables written by the export `pipeline`, with the indexes it relies on."""
+    table = spider.settings['MYSQL_EBAY_TABLE']
+    fields = pipeline.item_class.fields
+    stored = pipeline._column_fields(spider)
+    tables = {
+        table: Table([(name, sql_type) for name, sql_type in item_columns(pipeline.item_class)
+                      if name in stored or fields[name].get('primary_key')],
+                     tuple(name for name, field in fields.items() if field.get('primary_key')),
+                     pipeline._indexes(spider)[table]),
+    }
+    if spider.settings.get('MYSQL_DESCRIPTION_TABLE'):
+        tables[spider.settings['MYSQL_DESCRIPTION_TABLE']] = Table(DESCRIPTION_COLUMNS, ('hash',), [])
+    return tables
+
+
+def columns_query(table: str) -> typing.Tuple[str, tuple]:
+    return '''
+        SELECT COLUMN_NAME
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        ORDER BY ORDINAL_POSITION;
+    ''', (table,)
+
+
+def indexes_query(table: str) -> typing.Tuple[str, tuple]:
+    return '''
+        SELECT INDEX_NAME, NON_UNIQUE, COLUMN_NAME
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX;
+    ''', (table,)
+
+
+def existing_indexes(rows: typing.Iterable[tuple]) -> typing.Dict[str, Index]:
+    """The indexes of a table by name, from the rows of an `indexes_query()`."""
+    indexes = {}
+    for name, non_unique, column in rows:
+        index = indexes.get(name, Index(name, (), not int(non_unique)))
+        indexes[name] = index._replace(columns=index.columns + (column,))
+    return indexes
+
+
+def covers(existing: Index, required: Index) -> bool:
+    """Check whether an `existing` index does the job of the `required` one."""
+    if required.unique:
+        return existing.unique and set(existing.columns) == set(required.columns)
+    return existing.columns[:len(required.columns)] == required.columns
+
+
+def missing_indexes(required: typing.Iterable[Index], existing: typing.Dict[str, Index]) -> typing.List[Index]:
+    return [index for index in required if not any(covers(e, index) for e in existing.values())]
+
+
+def _index_definition(index: Index) -> str:
+    return f'{"UNIQUE " if index.unique else ""}INDEX {index.name} ({", ".join(index.columns)})'
+
+
+def create_table(name: str, table: Table) -> str:
+    definitions = [f'{column} {sql_type}' for column, sql_type in table.columns]
+    if table.primary_key:
+        definitions.append(f'PRIMARY KEY ({", ".join(table.primary_key)})')
+    definitions.extend(_index_definition(index) for index in table.indexes)
+    return f'CREATE TABLE {name} (\n    ' + ',\n    '.join(definitions) + '\n) ENGINE=InnoDB DEFAULT CHARSET=utf8'
+
+
+def migration(cur, tables: typing.Dict[str, Table]) -> typing.List[str]:
+    """The statements that create the `tables`, or add their missing columns and indexes.
+
+    Existing columns are left as they are, and an existing index with the name of
+    a missing one is replaced.
+    """
+    statements = []
+    for name, table in tables.items():
+        cur.execute(*columns_query(name))
+        columns = [row[0] for row in cur.fetchall()]
+        if not columns:
+            statements.append(create_table(name, table))
+            continue
+        cur.execute(*indexes_query(name))
+        existing = existing_indexes(cur.fetchall())
+        changes = [f'ADD COLUMN {column} {sql_type}' for column, sql_type in table.columns if column not in columns]
+        for index in missing_indexes(table.indexes, existing):
+            if index.name in existing:
+                changes.append(f'DROP INDEX {index.name}')
+            changes.append(f'ADD {_index_definition(index)}')
+        if changes:
+            statements.append(f'ALTER TABLE {name}\n    ' + ',\n    '.join(changes))
+    return statements
+
+
+def description_backfill(table: str, description_table: str) -> typing.List[str]:
+    """The statements that move the descriptions still in the ``details`` column of `table` to `description_table`.
+
+    MySQL's ``SHA1()`` and ``COMPRESS()`` give the same hash and body as the
+    export pipeline.  Listings stored before the side table existed get their
+    ``details_hash``, and ``details`` is cleared once the row it references is
+    in the side table, which also clears the stale descriptions of listings
+    refreshed since.
+    """
+    return [
+        f'INSERT IGNORE INTO {description_table} (hash, body)\n'
+        f'    SELECT SHA1(details), COMPRESS(details) FROM {table}\n'
+        f'    WHERE details IS NOT NULL AND details_hash IS NULL',
+        f'UPDATE {table} SET details_hash = SHA1(details)\n'
+        f'    WHERE details IS NOT NULL AND details_hash IS NULL',
+        f'UPDATE {table} JOIN {description_table} ON {description_table}.hash = {table}.details_hash\n'
+        f'    SET {table}.details = NULL WHERE {table}.details IS NOT NULL',
+    ]
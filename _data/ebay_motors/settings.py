@@ -15,15 +15,51 @@ DEFAULT_REQUEST_HEADERS = {
 ITEM_PIPELINES = {
    'ebay_motors.pipelines.EbayListingCleanserPipeline': 300,
    'ebay_motors.pipelines.EbayMySQLExportPipeline': 310,
+   'ebay_motors.snapshot.SnapshotPipeline': 315,
    # 'ebay_motors.pipelines.ItemEaterPipeline': 320,
 }
 
 MYSQL_ENABLED = True
+# Where the export pipelines store items, see ebay_motors/storage.py:
+#   ebay_motors.storage.MySQLBackend  - the MySQL server below
+#   ebay_motors.storage.SQLiteBackend - a local SQLite file in WAL mode at SQLITE_PATH, with the same tables
+STORAGE_BACKEND = 'ebay_motors.storage.MySQLBackend'
+SQLITE_PATH = project_dir / 'ebay.sqlite3'
+SQLITE_BUSY_TIMEOUT = 5.0  # seconds to wait for another writer before failing
 MYSQL_HOST = ''
 MYSQL_DBNAME = ''
 MYSQL_USER = ''
 MYSQL_PASSWD = ''
 MYSQL_EBAY_TABLE = 'cars'
+# Check at startup that the tables have the indexes the upsert and lookups rely on (see `run.py schema`)
+MYSQL_CHECK_INDEXES = True
+# Connection pool for the asyncio pipelines (AsyncMySQLExportPipeline and subclasses)
+MYSQL_POOL_MINSIZE = 1
+MYSQL_POOL_MAXSIZE = 10
+MYSQL_POOL_RECYCLE = 3600  # seconds before a connection is replaced, -1 to disable
+MYSQL_POOL_HEALTH_CHECK = True  # ping (and reconnect) each connection as it is taken from the pool
+# Writes are spread over lanes by hashing source_id; each lane writes one batch at a time,
+# sorted by key, so concurrent upserts don't deadlock on neighbouring index gaps.
+MYSQL_WRITE_LANES = 4  # 0 writes each item in its own transaction
+MYSQL_WRITE_BATCH_SIZE = 50  # max rows per lane transaction
+MYSQL_DEADLOCK_RETRIES = 5
+MYSQL_DEADLOCK_BACKOFF = 0.1  # seconds, doubled on each retry
+MYSQL_DEADLOCK_MAX_BACKOFF = 5.0
+# Pause the crawl while this many items wait on the database, until the writes bring them down to
+# the low-water mark, so a slow database doesn't fill memory with items.  0 to disable.
+MYSQL_BACKPRESSURE_HIGH_WATER = 500
+MYSQL_BACKPRESSURE_LOW_WATER = 250
+# Store descriptions compressed in a side table keyed by content hash (MYSQL_EBAY_TABLE.details_hash)
+# instead of in MYSQL_EBAY_TABLE.details, which is then left NULL: read them with UNCOMPRESS(body) joined on
+# details_hash.  Empty to keep them in MYSQL_EBAY_TABLE, without a details_hash column.
+MYSQL_DESCRIPTION_TABLE = ''
+MYSQL_DESCRIPTION_COMPRESSION_LEVEL = 6  # zlib level 1..9
+# Memory-mapped snapshot of the listings for queries that don't touch MySQL (`run.py snapshot`),
+# merged with the items of each run.  Empty to disable.
+SNAPSHOT_PATH = project_dir / 'listings.snapshot'
+# Only append the items to the snapshot's journal (SNAPSHOT_PATH.journal), which the next run without it merges.
+# For runs alongside the regular ones, such as the fast lane, so they don't rewrite the snapshot under them.
+SNAPSHOT_JOURNAL_ONLY = False
 
 EBAY_CLIENT_ID = ''
 EBAY_CLIENT_SECRET = ''
@@ -61,15 +97,114 @@ EBAY_SEARCH_ASPECT_FILTERS = [
     # {"aspectName": "Vehicle Mileage", "aspectValueName": "Less than 36,000 miles"},
     # {"aspectName": "Exterior Color", "aspectValueName": ["Black", "White"]}
 ]
+# Named search profiles run concurrently in one crawl, each with its own timestamp file.
+# Listings found by more than one profile are only fetched and stored once.
+# See ebay_motors/profiles.py; when empty the filters above and EBAY_SEARCH_TIMESTAMP_PATH are used.
+EBAY_SEARCH_PROFILES = []
 EBAY_SEARCH_PAGESIZE = '100'  # number of items per page in search results 1..100
-EBAY_DETAILS_URL = 'http://open.api.ebay.com/shopping'
+EBAY_DETAILS_URL = 'https://open.api.ebay.com/shopping'
+EBAY_DETAILS_RESPONSE_ENCODING = 'XML'  # XML or JSON, both produce the same items
+EBAY_DETAILS_INCLUDE_DESCRIPTION = True  # False skips fetching (and updating) descriptions
+# Only fetch descriptions for listings that aren't in the snapshot (SNAPSHOT_PATH) yet, or whose description
+# was last fetched more than EBAY_DETAILS_DESCRIPTION_REFRESH_DAYS ago (0 never refreshes them).
+# The others get a lighter ItemSpecifics-only detail call.  The snapshot is also loaded without this when
+# EBAY_DAILY_CALL_LIMITS are set, to tell the unchanged listings a tight budget defers from the rest.
+EBAY_DETAILS_TIERED = True
+EBAY_DETAILS_DESCRIPTION_REFRESH_DAYS = 30
+# How listings are cleansed before storage:
+#   item  - one at a time by EbayListingCleanserPipeline
+#   batch - all listings from a detail response at once, with vectorized numeric rules (requires numpy, else as item)
+#   process - detail responses are parsed and their listings cleansed in worker processes
+EBAY_CLEANSER_MODE = 'item'
+EBAY_WORKER_PROCESSES = 0  # worker processes for the process mode, 0 for one per CPU
+EBAY_WORKER_MAX_IN_FLIGHT = 0  # detail responses handed to the workers at once, 0 for twice the processes
+
+# Detail requests are scheduled ahead of further search pages, and search pages are only
+# requested while fewer than EBAY_MAX_DETAIL_BACKLOG detail batches are outstanding
+# (counting the batches expected from pages in flight), so listings reach the database early
+# and search results don't accumulate in memory
+EBAY_SEARCH_PRIORITY = 0
+EBAY_DETAILS_PRIORITY = 10
+EBAY_MAX_DETAIL_BACKLOG = 50
+
+# Daily API call limits per endpoint (finding: searches, shopping: detail calls), which eBay resets at
+# midnight Pacific time.  The calls of the day are kept in EBAY_BUDGET_PATH (empty to disable), see
+# ebay_motors/budget.py.  With pacing, each run only spends the share of the day that has passed by the next
+# run, EBAY_BUDGET_RUN_INTERVAL minutes from now.  When a run's searches predict more detail calls than it
+# has, only new listings and price changes are fetched; search pages and listings beyond the budget are
+# left to a later run.
+EBAY_BUDGET_PATH = project_dir / 'api_budget.json'
+EBAY_DAILY_CALL_LIMITS = {'finding': 5000, 'shopping': 5000}
+EBAY_BUDGET_PACING = True
+EBAY_BUDGET_RUN_INTERVAL = 15
+
+# Minutes after which a run stops issuing requests and finishes those in flight, 0 for no limit
+# (run.py --time-budget).  The search pages and listings left, by this or by the API budget, are saved to
+# EBAY_RESUME_QUEUE_PATH for the next run to do first, see ebay_motors/resume.py.  Without a resume queue
+# (empty), the profiles keep their timestamps and the next run searches their window again.
+EBAY_TIME_BUDGET = 0
+EBAY_RESUME_QUEUE_PATH = project_dir / 'resume_queue.json'
+# Held by run.py for the whole run, so runs of a spider never overlap, see ebay_motors/runlock.py.
+# {spider} is replaced with the spider name, so the fast lane polls alongside the regular runs.  The files both
+# write are shared safely: EBAY_BUDGET_PATH is saved under a lock, the fast lane only appends to the journal of
+# SNAPSHOT_PATH, and ARCHIVE_DIR gets segments per run and a short index transaction per record.  Empty to disable.
+RUN_LOCK_PATH = project_dir / 'run-{spider}.lock'
+
+# The fast lane (`run.py ebay_fast`, see ebay_motors/spiders/fast_lane.py) polls for the listings started
+# since the newest one it has seen, kept in EBAY_FAST_LANE_STATE_PATH, and stops paging at the first one seen
+# before.  The first poll looks back EBAY_FAST_LANE_LOOKBACK minutes, and no poll reads more than
+# EBAY_FAST_LANE_MAX_PAGES pages; the regular runs pick up anything older.
+EBAY_FAST_LANE_STATE_PATH = project_dir / 'fast_lane.json'
+EBAY_FAST_LANE_LOOKBACK = 60
+EBAY_FAST_LANE_MAX_PAGES = 5
+EBAY_FAST_LANE_ITEM_FILTERS = [
+    {"name": "LocatedIn", "value": ["US", "CA"]},
+    {"name": "StartTimeFrom", "value": "{prior_run_date}"},
+    {"name": "ListingType", "value": ["AuctionWithBIN", "Classified", "FixedPrice"]},
+]
+
+# Use the asyncio reactor to run the asyncio MySQL pipeline, i.e.
+#   ITEM_PIPELINES = {..., 'ebay_motors.pipelines.EbayAsyncMySQLExportPipeline': 310}
+#TWISTED_REACTOR = 'twisted.internet.asyncioreactor.AsyncioSelectorReactor'
+
+# Transport profile for the eBay endpoints, see ebay_motors/transport.py
+# Responses are requested compressed (Accept-Encoding) and decoded by HttpCompressionMiddleware
+COMPRESSION_ENABLED = True
+# Keep-alive connections are pooled per host
+DOWNLOAD_HANDLERS = {
+    'http': 'ebay_motors.transport.TransportProfileDownloadHandler',
+    'https': 'ebay_motors.transport.TransportProfileDownloadHandler',
+}
+EBAY_MAX_CONNECTIONS_PER_HOST = 8  # idle connections kept per host, defaults to CONCURRENT_REQUESTS_PER_DOMAIN
+EBAY_CONNECTION_IDLE_TIMEOUT = 240  # seconds
+EXTENSIONS = {
+    'ebay_motors.transport.TransportStats': 500,
+    'ebay_motors.ledger.RunLedger': 510,
+    'ebay_motors.archive.ResponseArchive': 520,
+}
+# Each run is recorded in this SQLite database for `run.py report`, empty to disable
+RUN_LEDGER_PATH = project_dir / 'runs.sqlite3'
+# Raw search and detail responses are appended, compressed, to segment files in this directory, for
+# `run.py reprocess` to apply new parsing and cleansing rules without calling the API again, see
+# ebay_motors/archive.py.  Empty to disable.
+ARCHIVE_DIR = ''
+ARCHIVE_SEGMENT_BYTES = 16 * 1024 * 1024  # a new segment is started after this many bytes
+ARCHIVE_COMPRESSION_LEVEL = 6  # zlib level 1..9
+
+# Log records are queued and written by a background thread when running with run.py
+LOG_QUEUE_ENABLED = True
+# Records below WARNING are limited to LOG_RATE_LIMIT per call site every LOG_RATE_PERIOD seconds,
+# the dropped ones are counted and summarized at the end of the run.  0 disables the limit.
+LOG_RATE_LIMIT = 20
+LOG_RATE_PERIOD = 10.0
 
 RETRY_ENABLED = True
 RETRY_TIMES = 1
 
-#SPIDER_MIDDLEWARES = {
+SPIDER_MIDDLEWARES = {
 #    'ebay_motors.middlewares.EbayMotorsSpiderMiddleware': 543,
-#}
+    'ebay_motors.middlewares.EbayListingBatchCleanserMiddleware': 550,
+}
 #DOWNLOADER_MIDDLEWARES = {
 #    'ebay_motors.middlewares.EbayMotorsDownloaderMiddleware': 543,
 #}
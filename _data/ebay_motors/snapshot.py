@@ -0,0 +1,416 @@
+"""
+A memory-mapped snapshot of the listings, for lookups that don't touch MySQL.
+
+The snapshot is a single file at ``SNAPSHOT_PATH`` with a column per listing
+attribute, all fixed width:
+
+- numeric columns (``NUMERIC``) hold the values, with ``NULL`` for missing ones,
+- categorical columns (``CATEGORICAL``) hold codes into a dictionary of their
+  distinct values, stored in the header,
+
+and each column has a sorted index, the row numbers in the order of its values.
+A filter on a column is a binary search of its index, so `Snapshot.query()`
+starts from the most selective filter and only checks the others on those rows.
+
+`SnapshotPipeline` merges the items of each run into the snapshot and rewrites
+it when the spider closes.  The new file replaces the old one atomically, so
+readers always map a complete snapshot.  ``run.py snapshot`` queries it.
+
+Runs alongside the regular ones, i.e. the fast lane, append their listings to a
+journal next to the snapshot instead (``SNAPSHOT_JOURNAL_ONLY``), a JSON line
+each.  `known_listings()` reads the journal too, and the next regular run
+merges it into the snapshot it saves.  It renames the journal before reading
+it, so lines appended meanwhile go to a new journal for the run after it.
+
+File layout: ``MAGIC``, the header length (uint32), the JSON header, then the
+columns and indexes at the offsets in the header, relative to the 8-byte
+aligned end of the header, in the byte order of the machine that wrote them.
+"""
+import array
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import typing
+
+from scrapy.exceptions import NotConfigured
+from twisted.internet import threads
+
+MAGIC = b'EBAYSNP1'
+# The journal of a snapshot is the snapshot's path with this suffix, the journals being merged have a pid after it
+JOURNAL_SUFFIX = '.journal'
+
+# Column => array type code
+NUMERIC = {
+    'source_id': 'q',
+    'price': 'i',
+    'year': 'i',
+    'mileage': 'i',
+    # Unix time of the last run that saw the listing
+    'last_seen': 'q',
+    # Unix time of the last run that fetched its description
+    'described': 'q',
+}
+CATEGORICAL = ('make', 'model', 'body_type', 'drive_type')
+COLUMNS = {**NUMERIC, **{name: 'i' for name in CATEGORICAL}}
+
+# Array type code => value of a missing value, which sorts first
+NULL = {'i': -2 ** 31, 'q': -2 ** 63}
+MAX = {'i': 2 ** 31 - 1, 'q': 2 ** 63 - 1}
+
+# A numeric filter is a value or an inclusive (low, high) range with None for no bound,
+# a categorical filter is a value or a list of values
+Filter = typing.Union[int, str, typing.Tuple[typing.Optional[int], typing.Optional[int]], typing.List[str]]
+
+
+def _int(value, type_code: str) -> int:
+    """Store `value` as an integer of the column type, or NULL if it isn't one."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        return NULL[type_code]
+    return value if NULL[type_code] < value <= MAX[type_code] else NULL[type_code]
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def write(path, columns: typing.Dict[str, array.array], dictionaries: typing.Dict[str, list]):
+    """Write a snapshot of the `columns` and the `dictionaries` of the categorical ones, with their indexes."""
+    rows = len(columns['source_id'])
+    layout, data = {}, []
+    offset = 0
+    for name, values in columns.items():
+        index = array.array('i', sorted(range(rows), key=values.__getitem__))
+        index_offset = _align(offset + len(values) * values.itemsize)
+        layout[name] = {'type': values.typecode, 'offset': offset, 'index_offset': index_offset}
+        data.extend([values, index])
+        offset = _align(index_offset + len(index) * index.itemsize)
+    header = json.dumps({
+        'rows': rows,
+        'byteorder': sys.byteorder,
+        'updated': time.time(),
+        'columns': layout,
+        'dictionaries': dictionaries,
+    }).encode()
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header)) + header)
+        for values in data:
+            # Each array starts at an 8-byte boundary
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            values.tofile(f)
+    os.replace(tmp, path)
+
+
+class Snapshot(object):
+    """A snapshot file, memory-mapped for reading.  Use it as a context manager or `close()` it."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self.mm[:len(MAGIC)] != MAGIC:
+                raise ValueError(f'{path} is not a listing snapshot')
+            length, = struct.unpack_from('<I', self.mm, len(MAGIC))
+            header = json.loads(self.mm[len(MAGIC) + 4:len(MAGIC) + 4 + length])
+            if header['byteorder'] != sys.byteorder:
+                raise ValueError(f'{path} was written on a {header["byteorder"]}-endian machine')
+        except Exception:
+            self.mm.close()
+            raise
+        self.rows = header['rows']
+        self.updated = header['updated']
+        self.dictionaries = header['dictionaries']
+        start = _align(len(MAGIC) + 4 + length)
+        self._views = []
+        self.columns, self.indexes = {}, {}
+        for name, column in header['columns'].items():
+            self.columns[name] = self._view(start + column['offset'], column['type'])
+            self.indexes[name] = self._view(start + column['index_offset'], 'i')
+
+    def _view(self, offset: int, type_code: str) -> memoryview:
+        view = memoryview(self.mm)[offset:offset + self.rows * struct.calcsize(type_code)].cast(type_code)
+        self._views.append(view)
+        return view
+
+    def close(self):
+        # The mmap can't be closed while views of it exist
+        for view in self._views:
+            view.release()
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.rows
+
+    def row(self, i: int) -> dict:
+        """The values of row `i`, None where they are missing."""
+        values = {}
+        for name, column in self.columns.items():
+            value = column[i]
+            if value == NULL[column.format]:
+                value = None
+            elif name in self.dictionaries:
+                value = self.dictionaries[name][value]
+            values[name] = value
+        return values
+
+    def _span(self, name: str, low: int, high: int) -> typing.Tuple[int, int]:
+        """The positions in the index of `name` with values from `low` to `high`."""
+        column, index = self.columns[name], self.indexes[name]
+
+        def bound(value, after):
+            lo, hi = 0, self.rows
+            while lo < hi:
+                mid = (lo + hi) // 2
+                v = column[index[mid]]
+                if v < value or (after and v == value):
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+        return bound(low, False), bound(high, True)
+
+    def _intervals(self, name: str, condition: Filter) -> typing.List[typing.Tuple[int, int]]:
+        """The stored value ranges matching a filter."""
+        if name not in self.columns:
+            raise KeyError(f'Unknown snapshot column {name}')
+        type_code = self.columns[name].format
+        if name in self.dictionaries:
+            wanted = {condition.lower()} if isinstance(condition, str) else {c.lower() for c in condition}
+            # Categorical values match regardless of case
+            codes = [code for code, value in enumerate(self.dictionaries[name]) if value.lower() in wanted]
+            return [(code, code) for code in codes]
+        low, high = condition if isinstance(condition, (tuple, list)) else (condition, condition)
+        return [(NULL[type_code] + 1 if low is None else low, MAX[type_code] if high is None else high)]
+
+    def query(self, **filters: Filter) -> typing.Iterator[int]:
+        """Row numbers of the listings matching all of the `filters`, by column name.
+
+        e.g. ``query(make='Ford', model='Expedition', year=2016, price=(None, 20000))``
+        """
+        if not filters:
+            yield from range(self.rows)
+            return
+        conditions = {name: self._intervals(name, condition) for name, condition in filters.items()}
+        spans = {name: [self._span(name, *interval) for interval in intervals]
+                 for name, intervals in conditions.items()}
+        # Drive the query from the index with the fewest matches
+        driver = min(spans, key=lambda name: sum(end - start for start, end in spans[name]))
+        checks = [(self.columns[name], intervals) for name, intervals in conditions.items() if name != driver]
+        index = self.indexes[driver]
+        for start, end in spans[driver]:
+            for position in range(start, end):
+                i = index[position]
+                if all(any(low <= column[i] <= high for low, high in intervals) for column, intervals in checks):
+                    yield i
+
+
+class KnownListing(typing.NamedTuple):
+    # Stored price, and when the description was last fetched, None if unknown
+    price: typing.Optional[int]
+    described: typing.Optional[int]
+
+
+def known_listings(path) -> typing.Dict[int, KnownListing]:
+    """The listings in the snapshot at `path` and its journals by source_id."""
+    known = {}
+    if os.path.isfile(path):
+        with Snapshot(path) as snapshot:
+            rows = len(snapshot)
+            columns = [snapshot.columns[name] if name in snapshot.columns else [NULL[NUMERIC[name]]] * rows
+                       for name in ('price', 'described')]
+            nulls = (NULL[NUMERIC['price']], NULL[NUMERIC['described']])
+            known = {source_id: KnownListing(*(None if value == null else value
+                                               for value, null in zip(values, nulls)))
+                     for source_id, *values in zip(snapshot.columns['source_id'], *columns)}
+    for values in read_journals(journals(path)):
+        source_id = _int(values.get('source_id'), NUMERIC['source_id'])
+        described = values.get('described') or (known[source_id].described if source_id in known else None)
+        known[source_id] = KnownListing(values.get('price'), described)
+    return known
+
+
+def journal_values(item, seen: int) -> dict:
+    """The snapshot columns of the listing `item`, last `seen` at that Unix time, as a journal line has them."""
+    values = {name: item.get(name) for name in COLUMNS if item.get(name) is not None}
+    # Fetched with the description or not, see EbaySpider._includes_description()
+    values.update(last_seen=seen, described=seen if 'details' in item else None)
+    return values
+
+
+def append_journal(path, values: dict):
+    """Append a listing's `journal_values()` to the journal of the snapshot at `path`."""
+    # Opened for each line, so a journal renamed by a regular run is left alone
+    with open(f'{path}{JOURNAL_SUFFIX}', 'a') as f:
+        f.write(json.dumps(values) + '\n')
+
+
+def journals(path) -> typing.List[str]:
+    """The journals of the snapshot at `path`: any left by a regular run that died while merging them, and the current one."""
+    return sorted(glob.glob(glob.escape(f'{path}{JOURNAL_SUFFIX}') + '*'))
+
+
+def claim_journals(path) -> typing.List[str]:
+    """Rename the current journal of the snapshot at `path` for this process, and return all the journals to merge."""
+    current = f'{path}{JOURNAL_SUFFIX}'
+    if os.path.isfile(current):
+        os.replace(current, f'{current}.{os.getpid()}')
+    return journals(path)
+
+
+def read_journals(paths: typing.Iterable[str]) -> typing.Iterator[dict]:
+    logger = logging.getLogger(__name__)
+    for path in paths:
+        try:
+            with open(path) as f:
+                lines = f.readlines()
+        except OSError as e:
+            logger.warning(f'Skipping the snapshot journal {path}: {e}')
+            continue
+        for line in lines:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A line cut short by a run that died writing it
+                logger.warning(f'Skipping an incomplete line of the snapshot journal {path}')
+
+
+class SnapshotWriter(object):
+    """The listings of a snapshot in memory, updated item by item and saved as a new snapshot."""
+
+    def __init__(self):
+        self.columns = {name: array.array(type_code) for name, type_code in COLUMNS.items()}
+        self.dictionaries = {name: [] for name in CATEGORICAL}
+        self.codes = {name: {} for name in CATEGORICAL}
+        # source_id => row
+        self.rows = {}
+
+    @classmethod
+    def load(cls, path) -> 'SnapshotWriter':
+        """Start from the snapshot at `path`."""
+        writer = cls()
+        with Snapshot(path) as snapshot:
+            for name in COLUMNS:
+                if name in snapshot.columns:
+                    # Copied out of the mmap
+                    writer.columns[name].frombytes(snapshot.columns[name].tobytes())
+                else:
+                    writer.columns[name] = array.array(COLUMNS[name], [NULL[COLUMNS[name]]]) * len(snapshot)
+            for name in CATEGORICAL:
+                writer.dictionaries[name] = list(snapshot.dictionaries.get(name, []))
+                writer.codes[name] = {value: code for code, value in enumerate(writer.dictionaries[name])}
+        writer.rows = {source_id: i for i, source_id in enumerate(writer.columns['source_id'])}
+        return writer
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _code(self, name: str, value) -> int:
+        if value is None or value == '':
+            return NULL['i']
+        value = str(value)
+        code = self.codes[name].get(value)
+        if code is None:
+            code = self.codes[name][value] = len(self.dictionaries[name])
+            self.dictionaries[name].append(value)
+        return code
+
+    def update(self, item, seen: int):
+        """Add or replace the row of the listing `item`, last `seen` at that Unix time."""
+        self._set(journal_values(item, seen))
+
+    def merge(self, values: dict):
+        """Apply a journal line, unless the listing's row was seen later."""
+        row = self.rows.get(_int(values.get('source_id'), NUMERIC['source_id']))
+        if row is None or _int(values.get('last_seen'), NUMERIC['last_seen']) >= self.columns['last_seen'][row]:
+            self._set(values)
+
+    def _set(self, values: dict):
+        """Add or replace the row with the column `values`.  A missing ``described`` keeps the stored one."""
+        source_id = _int(values.get('source_id'), NUMERIC['source_id'])
+        if source_id == NULL[NUMERIC['source_id']]:
+            return
+        row = self.rows.get(source_id)
+        if row is None:
+            row = self.rows[source_id] = len(self.columns['source_id'])
+            for name, column in self.columns.items():
+                column.append(NULL[column.typecode])
+        if values.get('described') is None:
+            values = dict(values, described=self.columns['described'][row])
+        for name, type_code in NUMERIC.items():
+            self.columns[name][row] = _int(values.get(name), type_code)
+        for name in CATEGORICAL:
+            self.columns[name][row] = self._code(name, values.get(name))
+
+    def save(self, path):
+        write(path, self.columns, self.dictionaries)
+
+
+class SnapshotPipeline(object):
+    """Merge the listings of the run into the snapshot at ``SNAPSHOT_PATH``."""
+
+    def __init__(self, path, journal_only: bool = False):
+        self.path = path
+        self.journal_only = journal_only
+        self.writer = None
+        self.seen = int(time.time())
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @classmethod
+    def from_settings(cls, settings):
+        if not settings.get('SNAPSHOT_PATH'):
+            raise NotConfigured('SNAPSHOT_PATH is not set')
+        return cls(str(settings['SNAPSHOT_PATH']), settings.getbool('SNAPSHOT_JOURNAL_ONLY', False))
+
+    def open_spider(self, spider):
+        self.writer = SnapshotWriter()
+        if not self.journal_only and os.path.isfile(self.path):
+            try:
+                self.writer = SnapshotWriter.load(self.path)
+            except (ValueError, KeyError) as e:
+                self.logger.warning(f'Starting a new snapshot, failed to load {self.path}: {e}')
+
+    def process_item(self, item, spider):
+        if item.get('write_error'):
+            # Not stored, so the next run still treats it as new or changed
+            return item
+        if self.journal_only:
+            try:
+                append_journal(self.path, journal_values(item, self.seen))
+            except OSError as e:
+                self.logger.error(f'Failed to add listing {item.get("source_id")} to the snapshot journal: {e}')
+        else:
+            self.writer.update(item, self.seen)
+        return item
+
+    def close_spider(self, spider):
+        if self.journal_only:
+            return None
+        # Sorting the indexes takes a while for a large snapshot, so it is written off the reactor thread
+        d = threads.deferToThread(self._save)
+        d.addCallback(lambda _: self.logger.info(f'Saved {len(self.writer)} listings to the snapshot {self.path}'))
+        d.addErrback(lambda failure: self.logger.error(f'Failed to save the snapshot {self.path}: {failure.value}'))
+        return d
+
+    def _save(self):
+        """Merge the journals into the snapshot and save it, then remove the journals."""
+        merged = claim_journals(self.path)
+        for values in read_journals(merged):
+            self.writer.merge(values)
+        self.writer.save(self.path)
+        for path in merged:
+            os.remove(path)
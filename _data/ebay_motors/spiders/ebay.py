@@ -1,10 +1,18 @@
-import json
+import collections
+import math
 import os
+import time
 import scrapy
 import scrapy.signals
 
 from ebay_motors.items import EbayListingItem
 from ebay_motors.requests import EbayRequest
+from ebay_motors import budget
+from ebay_motors import parsing
+from ebay_motors import profiles
+from ebay_motors import resume
+from ebay_motors import runlock
+from ebay_motors import snapshot
 from ebay_motors import utils
 
 
@@ -17,28 +25,139 @@ class EbaySpider(scrapy.spiders.Spider):
 
     processed = 0
     errors = 0
+    # Whether a partial batch of listings waits for more while there are searches to come
+    full_detail_batches = True
+    # Whether search results may be listings stored before, looked up in the snapshot
+    finds_known_listings = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profiles = []
+        # (profile, page) of the search pages still to be requested
+        self.pending_pages = collections.deque()
+        self.searches_in_flight = 0
+        # Listings found by any profile, so each gets one detail fetch
+        self.seen_ids = set()
+        # itemId => the profile that found the listing first, whose timestamp it holds back if deferred
+        self.found_by = {}
+        # itemIds of the unchanged listings deferred while calls were tight, which hold back no timestamp
+        self.unchanged_ids = set()
+        # Listings waiting for a detail batch, by whether the batch includes their descriptions
+        self.pending_details = {True: [], False: []}
+        # Unchanged listings resumed from the queue, held back until this run's own search results are queued
+        self.resumed_unchanged = {True: [], False: []}
+        # source_id => snapshot.KnownListing, of the listings in the snapshot
+        self.known = {}
+        # Detail batches requested but not yet parsed
+        self.detail_backlog = 0
+        # Worker processes for EBAY_CLEANSER_MODE = 'process'
+        self.workers = None
+        # The day's API calls, None if they aren't budgeted
+        self.budget = None
+        # Where unfinished work is left for the next run, None to keep the profiles' timestamps instead
+        self.resume_queue = None
+        # Whether the resume queue was loaded, only then is it this run's to replace
+        self.resumed = False
+        # time.monotonic() by which to stop issuing requests (EBAY_TIME_BUDGET), None for no limit
+        self.deadline = None
+        # (profile, page) and listings left for a later run, out of time or API calls
+        self.deferred_pages = []
+        self.deferred_details = {True: [], False: []}
 
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = super().from_crawler(crawler, *args, **kwargs)
         # crawler.signals.connect(spider.spider_opened, signals.spider_opened)
         crawler.signals.connect(spider.spider_closed, scrapy.signals.spider_closed)
+        spider.profiles = profiles.search_profiles(crawler.settings)
+        spider.budget = budget.ApiBudget.from_settings(crawler.settings)
+        spider.resume_queue = resume.ResumeQueue.from_settings(crawler.settings)
+        if crawler.settings.getfloat('EBAY_TIME_BUDGET', 0):
+            spider.deadline = time.monotonic() + crawler.settings.getfloat('EBAY_TIME_BUDGET') * 60
+        if crawler.settings.get('EBAY_CLEANSER_MODE', 'item') == 'process':
+            # Imported here as it loads the pipelines, which must not happen before the reactor is installed
+            from ebay_motors import workers
+            spider.workers = workers.WorkerPool.from_settings(crawler.settings)
+        # Tiered details and the budget's priority listings both go by the known listings
+        if spider.finds_known_listings and (crawler.settings.getbool('EBAY_DETAILS_TIERED', True)
+                                         or spider.budget and spider.budget.limits):
+            spider._load_known(crawler.settings.get('SNAPSHOT_PATH'))
         return spider
 
+    def _load_known(self, path):
+        if not path:
+            self.logger.warning('SNAPSHOT_PATH is not set, so every listing counts as new: all descriptions are '
+                                'fetched and a tight API budget defers no listings as unchanged')
+            return
+        if not os.path.isfile(path) and not snapshot.journals(path):
+            return
+        try:
+            self.known = snapshot.known_listings(path)
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.warning(f'Treating every listing as new, failed to load the known listings from {path}: {e}')
+
     def spider_closed(self, spider):
-        if not self.errors:
-            self.logger.info(f'Updating prior_run_date timestamp file with {EbayRequest.current_run_date}')
-            open(self.settings.get('EBAY_SEARCH_TIMESTAMP_PATH'), 'w').write(EbayRequest.current_run_date)
-        else:
-            self.logger.info('Not updating prior_run_date due to processing errors.')
+        if self.workers:
+            self.workers.shutdown()
+        if self.budget:
+            try:
+                self.budget.save()
+            except (OSError, runlock.LockedError) as e:
+                self.logger.error(f'Failed to save the API calls of this run to {self.budget.path}: {e}')
+            self.budget.record(self.crawler.stats)
+        self._carry_over()
+        # A profile's search errors only hold back its own timestamp
+        shared_errors = self.errors - sum(p.errors for p in self.profiles)
+        for profile in self.profiles:
+            if not shared_errors and not profile.errors and not profile.deferred:
+                self.logger.info(f'Updating prior_run_date timestamp file of profile {profile.name} '
+                                 f'with {EbayRequest.current_run_date}')
+                profile.save_run_date(EbayRequest.current_run_date)
+            else:
+                self.logger.info(f'Not updating prior_run_date of profile {profile.name} due to processing errors '
+                                 f'or deferred work.')
+        stats = self.crawler.stats
         self.logger.info(f'\n\n-- EXECUTION STATS --\n'
                          f'Processed: {self.processed}\n'
-                         f'Errors: {self.errors}\n')
+                         f'Errors: {self.errors}\n'
+                         f'Seconds to first stored row: {stats.get_value("db/first_row_seconds")}\n'
+                         f'Seconds paused for the database: {stats.get_value("backpressure/paused_seconds", 0)}\n'
+                         f'{self._detail_savings()}\n'
+                         f'API calls: {self.budget.summary() if self.budget else "not budgeted"}, '
+                         f'{stats.get_value("budget/deferred_unchanged", 0)} unchanged listings, '
+                         f'{stats.get_value("budget/deferred_listings", 0)} other listings and '
+                         f'{stats.get_value("budget/deferred_pages", 0)} pages deferred\n'
+                         f'Left to the next run: {stats.get_value("resume/saved_pages", 0)} pages, '
+                         f'{stats.get_value("resume/saved_listings", 0)} listings\n'
+                         f'Peak memory: {stats.get_value("memusage/max")}\n')
+
+    def _detail_savings(self) -> str:
+        """Estimate the response bytes and download time saved by the detail calls without descriptions.
+
+        Each of those listings is compared with the average of the listings fetched with
+        their descriptions in the same run.
+        """
+        stats = self.crawler.stats
+        full, light = [{name: stats.get_value(f'details/{tier}/{name}', 0)
+                        for name in ('requests', 'listings', 'bytes', 'seconds')}
+                       for tier in ('description', 'specifics')]
+        text = (f'Detail calls without descriptions: {light["requests"]} of {full["requests"] + light["requests"]} '
+                f'({light["listings"]} listings, {light["bytes"]} bytes)')
+        if not full['listings'] or not light['listings']:
+            return text
+        saved_bytes = round(light['listings'] * (full['bytes'] / full['listings'] - light['bytes'] / light['listings']))
+        saved_seconds = round(light['requests'] * (full['seconds'] / full['requests'] -
+                                                   light['seconds'] / light['requests']), 3)
+        stats.set_value('details/saved_bytes', saved_bytes)
+        stats.set_value('details/saved_seconds', saved_seconds)
+        return f'{text}, saving about {saved_bytes} response bytes and {saved_seconds}s of download latency'
 
     def start_requests(self):
         """Entry point for scraping."""
 
         self.logger.debug(f'Starting search')
+        if self.budget:
+            self.budget.spend('auth')
         yield EbayRequest.auth(
             self.settings,
             callback=self.parse_auth_and_search,
@@ -48,7 +167,7 @@ class EbaySpider(scrapy.spiders.Spider):
         """Pull out the access token and submit the initial search."""
 
         # Take the access_token from the auth response and put it on the EbayRequest class
-        auth_resp = json.loads(response.text)
+        auth_resp = utils.loads(response.body)
 
         # If `faking` the response, pull out the response content
         if self.settings.get('EBAY_MOCK_SEARCH', False):
@@ -56,25 +175,256 @@ class EbaySpider(scrapy.spiders.Spider):
 
         EbayRequest.access_token = auth_resp['access_token']
 
-        if self.settings.get('EBAY_SEARCH_TIMESTAMP_PATH') and \
-                os.path.isfile(self.settings['EBAY_SEARCH_TIMESTAMP_PATH']):
-            prior_run_date = open(self.settings['EBAY_SEARCH_TIMESTAMP_PATH']).read()
-            EbayRequest.prior_run_date = prior_run_date
-        self.logger.info(f'Initializing {self.name} spider with prior run date of {EbayRequest.prior_run_date}')
-
-        yield EbayRequest.search(
-            self.settings,
-            callback=self.parse_results,
-            errback=self.search_error)
-
-    def parse_results(self, response):
+        for profile in self.profiles:
+            profile.load_prior_run_date(EbayRequest.prior_run_date)
+        # The work left by the previous run goes first
+        self._resume()
+        # All profiles are searched concurrently, each from its own prior run date
+        for profile in self.profiles:
+            self.logger.info(f'Initializing {self.name} spider profile {profile.name} '
+                             f'with prior run date of {profile.prior_run_date}')
+            self.pending_pages.append((profile, 1))
+        yield from self._next_details()
+        yield from self._next_pages()
+
+    def _next_pages(self):
+        """Request more search pages while the detail backlog is below ``EBAY_MAX_DETAIL_BACKLOG``.
+
+        Each page in flight counts for the detail batches it will produce, so
+        search responses don't pile up ahead of the details and the database.
         """
-        Process a page of search results.
+        batches_per_page = math.ceil(int(self.settings.get('EBAY_SEARCH_PAGESIZE', '100')) / 20)
+        max_backlog = self.settings.getint('EBAY_MAX_DETAIL_BACKLOG', 50)
+        while self.pending_pages:
+            backlog = self.detail_backlog + batches_per_page * self.searches_in_flight
+            # Always keep something going, even if one page is more than the backlog allows
+            if backlog >= max_backlog and backlog:
+                break
+            if self._out_of_time():
+                self._defer_pages()
+                break
+            if self.budget and not self.budget.can_spend('finding'):
+                self.logger.warning('Out of Finding API calls for now, deferring %d search pages',
+                                    len(self.pending_pages))
+                self.crawler.stats.inc_value('budget/deferred_pages', len(self.pending_pages))
+                self._defer_pages()
+                break
+            profile, page = self.pending_pages.popleft()
+            self.searches_in_flight += 1
+            if self.budget:
+                self.budget.spend('finding')
+            self.logger.debug('Requesting page %d of profile %s', page, profile.name)
+            yield EbayRequest.search(
+                self.settings,
+                page=page,
+                profile=profile,
+                priority=self.settings.getint('EBAY_SEARCH_PRIORITY', 0),
+                callback=self.parse_results,
+                errback=self.search_error,
+                cb_kwargs={'profile': profile})
+
+    def _next_details(self):
+        """Request details for the queued listings in batches of 20.
+
+        eBay currently only supports batches of 20 items.  A partial batch waits for
+        more listings until there are no more searches to come.
+        """
+        searching = self.pending_pages or self.searches_in_flight
+        if not searching:
+            self._queue_resumed_unchanged()
+        waiting = searching and self.full_detail_batches
+        for include_description, pending in self.pending_details.items():
+            while len(pending) >= 20 or (pending and not waiting):
+                if self._out_of_time():
+                    self._defer_listings(include_description, pending)
+                    break
+                if self.budget and not self.budget.can_spend('shopping'):
+                    self.logger.warning('Out of Shopping API calls for now, deferring %d listings', len(pending))
+                    self.crawler.stats.inc_value('budget/deferred_listings', len(pending))
+                    self._defer_listings(include_description, pending)
+                    break
+                batch, pending[:] = pending[:20], pending[20:]
+                if self.budget:
+                    self.budget.spend('shopping')
+                self.detail_backlog += 1
+                self.logger.info('Request details for %d listings%s', len(batch),
+                                 '' if include_description else ' without descriptions')
+                yield EbayRequest.details(
+                    self.settings,
+                    items=batch,
+                    include_description=include_description,
+                    priority=self.settings.getint('EBAY_DETAILS_PRIORITY', 10),
+                    callback=self.parse_details_in_worker if self.workers else self.parse_details,
+                    errback=self.detail_error,
+                    cb_kwargs={'items': batch, 'include_description': include_description})
+
+    def _out_of_time(self) -> bool:
+        """Whether the run has used up ``EBAY_TIME_BUDGET``, after which it only finishes the requests in flight."""
+        if self.deadline is None or time.monotonic() < self.deadline:
+            return False
+        if not self.crawler.stats.get_value('resume/out_of_time'):
+            self.crawler.stats.set_value('resume/out_of_time', 1)
+            self.logger.warning('Out of time, finishing the requests in flight and leaving the rest to the next run')
+        return True
+
+    def _defer_pages(self):
+        """Leave the search pages still to be requested to a later run."""
+        self.deferred_pages.extend(self.pending_pages)
+        self.pending_pages.clear()
+
+    def _defer_listings(self, include_description: bool, pending: list):
+        """Leave the `pending` listings to a later run."""
+        self.deferred_details[include_description].extend(pending)
+        pending.clear()
+
+    def _queue_resumed_unchanged(self):
+        """Queue the unchanged listings resumed from the queue behind this run's own, or defer them again if calls are tight."""
+        for include_description, resumed in self.resumed_unchanged.items():
+            if not resumed:
+                continue
+            if self.budget and self.budget.tight('shopping'):
+                self.crawler.stats.inc_value('budget/deferred_unchanged', len(resumed))
+                self.unchanged_ids.update(item['itemId'][0] for item in resumed)
+                self._defer_listings(include_description, resumed)
+            else:
+                self.pending_details[include_description].extend(resumed)
+                resumed.clear()
+
+    def _resume(self):
+        """Queue the search pages and listings left by the previous run ahead of this run's.
+
+        Only new listings and price changes go ahead, the unchanged listings wait for
+        `_queue_resumed_unchanged()`, so a tight budget isn't spent on them first.
+        """
+        if not self.resume_queue:
+            return
+        pages, details = self.resume_queue.load()
+        self.resumed = True
+        profiles_by_name = {profile.name: profile for profile in self.profiles}
+        windows = {}
+        extended = set()
+        for queued in pages:
+            if queued.profile not in profiles_by_name:
+                self.logger.warning(f'Dropping page {queued.page} of the unknown search profile {queued.profile} '
+                                    f'from the resume queue')
+                continue
+            profile = profiles_by_name[queued.profile]
+            if not profile.bounded():
+                # Its pages have moved since, so this run's search starts from the earlier window instead
+                if queued.prior_run_date < profile.prior_run_date:
+                    self.logger.info(f'Extending the search of profile {profile.name} back to '
+                                     f'{queued.prior_run_date} for the pages left by the previous run')
+                    profile.prior_run_date = queued.prior_run_date
+                    extended.add(profile.name)
+                continue
+            # The pages of each earlier window share a copy of their profile
+            key = (queued.profile, queued.prior_run_date, queued.current_run_date)
+            if key not in windows:
+                windows[key] = profiles_by_name[queued.profile].window(queued.prior_run_date, queued.current_run_date)
+            self.pending_pages.append((windows[key], queued.page))
+        listings = 0
+        for include_description, items in details.items():
+            for item in items:
+                if item['itemId'][0] not in self.seen_ids:
+                    self.seen_ids.add(item['itemId'][0])
+                    if self._is_priority(item):
+                        self.pending_details[include_description].append(item)
+                    else:
+                        self.resumed_unchanged[include_description].append(item)
+                    listings += 1
+        if self.pending_pages or listings:
+            self.logger.info(f'Resuming {len(self.pending_pages)} search pages and {listings} listings '
+                             f'left by the previous run')
+        self.crawler.stats.set_value('resume/loaded_pages', len(self.pending_pages))
+        self.crawler.stats.set_value('resume/extended_profiles', len(extended))
+        self.crawler.stats.set_value('resume/loaded_listings', listings)
+
+    def _carry_over(self):
+        """Save the work left undone to the resume queue.
+
+        Without a resume queue, the profiles with pages or new and changed listings left
+        keep their timestamps.  The unchanged listings deferred while calls were tight don't
+        hold them back, a later search of a newer window finds them again anyway.
+        """
+        self._defer_pages()
+        for pending_details in (self.pending_details, self.resumed_unchanged):
+            for include_description, pending in pending_details.items():
+                self._defer_listings(include_description, pending)
+        pages = len(self.deferred_pages)
+        listings = sum(len(items) for items in self.deferred_details.values())
+        self.crawler.stats.set_value('resume/saved_pages', pages)
+        self.crawler.stats.set_value('resume/saved_listings', listings)
+        if self.resume_queue and not self.resumed:
+            # Closed before the queue was loaded, e.g. without a token, so the work in it is still to do
+            return
+        if self.resume_queue:
+            try:
+                self.resume_queue.save([resume.QueuedPage(profile.name, page, profile.prior_run_date,
+                                                          profile.current_run_date or EbayRequest.current_run_date)
+                                        for profile, page in self.deferred_pages],
+                                       self.deferred_details)
+            except OSError as e:
+                self.logger.error(f'Failed to save the resume queue {self.resume_queue.path}: {e}')
+            else:
+                if pages or listings:
+                    self.logger.warning(f'Left {pages} search pages and {listings} listings to the next run '
+                                        f'in {self.resume_queue.path}')
+                return
+        held = {profile for profile, page in self.deferred_pages}
+        for items in self.deferred_details.values():
+            for item in items:
+                item_id = item['itemId'][0]
+                if item_id in self.unchanged_ids:
+                    continue
+                # Listings resumed from the queue weren't found by any profile of this run
+                held.update([self.found_by[item_id]] if item_id in self.found_by else self.profiles)
+        for profile in held:
+            profile.deferred += 1
+
+    def _is_priority(self, item) -> bool:
+        """Whether the search result `item` is a new listing or a price change, going by the snapshot."""
+        known = self.known.get(int(item['itemId'][0]))
+        return known is None or known.price not in parsing.summary_prices(item)
+
+    def _includes_description(self, item) -> bool:
+        """Whether to fetch the description of the search result `item` along with its details.
+
+        Descriptions rarely change, so only new listings and those whose description is
+        older than ``EBAY_DETAILS_DESCRIPTION_REFRESH_DAYS`` get them, going by the snapshot.
+        """
+        if not self.settings.getbool('EBAY_DETAILS_INCLUDE_DESCRIPTION', True):
+            return False
+        if not self.settings.getbool('EBAY_DETAILS_TIERED', True):
+            return True
+        source_id = int(item['itemId'][0])
+        known = self.known.get(source_id)
+        if known is None or known.described is None:
+            return True
+        refresh_days = self.settings.getfloat('EBAY_DETAILS_DESCRIPTION_REFRESH_DAYS', 0)
+        return refresh_days > 0 and known.described < time.time() - refresh_days * 86400
+
+    def parse_results(self, response, profile):
+        """
+        Process a page of search results for `profile`.
 
-        Kick off additional page searches if there are more.
-        Initiate detail searches for all items returned.
+        Queue up additional page searches if there are more.
+        Queue the listings not already found by another profile or page for details.
         """
-        search_resp = json.loads(response.text)
+        self.searches_in_flight -= 1
+        try:
+            self._parse_results(response, profile)
+        except Exception:
+            # Keep the profile's timestamp, its listings may be missing
+            self.errors += 1
+            profile.errors += 1
+            raise
+        finally:
+            # Whatever happened to this page, the crawl goes on
+            yield from self._next_details()
+            yield from self._next_pages()
+
+    def _parse_results(self, response, profile):
+        search_resp = utils.loads(response.body)
 
         # If `faking` the response, pull out the response content
         if self.settings.get('EBAY_MOCK_SEARCH', False):
@@ -91,92 +441,122 @@ class EbaySpider(scrapy.spiders.Spider):
         # Check status of response
         if search_resp['ack'] and search_resp['ack'][0] in ['Failure', 'PartialFailure']:  # Other values are 'Success', 'Warning'
             self.errors += 1
-            self.logger.error(f'Error(s) returned from search: {search_resp["errorMessage"]}')
+            profile.errors += 1
+            self.logger.error(f'Error(s) returned from search of profile {profile.name}: '
+                              f'{search_resp["errorMessage"]}')
             return
 
         # Check pagination
         cur_page = int(search_resp.get('paginationOutput', [{}])[0].get('pageNumber', ['1'])[0])
         total_pages = int(search_resp.get('paginationOutput', [{}])[0].get('totalPages', ['1'])[0])
-        self.logger.info(f'Search results contain {total_pages} pages.')
-        # If there are more pages, go get them
-        if cur_page == 1 and total_pages > 1:
-            for page in range(cur_page + 1, total_pages + 1):
-                self.logger.debug(f'Requesting page {page} of {total_pages}')
-                yield EbayRequest.search(
-                    self.settings,
-                    page=page,
-                    callback=self.parse_results,
-                    errback=self.search_error)
-
-        # Take the high level info and process the items in batches
-        # eBay currently only supports batches of 20 items
-        batch_num = 0
-        for batch in utils.batches(search_resp.get('searchResult', [{}])[0].get('item', []), 20):
-            batch_num += 1
-            self.logger.info(f'Request details for batch {batch_num} of page {cur_page}')
-            yield EbayRequest.details(
-                self.settings,
-                items=batch,
-                callback=self.parse_details,
-                errback=self.detail_error,
-                cb_kwargs={'items': batch})
+        self.logger.info('Search results of profile %s contain %d pages.', profile.name, total_pages)
+        if cur_page == 1 and self.budget:
+            # The cost of the whole search, before duplicates and deferrals
+            total_entries = int(search_resp.get('paginationOutput', [{}])[0].get('totalEntries', ['0'])[0])
+            self.budget.predict('finding', total_pages)
+            self.budget.predict('shopping', math.ceil(total_entries / 20))
+
+        items = search_resp.get('searchResult', [{}])[0].get('item', [])
+        self.crawler.stats.inc_value(f'search/listings/{profile.name}', len(items))
+        for item in self._page_items(profile, items, cur_page, total_pages):
+            if item['itemId'][0] in self.seen_ids:
+                self.crawler.stats.inc_value('search/duplicate_listings')
+                continue
+            self.seen_ids.add(item['itemId'][0])
+            self.found_by[item['itemId'][0]] = profile
+            if self.budget and self.budget.tight('shopping') and not self._is_priority(item):
+                # Short of calls, an unchanged listing waits for a later run, which refreshes it before it looks ended
+                self.crawler.stats.inc_value('budget/deferred_unchanged')
+                self.unchanged_ids.add(item['itemId'][0])
+                self._defer_listings(self._includes_description(item), [item])
+                continue
+            self.pending_details[self._includes_description(item)].append(item)
+
+    def _page_items(self, profile, items: list, cur_page: int, total_pages: int) -> list:
+        """The search results of page `cur_page` of `profile` to consider for details.
 
-    def parse_details(self, response, items):
+        After the first page, the others are queued to be requested as the detail backlog allows.
         """
+        if cur_page == 1 and total_pages > 1:
+            self.pending_pages.extend((profile, page) for page in range(cur_page + 1, total_pages + 1))
+        return items
 
+    def parse_details(self, response, items, include_description=True):
         """
-        # If `faking` the response, pull out the response content
-        if self.settings.get('EBAY_MOCK_SEARCH', False):
-            response = scrapy.Selector(text=json.loads(response.text)['data'], type='xml')
-            response.remove_namespaces()
-        else:
-            response.selector.remove_namespaces()
+        Match up the search results in `items` with their details and build the listings.
+        """
+        self.detail_backlog -= 1
+        try:
+            self._count_details(response, items, include_description)
+            yield from self._parse_details(response, items, include_description)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            yield from self._next_pages()
+
+    def _count_details(self, response, items, include_description):
+        """Count the detail calls, listings, response bytes and download time of each kind of detail call."""
+        if getattr(self, 'crawler', None) is None:
+            # Not crawling, e.g. in the benchmarks
+            return
+        tier = 'description' if include_description else 'specifics'
+        stats = self.crawler.stats
+        stats.inc_value(f'details/{tier}/requests')
+        stats.inc_value(f'details/{tier}/listings', len(items))
+        stats.inc_value(f'details/{tier}/bytes', len(response.body))
+        stats.inc_value(f'details/{tier}/seconds', response.meta.get('download_latency', 0))
+
+    def _parse_details(self, response, items, include_description=True):
+        details_resp = parsing.details_response(response.body,
+                                                self.settings.get('EBAY_DETAILS_RESPONSE_ENCODING', 'XML'),
+                                                bool(self.settings.get('EBAY_MOCK_SEARCH', False)),
+                                                getattr(response, 'encoding', 'utf-8'))
 
         # Check status of response
-        if response.xpath('/GetMultipleItemsResponse/Ack/text()').get() in ['Failure', 'PartialFailure']:
+        if details_resp.ack in ['Failure', 'PartialFailure']:
             # Other values are 'Success', 'Warning'
             self.errors += 1
-            self.logger.error(f'Error(s) returned from details: '
-                              f'{response.xpath("/GetMultipleItemsResponse/Errors/ShortMessage/text()").get()}')
+            self.logger.error(f'Error(s) returned from details: {details_resp.error}')
             return
 
-        for item in items:
-            try:
-                detail = response.xpath(f'/GetMultipleItemsResponse/Item[ItemID="{item["itemId"][0]}"]')[0]
-            except IndexError:
-                self.logger.warning(f'Detail records did not contain item `{item["itemId"][0]}`, skipping')
-                continue
-            yield EbayListingItem({
-                'source_id': item.get('itemId', [None])[0],
-                'name': item.get('title', [None])[0],
-                'url': 'https://' + item.get('viewItemURL', [None])[0],
-                'price': item.get('sellingStatus', [{}])[0].get('currentPrice', [{}])[0].get('__value__'),
-                'city': item['location'][0].rsplit(',', maxsplit=2)[0] if ',' in item.get('location', [''])[0] else None,
-                'state': item['location'][0].rsplit(',', maxsplit=2)[1] if ',' in item.get('location', [''])[0] else None,
-                'country': item.get('country', [None])[0],
-                'date_listed': item.get('listingInfo', [{}])[0].get('startTime')[0],
-                'favorited': item.get('listingInfo', [{}])[0].get('watchCount', [None])[0],
-
-                'bin_price': detail.xpath('ConvertedBuyItNowPrice/text()').get(),
-                'page_views': detail.xpath('HitCount/text()').get(),
-                'seller_type': detail.xpath('ItemSpecifics/NameValueList[Name="For Sale By"]/Value/text()').get(),
-                'details': detail.xpath('Description/text()').get(),
-                'year': detail.xpath('ItemSpecifics/NameValueList[Name="Year"]/Value/text()').get(),
-                'make': detail.xpath('ItemSpecifics/NameValueList[Name="Make"]/Value/text()').get(),
-                'model': detail.xpath('ItemSpecifics/NameValueList[Name="Model"]/Value/text()').get(),
-                'submodel': detail.xpath('ItemSpecifics/NameValueList[Name="Sub Model"]/Value/text()').get(),
-                'mileage': detail.xpath('ItemSpecifics/NameValueList[Name="Mileage"]/Value/text()').get(),
-                'transmission': detail.xpath('ItemSpecifics/NameValueList[Name="Transmission"]/Value/text()').get(),
-                'num_cylinders': detail.xpath('ItemSpecifics/NameValueList[Name="Number of Cylinders"]/Value/text()').get(),
-                'drive_type': detail.xpath('ItemSpecifics/NameValueList[Name="Drive Type"]/Value/text()').get(),
-                'body_type': detail.xpath('ItemSpecifics/NameValueList[Name="Body Type"]/Value/text()').get(),
-                'fuel_type': detail.xpath('ItemSpecifics/NameValueList[Name="Fuel Type"]/Value/text()').get(),
-                'title_type': detail.xpath('ItemSpecifics/NameValueList[Name="Vehicle Title"]/Value/text()').get(),
-                'vin': detail.xpath('ItemSpecifics/NameValueList[Name="VIN"]/Value/text()').get(),
-                'trim': detail.xpath('ItemSpecifics/NameValueList[Name="Trim"]/Value/text()').get(),
-                'color': detail.xpath('ItemSpecifics/NameValueList[Name="Exterior Color"]/Value/text()').get(),
-                'num_doors': detail.xpath('ItemSpecifics/NameValueList[Name="Number of Doors"]/Value/text()').get(),
-            })
+        listings, missing = parsing.listings(items, details_resp.details, include_description)
+        for item_id in missing:
+            self.logger.warning(f'Detail records did not contain item `{item_id}`, skipping')
+        yield from listings
+
+    async def parse_details_in_worker(self, response, items, include_description=True):
+        """
+        Like `parse_details()`, with the details extracted and the listings cleansed in a worker process.
+        """
+        from ebay_motors import workers
+
+        self._count_details(response, items, include_description)
+        config = {
+            'encoding': self.settings.get('EBAY_DETAILS_RESPONSE_ENCODING', 'XML'),
+            'mock': bool(self.settings.get('EBAY_MOCK_SEARCH', False)),
+            'include_description': include_description,
+            'current_run_date': EbayRequest.current_run_date,
+        }
+        output = []
+        try:
+            result = await workers.awaitable(self.workers.submit(
+                workers.parse_and_cleanse, response.body, getattr(response, 'encoding', 'utf-8'), items, config))
+        except Exception as e:
+            self.errors += 1
+            self.logger.error(f'Failed to process details in a worker: {e!r}')
+        else:
+            if result.ack in ['Failure', 'PartialFailure']:
+                self.errors += 1
+                self.logger.error(f'Error(s) returned from details: {result.error}')
+            for item_id in result.missing:
+                self.logger.warning(f'Detail records did not contain item `{item_id}`, skipping')
+            # Already cleansed, EbayListingCleanserPipeline passes them through
+            output.extend(EbayListingItem(listing) for listing in result.listings)
+        finally:
+            self.detail_backlog -= 1
+        output.extend(self._next_pages())
+        return output
 
     def auth_error(self, failure):
         self.errors += 1
@@ -184,8 +564,11 @@ class EbaySpider(scrapy.spiders.Spider):
         self.logger.error(failure.value.response.body)
 
     def search_error(self, failure):
+        self.searches_in_flight -= 1
         self.errors += 1
-        self.logger.error('Search: ' + repr(failure))
+        profile = failure.request.cb_kwargs['profile']
+        profile.errors += 1
+        self.logger.error(f'Search of profile {profile.name}: ' + repr(failure))
         try:
             self.logger.error(failure.value.response.body)
         except:
@@ -195,7 +578,11 @@ class EbaySpider(scrapy.spiders.Spider):
         # This can be deferred to a future date if the expected runtime of this
         # synchronization is less than the 2 hour token expiration window.
 
+        yield from self._next_details()
+        yield from self._next_pages()
+
     def detail_error(self, failure):
+        self.detail_backlog -= 1
         self.errors += 1
         self.logger.error('Details: ' + repr(failure))
         try:
@@ -206,3 +593,5 @@ class EbaySpider(scrapy.spiders.Spider):
         # Check for expired token error and initiate generating a new access_token
         # This can be deferred to a future date if the expected runtime of this
         # synchronization is less than the 2 hour token expiration window.
+
+        return self._next_pages()
@@ -0,0 +1,150 @@
+"""
+The fast lane: frequent polls for the listings started since the last poll.
+
+`EbayFastLaneSpider` (``run.py ebay_fast``) searches with
+``EBAY_FAST_LANE_ITEM_FILTERS`` sorted by ``StartTimeNewest``, from the start
+time of the newest listing of the previous poll, which it keeps in
+``EBAY_FAST_LANE_STATE_PATH``.  Paging stops at the first listing seen before,
+so a poll usually costs one search call.  The new listings are requested in
+detail batches of their own as soon as each page is parsed, without waiting
+for a full batch, and written as they arrive.
+
+The time from the start of each listing to its stored row is reported in the
+``fast_lane/start_to_row_seconds/*`` stats.
+"""
+import itertools
+import json
+import os
+import statistics
+import time
+import typing
+
+import arrow
+import scrapy.signals
+
+from ebay_motors import profiles
+from ebay_motors import utils
+from ebay_motors.requests import EbayRequest
+from ebay_motors.spiders.ebay import EbaySpider
+
+
+class FastLaneState(typing.NamedTuple):
+    # startTime of the newest listing seen, in the eBay date format, and the itemIds started then
+    start_time: typing.Optional[str] = None
+    item_ids: typing.Tuple[str, ...] = ()
+
+
+def load_state(path) -> FastLaneState:
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return FastLaneState()
+    return FastLaneState(state.get('start_time'), tuple(state.get('item_ids', ())))
+
+
+def save_state(path, state: FastLaneState):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state._asdict(), f)
+    os.replace(tmp, path)
+
+
+def start_time(item) -> str:
+    return item.get('listingInfo', [{}])[0].get('startTime', [''])[0]
+
+
+class EbayFastLaneSpider(EbaySpider):
+    """Fetch and store the listings started since the newest one seen by the previous poll."""
+
+    name = 'ebay_fast'
+
+    full_detail_batches = False
+    # Every listing here is new, so the snapshot isn't loaded to look them up
+    finds_known_listings = False
+    custom_settings = {
+        # The snapshot is rewritten whole by the regular runs, the listings go to its journal for them to merge
+        'SNAPSHOT_JOURNAL_ONLY': True,
+        # New listings get their descriptions
+        'EBAY_DETAILS_TIERED': False,
+        # The queue belongs to the regular runs, which find any new listings a poll leaves behind
+        'EBAY_RESUME_QUEUE_PATH': '',
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.state = FastLaneState()
+        # The state after this poll, saved if it ends without errors
+        self.newest = None
+        # Seconds from listing start to stored row
+        self.latencies = []
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.item_scraped, scrapy.signals.item_scraped)
+        settings = crawler.settings
+        if settings.get('EBAY_FAST_LANE_STATE_PATH'):
+            spider.state = load_state(settings['EBAY_FAST_LANE_STATE_PATH'])
+        # The single search has no timestamp file, it starts from the newest listing seen
+        EbayRequest.prior_run_date = spider.state.start_time or utils.ebay_date_format(
+            arrow.utcnow().shift(minutes=-settings.getfloat('EBAY_FAST_LANE_LOOKBACK', 60)))
+        spider.profiles = [profiles.SearchProfile(
+            'fast_lane',
+            settings.getlist('EBAY_FAST_LANE_ITEM_FILTERS'),
+            settings.getlist('EBAY_SEARCH_ASPECT_FILTERS'),
+            sort_order='StartTimeNewest',
+        )]
+        return spider
+
+    def _seen_before(self, item) -> bool:
+        if not self.state.start_time:
+            return False
+        started = start_time(item)
+        # The dates share one format, so they compare as strings
+        return started < self.state.start_time or (started == self.state.start_time
+                                                   and item['itemId'][0] in self.state.item_ids)
+
+    def _page_items(self, profile, items: list, cur_page: int, total_pages: int) -> list:
+        """The listings of the page up to the first one seen before, newest first.
+
+        The next page is only requested if none of them was seen before.
+        """
+        new = list(itertools.takewhile(lambda item: not self._seen_before(item), items))
+        if cur_page == 1 and new:
+            newest = start_time(new[0])
+            item_ids = tuple(item['itemId'][0] for item in new if start_time(item) == newest)
+            if newest == self.state.start_time:
+                item_ids += self.state.item_ids
+            self.newest = FastLaneState(newest, item_ids)
+        self.crawler.stats.inc_value('fast_lane/new_listings', len(new))
+        if len(new) < len(items):
+            self.logger.info('Reached the listings seen before on page %d', cur_page)
+            self.crawler.stats.set_value('fast_lane/last_page', cur_page)
+        elif cur_page < min(total_pages, self.settings.getint('EBAY_FAST_LANE_MAX_PAGES', 5)):
+            self.pending_pages.append((profile, cur_page + 1))
+        else:
+            self.crawler.stats.set_value('fast_lane/last_page', cur_page)
+        return new
+
+    def item_scraped(self, item, response, spider):
+        """Note how long after its start the listing was stored."""
+        try:
+            self.latencies.append(time.time() - arrow.get(item['date_listed']).float_timestamp)
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    def spider_closed(self, spider):
+        super().spider_closed(spider)
+        stats = self.crawler.stats
+        if self.latencies:
+            summary = {'min': min(self.latencies), 'median': statistics.median(self.latencies),
+                       'max': max(self.latencies)}
+            for name, seconds in summary.items():
+                stats.set_value(f'fast_lane/start_to_row_seconds/{name}', round(seconds, 1))
+            self.logger.info(f'Stored {len(self.latencies)} new listings, '
+                             + ', '.join(f'{name} {seconds:.1f}s' for name, seconds in summary.items())
+                             + ' after they started')
+        path = self.settings.get('EBAY_FAST_LANE_STATE_PATH')
+        if path and self.newest and not self.errors:
+            save_state(path, self.newest)
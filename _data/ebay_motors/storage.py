@@ -0,0 +1,290 @@
+"""
+Storage backends for the export pipelines.
+
+A backend owns the database connections and the SQL dialect, so the pipelines
+only deal in items:
+
+- `flush()` runs a function over a batch of items with a cursor, in one transaction.
+- `lookup()` fetches stored values for a batch of items by their unique key.
+- `upsert()` inserts an item or updates its stored row, and tells which it did.
+- `insert_ignore()` stores a row unless one with the same key is already stored.
+- `missing_indexes()` checks the tables have the indexes the pipelines rely on.
+
+`MySQLBackend` is the production backend.  `SQLiteBackend` stores to a local
+SQLite file in WAL mode, so the whole write path runs on one machine for local
+runs and benchmarks.
+"""
+import abc
+import logging
+import sqlite3
+import typing
+
+from twisted.enterprise import adbapi
+from twisted.internet import defer
+
+from ebay_motors import schema
+from ebay_motors import utils
+
+# Key values of a stored row, as strings so they match however the driver returns them
+Key = typing.Tuple[str, ...]
+
+
+class StorageBackend(abc.ABC):
+    """Base for the storage backends, holding an `adbapi.ConnectionPool`."""
+
+    # DB-API parameter placeholder of the driver
+    placeholder = '%s'
+    # Most keys in a single lookup query
+    lookup_batch_size = 500
+
+    def __init__(self, dbpool: typing.Optional[adbapi.ConnectionPool]):
+        self.dbpool = dbpool
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @classmethod
+    @abc.abstractmethod
+    def from_settings(cls, settings):
+        raise NotImplementedError
+
+    def create_tables(self, tables: typing.Dict[str, typing.Tuple[list, list]]) -> typing.Optional[defer.Deferred]:
+        """Create the `tables`, {name: (columns, unique columns)}, if the backend manages its schema."""
+        return None
+
+    def missing_indexes(self, indexes: typing.Dict[str, typing.List[schema.Index]]) -> typing.Optional[defer.Deferred]:
+        """Find which of the `indexes`, {table: indexes}, the tables lack, if the backend can tell."""
+        return None
+
+    def close(self):
+        if self.dbpool is not None:
+            self.dbpool.close()
+
+    def flush(self, func, items: list, *args) -> defer.Deferred:
+        """Run ``func(cursor, items, *args)`` in a single transaction."""
+        return self.dbpool.runInteraction(func, items, *args)
+
+    @staticmethod
+    def key(values) -> Key:
+        return tuple(str(v) for v in values)
+
+    def lookup_query(self, table: str, key_fields: typing.Sequence[str], fields: typing.Sequence[str],
+                     keys: typing.Sequence[tuple]) -> typing.Tuple[str, tuple]:
+        """Build the query for `fields` of the rows with the unique `keys`, selected after the key fields."""
+        match = '(' + ' AND '.join(f'{name} = {self.placeholder}' for name in key_fields) + ')'
+        query = f'''
+            SELECT {', '.join(list(key_fields) + list(fields))}
+            FROM {table}
+            WHERE {' OR '.join([match] * len(keys))};
+        '''
+        return query, tuple(value for key in keys for value in key)
+
+    def stored_rows(self, rows: typing.Iterable[tuple], key_fields: typing.Sequence[str]) -> typing.Dict[Key, tuple]:
+        """Map the rows returned by a `lookup_query()` by their key."""
+        n = len(key_fields)
+        return {self.key(row[:n]): tuple(row[n:]) for row in rows}
+
+    def lookup(self, cur, table: str, key_fields: typing.Sequence[str], fields: typing.Sequence[str],
+               keys: typing.Iterable[tuple]) -> typing.Dict[Key, tuple]:
+        """Fetch `fields` of the stored rows with the unique `keys`, as {`key()`: values}."""
+        stored = {}
+        for batch in utils.batches(list(set(keys)), self.lookup_batch_size):
+            cur.execute(*self.lookup_query(table, key_fields, fields, batch))
+            stored.update(self.stored_rows(cur.fetchall(), key_fields))
+        return stored
+
+    @abc.abstractmethod
+    def upsert_query(self, table: str, item, names: typing.Sequence[str],
+                     key_fields: typing.Sequence[str]) -> typing.Tuple[str, tuple]:
+        """Build the parameterized insert/update query for the `names` fields of `item`.
+
+        Fields marked ``exclude_insert`` are only written on update and those
+        marked ``exclude_update`` only on insert.
+        """
+        raise NotImplementedError
+
+    def upsert(self, cur, table: str, item, names: typing.Sequence[str],
+               key_fields: typing.Sequence[str]) -> typing.Optional[str]:
+        return self.execute_upsert(cur, *self.upsert_query(table, item, names, key_fields))
+
+    def execute_upsert(self, cur, query: str, params: tuple) -> typing.Optional[str]:
+        """Run an `upsert_query()`.  Returns 'inserted', 'updated', 'unchanged' or None if it can't tell."""
+        cur.execute(query, params)
+        return None
+
+    @abc.abstractmethod
+    def insert_ignore_query(self, table: str, row: dict) -> typing.Tuple[str, tuple]:
+        raise NotImplementedError
+
+    def insert_ignore(self, cur, table: str, row: dict):
+        cur.execute(*self.insert_ignore_query(table, row))
+
+    def is_deadlock(self, failure) -> bool:
+        """Check whether the failure is a transient lock conflict worth retrying."""
+        return False
+
+
+class MySQLBackend(StorageBackend):
+    """MySQL through `MySQLdb` in the `adbapi` thread pool.
+
+    The upsert relies on a unique index on the key fields, (source, source_id)
+    for the listings.
+    """
+
+    # Affected rows of INSERT ... ON DUPLICATE KEY UPDATE
+    OUTCOMES = {0: 'unchanged', 1: 'inserted', 2: 'updated'}
+
+    @classmethod
+    def from_settings(cls, settings):
+        # Imported here, so the other backends don't need the MySQL driver, and a missing one fails here
+        import MySQLdb  # noqa: F401
+        dbargs = dict(
+            cls.connection_args(settings),
+            # Keep a connection available for every write lane
+            cp_max=max(5, settings.getint('MYSQL_WRITE_LANES', 0)),
+        )
+        return cls(adbapi.ConnectionPool('MySQLdb', **dbargs))
+
+    @staticmethod
+    def connection_args(settings) -> dict:
+        """Arguments of `MySQLdb.connect()` for the configured database."""
+        return dict(
+            host=settings['MYSQL_HOST'],
+            db=settings['MYSQL_DBNAME'],
+            user=settings['MYSQL_USER'],
+            passwd=settings['MYSQL_PASSWD'],
+            port=settings['MYSQL_PORT'],
+            charset='utf8',
+            use_unicode=True,
+        )
+
+    def missing_indexes(self, indexes):
+        if self.dbpool is None:
+            return None
+        return self.dbpool.runInteraction(self._missing_indexes, indexes)
+
+    def _missing_indexes(self, cur, indexes):
+        missing = {}
+        for table, required in indexes.items():
+            cur.execute(*schema.indexes_query(table))
+            missing[table] = schema.missing_indexes(required, schema.existing_indexes(cur.fetchall()))
+        return missing
+
+    def upsert_query(self, table, item, names, key_fields):
+        # Adapt this [insert...on duplicate key update] approach from the following
+        # https://chartio.com/resources/tutorials/how-to-insert-if-row-does-not-exist-upsert-in-mysql/
+        # http://www.mysqltutorial.org/mysql-insert-or-update-on-duplicate-key-update/
+        # https://pynative.com/python-mysql-execute-parameterized-query-using-prepared-statement/
+        # In order to take advantage of this approach, there needs to be not only a composite
+        # index on (source, source_id) but also a unique index on the same combination.
+
+        # Loop through field specs to generate the parameterized query
+        sets = ', '.join([f'@{name} = %s' for name in names])
+        params = tuple(item[name] for name in names)
+        insert_fields = ', '.join([name for name in names if not item.fields[name].get('exclude_insert', False)])
+        insert_values = ', '.join([f'@{name}' for name in names if not item.fields[name].get('exclude_insert', False)])
+        updates = ', '.join([f'{name} = @{name}'
+                             for name in names if not item.fields[name].get('exclude_update', False)])
+        query = f'''
+            SET {sets};
+            INSERT INTO {table}
+                ({insert_fields})
+            VALUES
+                ({insert_values})
+            ON DUPLICATE KEY UPDATE
+                {updates};
+        '''
+        return query, params
+
+    def execute_upsert(self, cur, query, params):
+        cur.execute(query, params)
+        # The affected rows are those of the INSERT, after the SET statement
+        while cur.nextset():
+            pass
+        return self.OUTCOMES.get(cur.rowcount)
+
+    def insert_ignore_query(self, table, row):
+        return f'''
+            INSERT IGNORE INTO {table} ({', '.join(row)}) VALUES ({', '.join(['%s'] * len(row))});
+        ''', tuple(row.values())
+
+    def is_deadlock(self, failure) -> bool:
+        """Check whether the failure is a MySQL deadlock (error 1213)."""
+        import MySQLdb._exceptions
+        return failure.type is MySQLdb._exceptions.OperationalError and failure.value.args[0] == 1213
+
+
+class SQLiteBackend(StorageBackend):
+    """A local SQLite database in WAL mode, at ``SQLITE_PATH``.
+
+    SQLite has a single writer, so the pool has one connection.  WAL mode lets
+    other processes read the database while the crawl writes to it.  The tables
+    are created on open if they don't exist.
+    """
+
+    placeholder = '?'
+
+    @classmethod
+    def from_settings(cls, settings):
+        dbpool = adbapi.ConnectionPool(
+            'sqlite3',
+            str(settings['SQLITE_PATH']),
+            timeout=settings.getfloat('SQLITE_BUSY_TIMEOUT', 5.0),
+            check_same_thread=False,
+            cp_min=1,
+            cp_max=1,
+            cp_openfun=cls._configure,
+        )
+        return cls(dbpool)
+
+    @staticmethod
+    def _configure(conn):
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Durable at checkpoints rather than every commit, the usual pairing with WAL
+        conn.execute('PRAGMA synchronous=NORMAL')
+
+    def create_tables(self, tables):
+        return self.dbpool.runInteraction(self._create_tables, tables)
+
+    def _create_tables(self, cur, tables):
+        for table, (columns, unique) in tables.items():
+            cur.execute(f'CREATE TABLE IF NOT EXISTS {table} ({", ".join(columns)}, UNIQUE ({", ".join(unique)}))')
+
+    def upsert_query(self, table, item, names, key_fields):
+        inserted = [name for name in names if not item.fields[name].get('exclude_insert', False)]
+        params = [item[name] for name in inserted]
+        updates, changes, change_params = [], [], []
+        for name in names:
+            if item.fields[name].get('exclude_update', False):
+                continue
+            if name in inserted:
+                updates.append(f'{name} = excluded.{name}')
+                changes.append(f'{name} IS NOT excluded.{name}')
+            else:
+                # Not part of the insert, so bind it for the update
+                updates.append(f'{name} = ?')
+                params.append(item[name])
+                changes.append(f'{name} IS NOT ?')
+                change_params.append(item[name])
+        # Like MySQL, a row with nothing to change isn't written
+        action = f'UPDATE SET {", ".join(updates)} WHERE {" OR ".join(changes)}' if updates else 'NOTHING'
+        query = f'''
+            INSERT INTO {table}
+                ({', '.join(inserted)})
+            VALUES
+                ({', '.join(['?'] * len(inserted))})
+            ON CONFLICT ({', '.join(key_fields)}) DO {action};
+        '''
+        return query, tuple(params + change_params)
+
+    def execute_upsert(self, cur, query, params):
+        cur.execute(query, params)
+        # One row changed whether it was inserted or updated
+        return 'unchanged' if cur.rowcount == 0 else None
+
+    def insert_ignore_query(self, table, row):
+        return f'''
+            INSERT OR IGNORE INTO {table} ({', '.join(row)}) VALUES ({', '.join(['?'] * len(row))});
+        ''', tuple(row.values())
+
+    def is_deadlock(self, failure) -> bool:
+        """Check whether the database stayed locked by another writer past the busy timeout."""
+        return failure.check(sqlite3.OperationalError) is not None and 'locked' in str(failure.value)
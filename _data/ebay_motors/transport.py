@@ -0,0 +1,97 @@
+"""
+Transport profile for the eBay endpoints.
+
+Connections are kept alive and pooled per host, and the stats show what
+actually went over the wire:
+
+- ``transport/wire_bytes/<host>`` and ``transport/decoded_bytes/<host>``,
+  the response bodies as received and after HttpCompressionMiddleware.
+- ``transport/responses/compressed/<host>`` and ``.../uncompressed/<host>``.
+- ``transport/connections/new/<host>`` and ``.../reused/<host>``.
+"""
+import logging
+
+from scrapy import signals
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.web.client import HTTPConnectionPool
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    """An HTTPConnectionPool that counts new and reused connections per host."""
+
+    def __init__(self, reactor, persistent=True, stats=None):
+        super().__init__(reactor, persistent=persistent)
+        self.stats = stats
+        self._opened = False
+
+    def getConnection(self, key, endpoint):
+        self._opened = False
+        d = super().getConnection(key, endpoint)
+        self._count('new' if self._opened else 'reused', key)
+        return d
+
+    def _newConnection(self, key, endpoint):
+        self._opened = True
+        return super()._newConnection(key, endpoint)
+
+    def _count(self, kind, key):
+        if self.stats is not None:
+            host = key[1].decode() if isinstance(key[1], bytes) else key[1]
+            self.stats.inc_value(f'transport/connections/{kind}/{host}')
+
+
+class TransportProfileDownloadHandler(HTTP11DownloadHandler):
+    """HTTP(S) download handler with a configurable, instrumented connection pool.
+
+    ``EBAY_MAX_CONNECTIONS_PER_HOST`` caps the idle connections kept per host
+    (default: CONCURRENT_REQUESTS_PER_DOMAIN) and ``EBAY_CONNECTION_IDLE_TIMEOUT``
+    is how long, in seconds, they are kept.
+    """
+
+    def __init__(self, settings, crawler=None):
+        super().__init__(settings, crawler)
+        from twisted.internet import reactor
+
+        self._pool = CountingHTTPConnectionPool(reactor, persistent=True, stats=crawler.stats if crawler else None)
+        self._pool.maxPersistentPerHost = (settings.getint('EBAY_MAX_CONNECTIONS_PER_HOST')
+                                           or settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN'))
+        self._pool.cachedConnectionTimeout = settings.getint('EBAY_CONNECTION_IDLE_TIMEOUT', 240)
+        self._pool._factory.noisy = False
+
+
+class TransportStats(object):
+    """Record response bytes on the wire versus decoded, per host."""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler.stats)
+        # `response_downloaded` has the body as received, `response_received` has it
+        # after the downloader middlewares have decompressed it
+        crawler.signals.connect(ext.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def response_downloaded(self, response, request, spider):
+        host = urlparse_cached(response).hostname
+        self.stats.inc_value(f'transport/wire_bytes/{host}', len(response.body))
+        compressed = 'compressed' if response.headers.get('Content-Encoding') else 'uncompressed'
+        self.stats.inc_value(f'transport/responses/{compressed}/{host}')
+
+    def response_received(self, response, request, spider):
+        host = urlparse_cached(response).hostname
+        self.stats.inc_value(f'transport/decoded_bytes/{host}', len(response.body))
+
+    def spider_closed(self, spider):
+        stats = self.stats.get_stats()
+        for key in sorted(k for k in stats if k.startswith('transport/wire_bytes/')):
+            host = key.rsplit('/', 1)[1]
+            wire, decoded = stats[key], stats.get(f'transport/decoded_bytes/{host}', 0)
+            self.logger.info(f'{host}: {wire} bytes on the wire, {decoded} decoded, '
+                             f'{stats.get(f"transport/connections/new/{host}", 0)} connections opened, '
+                             f'{stats.get(f"transport/connections/reused/{host}", 0)} reused')
@@ -2,6 +2,14 @@
 General purpose utility functions to ease processing.
 """
 import arrow
+import json
+import struct
+import typing
+import zlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 def batches(l: list, n: int):
@@ -25,3 +33,24 @@ def list_to_dict(l, key: str) -> dict:
     if not isinstance(l, list):
         return l
     return {i.get(key): i for i in l}
+
+
+def loads(data: typing.Union[bytes, str]):
+    """Decode JSON straight from the response bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def compress(data: bytes, level: int = 6) -> bytes:
+    """zlib compress `data` in the format of MySQL's COMPRESS(), so UNCOMPRESS() can read it."""
+    if not data:
+        return b''
+    return struct.pack('<I', len(data)) + zlib.compress(data, level)
+
+
+def decompress(data: bytes) -> bytes:
+    """Reverse `compress()`."""
+    if not data:
+        return b''
+    return zlib.decompress(data[4:])
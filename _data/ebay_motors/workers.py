@@ -0,0 +1,114 @@
+"""
+Parse and cleanse detail responses in a pool of worker processes.
+
+With ``EBAY_CLEANSER_MODE = 'process'`` the spider hands each raw detail
+response body and its search summaries to `WorkerPool`, and a worker process
+extracts the details, builds the listings and cleanses them, off the reactor
+thread.  The cleansed listings come back as plain dicts.
+"""
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+import types
+import typing
+
+from scrapy.settings import Settings
+# In scrapy.utils.reactor since Scrapy 2.0, the version pinned in requirements.txt
+from scrapy.utils.reactor import is_asyncio_reactor_installed
+from twisted.internet import defer
+
+from ebay_motors import parsing
+from ebay_motors import pipelines
+from ebay_motors.requests import EbayRequest
+
+
+class DetailResult(typing.NamedTuple):
+    ack: typing.Optional[str]
+    error: typing.Optional[str]
+    listings: typing.List[dict]
+    missing: typing.List[str]
+
+
+# The cleanser of a worker process, created on first use
+_cleanser = None
+# Cleansing outside of the pipelines, one item at a time or vectorized
+_spider = types.SimpleNamespace(settings=Settings({'EBAY_CLEANSER_MODE': 'item'}))
+
+
+def parse_and_cleanse(body: bytes, charset: str, summaries: typing.List[dict], config: dict) -> DetailResult:
+    """Extract the details from a detail response `body`, and build and cleanse the listings.
+
+    Runs in a worker process.  `config` carries the settings it needs and the
+    ``current_run_date`` of the crawl, which the worker process doesn't share.
+    """
+    global _cleanser
+    if _cleanser is None:
+        _cleanser = pipelines.EbayListingCleanserPipeline()
+    EbayRequest.current_run_date = config['current_run_date']
+
+    details = parsing.details_response(body, config['encoding'], config['mock'], charset)
+    if details.ack in ['Failure', 'PartialFailure']:
+        return DetailResult(details.ack, details.error, [], [])
+    items, missing = parsing.listings(summaries, details.details, config['include_description'])
+    if pipelines.np is not None:
+        items = _cleanser.process_batch(items, _spider)
+    else:
+        items = [_cleanser.process_item(item, _spider) for item in items]
+    return DetailResult(details.ack, details.error, [dict(item) for item in items], missing)
+
+
+def mp_context():
+    """Start the worker processes fresh rather than forking the crawler.
+
+    A fork would copy the reactor, its threads and the open database
+    connections of the crawler into the workers.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class WorkerPool(object):
+    """A `ProcessPoolExecutor` whose results are Deferreds.
+
+    At most `max_in_flight` calls are handed to the processes at once, the rest
+    wait their turn on the reactor.
+    """
+
+    def __init__(self, processes: int = 0, max_in_flight: int = 0):
+        self.processes = processes or os.cpu_count() or 1
+        self.executor = concurrent.futures.ProcessPoolExecutor(self.processes, mp_context=mp_context())
+        self.semaphore = defer.DeferredSemaphore(max_in_flight or 2 * self.processes)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.getint('EBAY_WORKER_PROCESSES', 0), settings.getint('EBAY_WORKER_MAX_IN_FLIGHT', 0))
+
+    def submit(self, fn, *args) -> defer.Deferred:
+        """Run ``fn(*args)`` in a worker process once there is room."""
+        return self.semaphore.run(self._submit, fn, *args)
+
+    def _submit(self, fn, *args) -> defer.Deferred:
+        from twisted.internet import reactor
+
+        d = defer.Deferred()
+
+        def done(future):
+            if future.exception() is not None:
+                d.errback(future.exception())
+            else:
+                d.callback(future.result())
+        future = self.executor.submit(fn, *args)
+        # Futures complete on the executor's management thread
+        future.add_done_callback(lambda f: reactor.callFromThread(done, f))
+        return d
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+def awaitable(d: defer.Deferred):
+    """Make `d` awaitable from a coroutine callback, with either reactor."""
+    if is_asyncio_reactor_installed():
+        return d.asFuture(asyncio.get_event_loop())
+    return d
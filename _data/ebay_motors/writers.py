@@ -0,0 +1,158 @@
+"""
+Write scheduling for the database pipelines.
+"""
+import collections
+import logging
+import random
+import time
+import typing
+
+from twisted.internet import defer, task
+from twisted.python.failure import Failure
+
+
+class LaneWriteScheduler(object):
+    """Serialize database writes onto a fixed number of lanes.
+
+    Each row is hashed by its key onto one lane and every lane writes one
+    batch at a time, so concurrent transactions never contend for the same
+    key.  Rows that queue up while a lane is busy go out together in its next
+    batch, sorted by key so neighbouring index gaps are always locked in the
+    same order.  Deadlocked batches are retried with bounded exponential backoff.
+    """
+
+    def __init__(self,
+                 write_batch: typing.Callable[[list], defer.Deferred],
+                 is_deadlock: typing.Callable[[Failure], bool],
+                 lanes: int = 4,
+                 batch_size: int = 50,
+                 retries: int = 5,
+                 backoff: float = 0.1,
+                 max_backoff: float = 5.0):
+        self.write_batch = write_batch
+        self.is_deadlock = is_deadlock
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queues = [collections.deque() for _ in range(lanes)]
+        self.busy = [False] * lanes
+        self.deadlocks = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def submit(self, key, row) -> defer.Deferred:
+        """Queue `row` on the lane for `key`.  Fires with `row` once it is written."""
+        d = defer.Deferred()
+        lane = hash(key) % len(self.queues)
+        self.queues[lane].append((key, row, d))
+        if not self.busy[lane]:
+            self._drain(lane)
+        return d
+
+    @property
+    def pending(self) -> int:
+        """Number of rows queued but not yet handed to the database."""
+        return sum(len(q) for q in self.queues)
+
+    @defer.inlineCallbacks
+    def _drain(self, lane: int):
+        self.busy[lane] = True
+        queue = self.queues[lane]
+        try:
+            while queue:
+                batch = [queue.popleft() for _ in range(min(self.batch_size, len(queue)))]
+                batch.sort(key=lambda entry: (entry[0] is None, entry[0] if entry[0] is not None else 0))
+                yield self._write_entries(batch)
+        finally:
+            self.busy[lane] = False
+
+    @defer.inlineCallbacks
+    def _write_entries(self, batch: list):
+        """Write a sorted batch and fire the deferred of each entry."""
+        try:
+            yield self._write_with_retry([row for _, row, _ in batch])
+        except Exception:
+            failure = Failure()
+            if len(batch) > 1 and not self.is_deadlock(failure):
+                # Write the rows one at a time so one bad row doesn't fail its neighbours
+                for entry in batch:
+                    yield self._write_entries([entry])
+                return
+            for _, _, d in batch:
+                d.errback(failure)
+        else:
+            for _, row, d in batch:
+                d.callback(row)
+
+    @defer.inlineCallbacks
+    def _write_with_retry(self, rows: list):
+        for attempt in range(self.retries + 1):
+            try:
+                result = yield self.write_batch(rows)
+                return result
+            except Exception:
+                failure = Failure()
+                if attempt == self.retries or not self.is_deadlock(failure):
+                    failure.raiseException()
+                self.deadlocks += 1
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1)
+                self.logger.debug('Got a database deadlock...retrying %d rows in %.2fs.', len(rows), delay)
+                from twisted.internet import reactor
+                yield task.deferLater(reactor, delay, lambda: None)
+
+
+class Backpressure(object):
+    """Pause the crawl while too many items wait on the database.
+
+    Counts the items handed to a database pipeline and not yet written.  Once
+    they reach `high_water` the engine stops scheduling requests, so no new
+    responses are downloaded and parsed into items, and once the writes bring
+    them down to `low_water` it resumes.  The pauses are counted in the
+    ``backpressure/*`` stats.
+    """
+
+    def __init__(self, engine, stats, high_water: int, low_water: int,
+                 queued: typing.Callable[[], int] = lambda: 0):
+        self.engine = engine
+        self.stats = stats
+        self.high_water = high_water
+        self.low_water = low_water
+        # Items waiting for a write lane, of those in flight
+        self.queued = queued
+        self.in_flight = 0
+        self.paused_at = None
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def started(self):
+        """An item entered the pipeline."""
+        self.in_flight += 1
+        self.stats.max_value('backpressure/max_in_flight', self.in_flight)
+        if self.paused_at is None and self.in_flight >= self.high_water:
+            self._pause()
+
+    def finished(self, result=None):
+        """An item left the pipeline, written or not.  Passes `result` through, to use as a callback."""
+        self.in_flight -= 1
+        if self.paused_at is not None and self.in_flight <= self.low_water:
+            self._resume()
+        return result
+
+    def close(self):
+        if self.paused_at is not None:
+            self._resume()
+
+    def _pause(self):
+        self.paused_at = time.monotonic()
+        self.engine.pause()
+        self.stats.inc_value('backpressure/pauses')
+        self.logger.info('Pausing the crawl with %d items waiting on the database (%d queued for a write lane)',
+                         self.in_flight, self.queued())
+
+    def _resume(self):
+        paused = time.monotonic() - self.paused_at
+        self.paused_at = None
+        self.engine.unpause()
+        self.stats.set_value('backpressure/paused_seconds',
+                             round(self.stats.get_value('backpressure/paused_seconds', 0) + paused, 3))
+        self.logger.info('Resuming the crawl after %.1fs with %d items waiting on the database',
+                         paused, self.in_flight)
@@ -6,8 +6,19 @@ import logging.handlers
 import os
 import pathlib
 import sys
+import types
+from scrapy import signals
 from scrapy.crawler import CrawlerProcess
+from scrapy.utils.log import LogCounterHandler
 from scrapy.utils.project import get_project_settings
+from twisted.internet import task
+
+from ebay_motors import archive
+from ebay_motors import ledger
+from ebay_motors import logs
+from ebay_motors import runlock
+from ebay_motors import schema
+from ebay_motors import snapshot
 
 __author__ = '@james-carpenter'
 __version__ = '0.1.0'
@@ -47,6 +58,11 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument('--configfile',
                         type=lambda x: pathlib.Path(x).absolute(),
                         help='Path to config file with overrides for settings')
+    parser.add_argument('--time-budget',
+                        type=float,
+                        help=('Minutes after which to stop issuing requests, finish those in flight \n'
+                              'and leave the rest to the next run. \n'
+                              'Overrides the EBAY_TIME_BUDGET setting.'))
     args = parser.parse_args()
     return args
 
@@ -73,6 +89,8 @@ def init_settings(args) -> dict:
         settings['FEED_FORMAT'] = args.output_format
     if args.loglevel:
         settings['LOG_LEVEL'] = args.loglevel
+    if args.time_budget is not None:
+        settings['EBAY_TIME_BUDGET'] = args.time_budget
     settings['LOG_FILE'] = None if args.logfile == '-' else str(args.logfile).format(spider=args.spider,
                                                                                      date=arrow.utcnow().format('MM-DD-YY'),
                                                                                      time=arrow.utcnow().format('HH-mm-ss'))
@@ -99,11 +117,267 @@ def setup_logging(settings: dict):
         log.setLevel(getattr(logging, settings['LOG_LEVEL']))
 
 
+def report(argv: list) -> int:
+    """Compare recent runs in the run ledger with a rolling baseline.  Exits 1 on regressions."""
+    project_settings = get_project_settings()
+    parser = argparse.ArgumentParser(
+        prog='run.py report',
+        formatter_class=argparse.RawTextHelpFormatter,
+        description='Compare recent runs in the run ledger (RUN_LEDGER_PATH) with a rolling baseline \n'
+                    'and flag throughput, latency and memory regressions.',
+    )
+    parser.add_argument('--spider', default='ebay', help='Name of the spider whose runs to compare. (default: ebay)')
+    parser.add_argument('--ledger',
+                        type=lambda x: pathlib.Path(x).absolute(),
+                        default=project_settings.get('RUN_LEDGER_PATH'),
+                        help='Path to the run ledger. (default: RUN_LEDGER_PATH)')
+    parser.add_argument('--recent', type=int, default=1, help='Number of recent runs to check. (default: 1)')
+    parser.add_argument('--baseline', type=int, default=10,
+                        help='Number of earlier finished runs whose median is the baseline. (default: 10)')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Fraction by which a metric must be worse than the baseline to be flagged. (default: 0.25)')
+    args = parser.parse_args(argv)
+    if not args.ledger or not os.path.isfile(args.ledger):
+        print(f'No run ledger at {args.ledger}', file=sys.stderr)
+        return 1
+    text, regressions = ledger.report(args.ledger, spider=args.spider, recent=args.recent,
+                                      baseline=args.baseline, threshold=args.threshold)
+    print(text)
+    if regressions:
+        print(f'\n{regressions} regression(s) beyond {args.threshold:.0%} of the baseline.')
+    return 1 if regressions else 0
+
+
+def create_schema(argv: list) -> int:
+    """Create or migrate the tables of the ebay export pipeline and their indexes."""
+    parser = argparse.ArgumentParser(
+        prog='run.py schema',
+        formatter_class=argparse.RawTextHelpFormatter,
+        description='Create MYSQL_EBAY_TABLE (and MYSQL_DESCRIPTION_TABLE) from the item fields, \n'
+                    'or add their missing columns and the indexes the export pipeline relies on.',
+    )
+    parser.add_argument('--configfile',
+                        type=lambda x: pathlib.Path(x).absolute(),
+                        help='Path to config file with overrides for settings')
+    parser.add_argument('--dry-run', action='store_true', help='Print the statements without running them.')
+    parser.add_argument('--backfill-descriptions', action='store_true',
+                        help='Also move the descriptions stored in MYSQL_EBAY_TABLE to MYSQL_DESCRIPTION_TABLE.')
+    args = parser.parse_args(argv)
+    settings = get_project_settings()
+    if args.configfile:
+        try:
+            with open(args.configfile) as f:
+                settings.setdict(json.load(f), priority='cmdline')
+        except Exception as e:
+            print(f'Failed to load config from {args.configfile}: {e}', file=sys.stderr)
+            return 1
+    if args.backfill_descriptions and not settings.get('MYSQL_DESCRIPTION_TABLE'):
+        print('MYSQL_DESCRIPTION_TABLE is not set, there is nowhere to move the descriptions to.', file=sys.stderr)
+        return 1
+
+    # Imported here so the crawl installs the reactor of its settings before anything imports one
+    import MySQLdb
+    from ebay_motors.pipelines import EbayMySQLExportPipeline
+    from ebay_motors.storage import MySQLBackend
+
+    pipeline = EbayMySQLExportPipeline(MySQLBackend(None))
+    spider = types.SimpleNamespace(settings=settings)
+    try:
+        conn = MySQLdb.connect(**MySQLBackend.connection_args(settings))
+    except MySQLdb.Error as e:
+        print(f'Failed to connect to the database: {e}', file=sys.stderr)
+        return 1
+    try:
+        cur = conn.cursor()
+        statements = schema.migration(cur, schema.definitions(pipeline, spider))
+        if not statements:
+            print('The tables and indexes are up to date.')
+        if args.backfill_descriptions:
+            statements += schema.description_backfill(settings['MYSQL_EBAY_TABLE'],
+                                                      settings['MYSQL_DESCRIPTION_TABLE'])
+        for statement in statements:
+            print(f'{statement};')
+            if not args.dry_run:
+                cur.execute(statement)
+        conn.commit()
+    except MySQLdb.Error as e:
+        # e.g. duplicate (source, source_id) rows that keep the unique index from being added
+        print(f'Failed to migrate the schema: {e}', file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+def query_snapshot(argv: list) -> int:
+    """Query the listing snapshot, without touching MySQL."""
+    project_settings = get_project_settings()
+    parser = argparse.ArgumentParser(
+        prog='run.py snapshot',
+        formatter_class=argparse.RawTextHelpFormatter,
+        description='Find listings in the memory-mapped listing snapshot (SNAPSHOT_PATH). \n'
+                    'e.g. run.py snapshot --make=Ford --model=Expedition --year=2016 --max-price=20000',
+    )
+    parser.add_argument('--snapshot',
+                        type=lambda x: pathlib.Path(x).absolute(),
+                        default=project_settings.get('SNAPSHOT_PATH'),
+                        help='Path to the snapshot. (default: SNAPSHOT_PATH)')
+    for name in snapshot.CATEGORICAL:
+        parser.add_argument(f'--{name.replace("_", "-")}', dest=name, action='append',
+                            help=f'Listings with this {name} (case insensitive), repeat for any of several.')
+    for name in snapshot.NUMERIC:
+        if name in ('last_seen', 'described'):
+            continue
+        parser.add_argument(f'--{name.replace("_", "-")}', dest=name, type=int, help=f'Listings with this {name}.')
+        parser.add_argument(f'--min-{name.replace("_", "-")}', type=int)
+        parser.add_argument(f'--max-{name.replace("_", "-")}', type=int)
+    parser.add_argument('--seen-within', type=float,
+                        help='Only listings seen by a run in the last SEEN_WITHIN days, i.e. still active.')
+    parser.add_argument('--sort', default='price', choices=list(snapshot.COLUMNS), help='Sort column. (default: price)')
+    parser.add_argument('--limit', type=int, default=100, help='Most listings to print, 0 for all. (default: 100)')
+    parser.add_argument('--count', action='store_true', help='Only print the number of matching listings.')
+    args = parser.parse_args(argv)
+    if not args.snapshot or not os.path.isfile(args.snapshot):
+        print(f'No listing snapshot at {args.snapshot}', file=sys.stderr)
+        return 1
+
+    filters = {}
+    for name in snapshot.CATEGORICAL:
+        if getattr(args, name):
+            filters[name] = getattr(args, name)
+    for name in snapshot.NUMERIC:
+        if getattr(args, name, None) is not None:
+            filters[name] = getattr(args, name)
+        elif getattr(args, f'min_{name}', None) is not None or getattr(args, f'max_{name}', None) is not None:
+            filters[name] = (getattr(args, f'min_{name}'), getattr(args, f'max_{name}'))
+    if args.seen_within is not None:
+        filters['last_seen'] = (int(arrow.utcnow().shift(days=-args.seen_within).float_timestamp), None)
+
+    with snapshot.Snapshot(args.snapshot) as listings:
+        rows = [listings.row(i) for i in listings.query(**filters)]
+    if args.count:
+        print(len(rows))
+        return 0
+    # Missing values last
+    rows.sort(key=lambda row: (row[args.sort] is None, row[args.sort] or 0))
+    for row in rows[:args.limit or None]:
+        print(json.dumps(row))
+    return 0
+
+
+def reprocess(argv: list) -> int:
+    """Rebuild, cleanse and store the listings of archived detail responses, without calling the API."""
+    project_settings = get_project_settings()
+    parser = argparse.ArgumentParser(
+        prog='run.py reprocess',
+        formatter_class=argparse.RawTextHelpFormatter,
+        description='Run the archived detail responses (ARCHIVE_DIR) through the current parsing and \n'
+                    'cleansing rules and store each listing from its latest response, without calling the API. \n'
+                    'Reports the throughput, so it doubles as a replay benchmark.',
+    )
+    parser.add_argument('--configfile',
+                        type=lambda x: pathlib.Path(x).absolute(),
+                        help='Path to config file with overrides for settings')
+    parser.add_argument('--archive',
+                        type=lambda x: pathlib.Path(x).absolute(),
+                        default=project_settings.get('ARCHIVE_DIR'),
+                        help='Path to the response archive. (default: ARCHIVE_DIR)')
+    parser.add_argument('--run', dest='runs', action='append',
+                        help='Only reprocess this run, e.g. 20201019T081500-ebay, repeat for several. (default: all)')
+    parser.add_argument('--item-id', dest='item_ids', action='append',
+                        help='Only reprocess this listing, repeat for several. (default: all)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Worker processes parsing segments in parallel. (default: one per CPU)')
+    parser.add_argument('--no-store', action='store_true',
+                        help='Parse and cleanse only, without storing the listings.')
+    args = parser.parse_args(argv)
+    settings = project_settings
+    if args.configfile:
+        try:
+            with open(args.configfile) as f:
+                settings.setdict(json.load(f), priority='cmdline')
+        except Exception as e:
+            print(f'Failed to load config from {args.configfile}: {e}', file=sys.stderr)
+            return 1
+    if not args.archive or not os.path.isdir(args.archive):
+        print(f'No response archive at {args.archive}', file=sys.stderr)
+        return 1
+    logging.basicConfig(level=logging.WARNING)
+
+    tasks = list(archive.latest_records(args.archive, args.item_ids, args.runs).items())
+    unindexed = archive.unindexed_records(args.archive, args.runs)
+    if unindexed:
+        print(f'Skipping {sum(len(offsets) for offsets in unindexed.values())} record(s) missing from the archive '
+              f'index in {", ".join(os.path.basename(path) for path in unindexed)}', file=sys.stderr)
+    if not tasks:
+        print('Nothing in the archive to reprocess.', file=sys.stderr)
+        return 1
+
+    def main(reactor):
+        d = archive.reprocess(settings, tasks, args.workers, store=not args.no_store)
+        d.addCallback(summarize)
+        return d
+
+    def summarize(totals):
+        seconds = totals['seconds'] or 1e-9
+        print(f'{totals["records"]} detail responses ({totals["bytes"] / 1e6:.1f} MB) from {totals["segments"]} '
+              f'segment(s) with {totals["processes"]} worker process(es): {totals["listings"]} listings, '
+              f'{totals["errors"]} errors\n'
+              f'  {totals["records"] / seconds:10.1f} responses/s\n'
+              f'  {totals["bytes"] / 1e6 / seconds:10.1f} MB/s\n'
+              f'  {totals["listings"] / seconds:10.1f} listings/s\n'
+              f'  {seconds:10.2f}s overall, {totals["parse_seconds"]:.2f}s parsing in the workers, '
+              f'{totals["store_seconds"]:.2f}s storing')
+        if totals['errors']:
+            raise SystemExit(1)
+    try:
+        task.react(main)
+    except SystemExit as e:
+        return e.code
+    return 0
+
+
+# Subcommands, run as `run.py <command> ...` instead of a spider
+COMMANDS = {
+    'report': report,
+    'schema': create_schema,
+    'snapshot': query_snapshot,
+    'reprocess': reprocess,
+}
+
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        sys.exit(COMMANDS[sys.argv[1]](sys.argv[2:]))
+
     args = parse_args()
     settings = init_settings(args)
+    # Taken before the log is rolled over, which would otherwise roll the log of the run holding the lock
+    lock = None
+    if settings.get('RUN_LOCK_PATH'):
+        lock = runlock.RunLock(str(settings['RUN_LOCK_PATH']).format(spider=args.spider))
+        try:
+            lock.acquire()
+        except runlock.LockedError as e:
+            print(f'Not running {args.spider}, the previous run is still going: {e}', file=sys.stderr)
+            sys.exit(0)
     setup_logging(settings)
 
     process = CrawlerProcess(settings)
     process.crawl(args.spider)
+    listener = None
+    if settings.get('LOG_QUEUE_ENABLED'):
+        # The crawler has installed scrapy's root handler by now, move it and ours to a writer thread.
+        # The log_count stats handler stays put.
+        listener, sampler = logs.start_queue_logging(settings.get('LOG_RATE_LIMIT', 0),
+                                                     settings.get('LOG_RATE_PERIOD', 10.0),
+                                                     keep=(LogCounterHandler,))
+        for crawler in process.crawlers:
+            crawler.signals.connect(sampler.spider_closed, signal=signals.spider_closed)
     process.start()  # the script will block here until the crawling is finished
+    if listener:
+        if sampler.dropped:
+            logging.getLogger(__name__).info(sampler.summary())
+        listener.stop()
+    if lock:
+        lock.release()
@@ -7,13 +7,18 @@ import typing
 import pathlib
 
 
-def load_test_data(call_type: str, test_name: str) -> typing.Union[dict, str]:
-    """Load test data from file named `test_name` in `call_type` folder."""
+def load_test_data(call_type: str, test_name: str, encoding: str = 'XML') -> typing.Union[dict, str]:
+    """Load test data from file named `test_name` in `call_type` folder.
+
+    Details are available in either the `XML` or `JSON` response `encoding`.
+    """
     filename = pathlib.Path(__file__).parent.absolute() / call_type / test_name
     if call_type == 'auth':
         return json.load(open(f'{filename}.json'))
     if call_type == 'search':
         return json.load(open(f'{filename}.json'))
+    elif call_type == 'details' and encoding == 'JSON':
+        return json.load(open(f'{filename}.json'))
     elif call_type == 'details':
         return open(f'{filename}.xml').read()
     else:
@@ -0,0 +1,55 @@
+"""
+The XML and JSON detail responses of the same listings must produce the same items.
+
+Run from the project directory with ``python -m unittest``.
+"""
+import json
+import unittest
+
+from scrapy.http import TextResponse, XmlResponse
+from scrapy.settings import Settings
+
+import tests
+from ebay_motors.pipelines import EbayListingCleanserPipeline
+from ebay_motors.spiders.ebay import EbaySpider
+
+# Fixtures with both an XML and a JSON detail response
+FIXTURES = ('test1', 'test2')
+
+
+def parse(encoding: str, fixture: str) -> list:
+    """The items `EbaySpider.parse_details()` builds from the `encoding` detail response of `fixture`."""
+    spider = EbaySpider()
+    spider.settings = Settings({'EBAY_DETAILS_RESPONSE_ENCODING': encoding})
+    summaries = tests.load_test_data('search', fixture)['findItemsAdvancedResponse'][0]['searchResult'][0]['item']
+    data = tests.load_test_data('details', fixture, encoding)
+    if encoding == 'XML':
+        response = XmlResponse('https://open.api.ebay.com/shopping', body=data.encode('utf-8'), encoding='utf-8')
+    else:
+        response = TextResponse('https://open.api.ebay.com/shopping', body=json.dumps(data).encode('utf-8'),
+                                encoding='utf-8')
+    return list(spider.parse_details(response, items=summaries))
+
+
+class DetailsEncodingTest(unittest.TestCase):
+
+    def test_same_items(self):
+        for fixture in FIXTURES:
+            with self.subTest(fixture=fixture):
+                from_xml, from_json = parse('XML', fixture), parse('JSON', fixture)
+                self.assertTrue(from_xml)
+                self.assertEqual([dict(item) for item in from_xml], [dict(item) for item in from_json])
+
+    def test_same_cleansed_items(self):
+        cleanser = EbayListingCleanserPipeline()
+        spider = EbaySpider()
+        spider.settings = Settings()
+        for fixture in FIXTURES:
+            with self.subTest(fixture=fixture):
+                from_xml, from_json = ([dict(cleanser.process_item(item, spider)) for item in parse(encoding, fixture)]
+                                       for encoding in ('XML', 'JSON'))
+                self.assertEqual(from_xml, from_json)
+
+
+if __name__ == '__main__':
+    unittest.main()